@@ -3,395 +3,770 @@ Custom email backends for Django.
 
 This module provides email backends that work with Railway and other platforms
 that block outbound SMTP connections.
+
+All three talk to the provider's REST API through one ``requests.Session``
+per open connection, so consecutive sends reuse pooled keep-alive connections
+instead of paying a TLS handshake each. Open the connection once around bulk
+work (``with get_connection() as connection:``, as the outbox worker does);
+messages passed to one ``send_messages()`` call are grouped into the
+provider's batch requests where possible, and the requests are sent
+concurrently by up to ``EMAIL_MAX_WORKERS`` threads.
+
+After a send every message carries ``send_latency`` (seconds),
+``provider_message_id`` and ``send_error`` (``None`` on success).
+``send_each()`` returns the per-message outcome for any backend.
 """
 
+import json
 import logging
-from django.core.mail.backends.base import BaseEmailBackend
-from django.core.mail.message import EmailMessage
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+
+from anonplatform import metrics, timing
 
 logger = logging.getLogger(__name__)
 
 
-class SendGridEmailBackend(BaseEmailBackend):
+class EmailProviderError(Exception):
+    """A provider API call failed. ``status`` is None for network errors."""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {message}" if status is None else f"{provider} returned {status}: {message}")
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """Network errors, rate limiting and server errors are worth retrying."""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+def _retry_after(response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _text_body(message) -> Optional[str]:
+    return None if message.content_subtype == "html" else message.body
+
+
+def _html_body(message) -> Optional[str]:
+    if message.content_subtype == "html":
+        return message.body
+    for content, mimetype in getattr(message, "alternatives", None) or []:
+        if mimetype == "text/html":
+            return content
+    return None
+
+
+class ApiEmailBackend(BaseEmailBackend):
     """
-    Email backend using SendGrid API (not SMTP).
-    
-    This works on Railway and other platforms that block SMTP ports.
-    
-    Environment variables required:
-    - SENDGRID_API_KEY: Your SendGrid API key
-    - DJANGO_DEFAULT_FROM_EMAIL: The sender email address (must be verified in SendGrid)
+    Shared plumbing for the HTTP API backends: session pooling, bounded
+    concurrent dispatch, latency reporting and typed errors.
+
+    Subclasses set ``provider`` and implement ``is_configured()``,
+    ``session_setup()`` and ``send_one()``. Providers with a batch API also set
+    ``batch_limit`` and implement ``batch_key()`` and ``send_batch()``;
+    ``send_each()`` then groups compatible messages, chunks them to the
+    provider's limit and maps the result back onto every message. A batch
+    that fails with a retryable error fails every message in it; one the
+    provider rejects (4xx) is resent message by message, so only the messages
+    that cannot be delivered fail for good.
     """
-    
-    def __init__(self, fail_silently=False, **kwargs):
-        super().__init__(fail_silently=fail_silently)
-        self.fail_silently = fail_silently
-        self.api_key = None
-        
-        # Try to import sendgrid
+
+    provider = ""
+    not_configured_message = ""
+
+    def __init__(self, fail_silently=False, timeout=None, max_workers=None, **kwargs):
+        super().__init__(fail_silently=fail_silently, **kwargs)
+        self.timeout = timeout or settings.EMAIL_TIMEOUT
+        self.max_workers = max(1, max_workers or settings.EMAIL_MAX_WORKERS)
+        self.session = None
+        self._executor = None
+        self._lock = threading.RLock()
+
         try:
-            import sendgrid
-            from sendgrid.helpers.mail import Mail, Email, Content
-            self.sendgrid = sendgrid
-            self.Mail = Mail
-            self.Email = Email
-            self.Content = Content
+            import requests
+            self.requests = requests
         except ImportError:
             if not fail_silently:
                 raise ImportError(
-                    "SendGrid package is not installed. "
-                    "Install it with: pip install sendgrid"
+                    "requests package is not installed. "
+                    "Install it with: pip install requests"
+                )
+            self.requests = None
+
+        if not self.is_configured() and not fail_silently:
+            logger.warning("%s Emails will not be sent.", self.not_configured_message)
+
+    # -- provider hooks -------------------------------------------------------
+
+    def is_configured(self) -> bool:
+        raise NotImplementedError
+
+    def session_setup(self, session) -> None:
+        """Attach credentials and default headers to a new session."""
+
+    def send_one(self, message) -> Optional[str]:
+        """Send one message and return the provider's message id."""
+        raise NotImplementedError
+
+    # Messages (or recipients, see batch_weight) per batch request; 1 disables batching
+    batch_limit = 1
+
+    def batch_key(self, message):
+        """Messages with the same non-None key may share one batch request."""
+        return None
+
+    def batch_weight(self, message) -> int:
+        return 1
+
+    def batch_accepts(self, chunk, message) -> bool:
+        """Whether ``message`` can join ``chunk`` (beyond the size limit)."""
+        return True
+
+    def send_batch(self, messages) -> List[Optional[str]]:
+        """Send messages in one request and return their provider ids in order."""
+        raise NotImplementedError
+
+    # -- connection management ------------------------------------------------
+
+    def open(self):
+        with self._lock:
+            if self.session is not None:
+                return False
+            from requests.adapters import HTTPAdapter
+
+            session = self.requests.Session()
+            # One pooled keep-alive connection per dispatch thread
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.session_setup(session)
+            self.session = session
+            if self.max_workers > 1:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"email-{self.provider.lower()}"
                 )
-            self.sendgrid = None
-        
-        # Get API key from environment
-        import os
-        self.api_key = os.environ.get('SENDGRID_API_KEY', '')
-        
-        if not self.api_key and not fail_silently:
-            logger.warning("SENDGRID_API_KEY not set. Emails will not be sent.")
-    
+            return True
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+
+    # -- sending --------------------------------------------------------------
+
+    def post(self, url: str, **kwargs):
+        """POST through the pooled session, raising EmailProviderError unless 2xx."""
+        try:
+            response = self.session.post(url, timeout=self.timeout, **kwargs)
+        except self.requests.RequestException as e:
+            raise EmailProviderError(self.provider, f"{type(e).__name__}: {e}") from e
+        if not 200 <= response.status_code < 300:
+            raise EmailProviderError(
+                self.provider, response.text[:500], status=response.status_code, retry_after=_retry_after(response)
+            )
+        return response
+
+    def _batch_units(self, email_messages) -> List[list]:
+        """Split messages into send units: single messages and batch-sized groups."""
+        units, groups = [], {}
+        for message in email_messages:
+            key = self.batch_key(message) if self.batch_limit > 1 and message.recipients() else None
+            if key is None:
+                units.append([message])
+            else:
+                groups.setdefault(key, []).append(message)
+        for group in groups.values():
+            chunk, weight = [], 0
+            for message in group:
+                w = self.batch_weight(message)
+                if chunk and (weight + w > self.batch_limit or not self.batch_accepts(chunk, message)):
+                    units.append(chunk)
+                    chunk, weight = [], 0
+                chunk.append(message)
+                weight += w
+            units.append(chunk)
+        return units
+
+    def _send_unit(self, unit) -> None:
+        started = time.perf_counter()
+        error, ids = None, [None] * len(unit)
+        try:
+            if not unit[0].recipients():
+                raise EmailProviderError(self.provider, "message has no recipients", status=400)
+            ids = [self.send_one(unit[0])] if len(unit) == 1 else self.send_batch(unit)
+        except Exception as e:
+            error = e
+        latency = time.perf_counter() - started
+        metrics.email_sent(self.provider, latency, error is None)
+        for message, provider_id in zip(unit, ids):
+            message.provider_message_id = provider_id
+            message.send_error = error
+            message.send_latency = latency
+        what = "1 message" if len(unit) == 1 else f"batch of {len(unit)} messages"
+        if error is None:
+            logger.info("Email %s sent via %s in %.0f ms (id %s)", what, self.provider, latency * 1000, ids[0])
+        elif len(unit) > 1 and self._splits_on(error):
+            # One bad address or payload rejects the whole request; send the
+            # messages one by one so only the bad ones fail permanently
+            logger.warning("Email %s rejected by %s (%s); sending one by one", what, self.provider, error)
+            for message in unit:
+                self._send_unit([message])
+        else:
+            logger.error("Error sending email %s via %s after %.0f ms: %s", what, self.provider, latency * 1000, error)
+
+    @staticmethod
+    def _splits_on(error) -> bool:
+        # Retryable errors are retried as a batch, and bad credentials would
+        # fail every message on its own too
+        return isinstance(error, EmailProviderError) and not error.retryable and error.status not in (401, 403)
+
+    def send_each(self, email_messages) -> List[Optional[Exception]]:
+        """Send every message and return its error, or None if it was accepted."""
+        email_messages = list(email_messages)
+        if not email_messages:
+            return []
+        if not self.requests or not self.is_configured():
+            error = ValueError(self.not_configured_message)
+            for message in email_messages:
+                message.send_error = error
+            return [error] * len(email_messages)
+
+        units = self._batch_units(email_messages)
+        new_conn_created = self.open()
+        try:
+            if self._executor is not None and len(units) > 1:
+                list(self._executor.map(self._send_unit, units))
+            else:
+                for unit in units:
+                    self._send_unit(unit)
+        finally:
+            if new_conn_created:
+                self.close()
+        return [message.send_error for message in email_messages]
+
     def send_messages(self, email_messages):
         """
         Send one or more EmailMessage objects and return the number of emails sent.
         """
-        if not self.sendgrid or not self.api_key:
-            if not self.fail_silently:
-                raise ValueError("SendGrid not configured. Set SENDGRID_API_KEY environment variable.")
-            return 0
-        
         if not email_messages:
             return 0
-        
-        num_sent = 0
-        sg = self.sendgrid.SendGridAPIClient(api_key=self.api_key)
-        
-        for message in email_messages:
-            if not isinstance(message, EmailMessage):
-                continue
-            
-            try:
-                # Build SendGrid Mail object
-                from_email = self.Email(message.from_email or settings.DEFAULT_FROM_EMAIL)
-                
-                # Handle multiple recipients
-                to_emails = message.to
-                if not to_emails:
-                    continue
-                
-                # Create Mail object with first recipient
-                # SendGrid requires at least one "to" email in the constructor
-                mail = self.Mail(
-                    from_email=from_email,
-                    to_emails=self.Email(to_emails[0]),
-                    subject=message.subject,
-                    plain_text_content=message.body,
-                )
-                
-                # Add additional recipients if any
-                if len(to_emails) > 1:
-                    for email in to_emails[1:]:
-                        mail.add_to(self.Email(email))
-                
-                # Add CC recipients if any
-                if message.cc:
-                    for email in message.cc:
-                        mail.add_cc(self.Email(email))
-                
-                # Add BCC recipients if any
-                if message.bcc:
-                    for email in message.bcc:
-                        mail.add_bcc(self.Email(email))
-                
-                # Add reply-to if specified
-                if message.reply_to:
-                    mail.reply_to = self.Email(message.reply_to[0])
-                
-                # Send email via SendGrid API
-                response = sg.send(mail)
-                
-                # Check response status
-                if response.status_code in [200, 201, 202]:
-                    num_sent += 1
-                    logger.info(f"Email sent successfully via SendGrid to {to_emails}")
-                else:
-                    error_msg = f"SendGrid API returned status {response.status_code}: {response.body}"
-                    logger.error(error_msg)
-                    if not self.fail_silently:
-                        raise Exception(error_msg)
-                        
-            except Exception as e:
-                error_msg = f"Error sending email via SendGrid: {type(e).__name__}: {e}"
-                logger.error(error_msg, exc_info=True)
-                if not self.fail_silently:
-                    raise
-                # Continue to next message if fail_silently is True
-        
-        return num_sent
+        if not self.requests or not self.is_configured():
+            if not self.fail_silently:
+                raise ValueError(self.not_configured_message)
+            return 0
+        with timing.span("email"):
+            errors = self.send_each(email_messages)
+        failed = [e for e in errors if e is not None]
+        if failed and not self.fail_silently:
+            raise failed[0]
+        return len(errors) - len(failed)
+
+
+class SendGridEmailBackend(ApiEmailBackend):
+    """
+    Email backend using SendGrid API (not SMTP).
+
+    This works on Railway and other platforms that block SMTP ports.
+
+    Environment variables required:
+    - SENDGRID_API_KEY: Your SendGrid API key
+    - DJANGO_DEFAULT_FROM_EMAIL: The sender email address (must be verified in SendGrid)
+    """
 
+    provider = "SendGrid"
+    not_configured_message = "SendGrid not configured. Set SENDGRID_API_KEY environment variable."
 
-class ResendEmailBackend(BaseEmailBackend):
+    def is_configured(self) -> bool:
+        return bool(settings.SENDGRID_API_KEY)
+
+    def session_setup(self, session) -> None:
+        session.headers["Authorization"] = f"Bearer {settings.SENDGRID_API_KEY}"
+
+    # Personalizations per request (SendGrid caps recipients, not messages)
+    batch_limit = 1000
+
+    def _personalization(self, message) -> dict:
+        personalization = {"to": [{"email": email} for email in message.to]}
+        if message.cc:
+            personalization["cc"] = [{"email": email} for email in message.cc]
+        if message.bcc:
+            personalization["bcc"] = [{"email": email} for email in message.bcc]
+        return personalization
+
+    def _payload(self, message, personalizations) -> dict:
+        payload = {
+            "personalizations": personalizations,
+            "from": {"email": message.from_email or settings.DEFAULT_FROM_EMAIL},
+            "subject": message.subject,
+            "content": [],
+        }
+        text, html = _text_body(message), _html_body(message)
+        if text is not None:
+            payload["content"].append({"type": "text/plain", "value": text})
+        if html:
+            payload["content"].append({"type": "text/html", "value": html})
+        if message.reply_to:
+            payload["reply_to"] = {"email": message.reply_to[0]}
+        return payload
+
+    def _post_payload(self, payload):
+        response = self.post(f"{settings.SENDGRID_API_URL}/v3/mail/send", json=payload)
+        # 202 Accepted with an empty body; the id comes back as a header
+        return response.headers.get("X-Message-Id")
+
+    def send_one(self, message):
+        return self._post_payload(self._payload(message, [self._personalization(message)]))
+
+    def batch_key(self, message):
+        # Personalizations may override the subject, everything else is shared
+        if message.attachments or message.extra_headers:
+            return None
+        return (message.from_email, _text_body(message), _html_body(message), tuple(message.reply_to))
+
+    def batch_weight(self, message) -> int:
+        # SendGrid's limit is 1000 recipients per request across personalizations
+        return len(message.recipients())
+
+    def send_batch(self, messages):
+        personalizations = []
+        for message in messages:
+            personalization = self._personalization(message)
+            personalization["subject"] = message.subject
+            personalizations.append(personalization)
+        message_id = self._post_payload(self._payload(messages[0], personalizations))
+        return [message_id] * len(messages)
+
+
+class ResendEmailBackend(ApiEmailBackend):
     """
     Email backend using Resend API.
-    
+
     Resend is a modern email API service with a great free tier.
     Free tier: 100 emails/day, 3,000 emails/month
-    
+
     Environment variables required:
     - RESEND_API_KEY: Your Resend API key
     - DJANGO_DEFAULT_FROM_EMAIL: The sender email address (must be verified in Resend)
     """
-    
-    def __init__(self, fail_silently=False, **kwargs):
-        super().__init__(fail_silently=fail_silently)
-        self.fail_silently = fail_silently
-        self.api_key = None
-        
-        # Try to import resend
-        try:
-            import resend
-            self.resend = resend
-        except ImportError:
-            if not fail_silently:
-                raise ImportError(
-                    "Resend package is not installed. "
-                    "Install it with: pip install resend"
-                )
-            self.resend = None
-        
-        # Get API key from environment
-        import os
-        self.api_key = os.environ.get('RESEND_API_KEY', '')
-        
-        if not self.api_key and not fail_silently:
-            logger.warning("RESEND_API_KEY not set. Emails will not be sent.")
-    
-    def send_messages(self, email_messages):
-        """
-        Send one or more EmailMessage objects and return the number of emails sent.
-        """
-        import sys
-        import traceback
-        from datetime import datetime
-        
-        if not self.resend or not self.api_key:
-            error_msg = "Resend not configured. Set RESEND_API_KEY environment variable."
-            print(f"\n{'='*80}", file=sys.stderr, flush=True)
-            print(f"[{datetime.now()}] *** RESEND ERROR: {error_msg} ***", file=sys.stderr, flush=True)
-            print(f"RESEND: API key set: {'Yes' if self.api_key else 'No'}", file=sys.stderr, flush=True)
-            print(f"RESEND: Resend module loaded: {'Yes' if self.resend else 'No'}", file=sys.stderr, flush=True)
-            print(f"{'='*80}\n", file=sys.stderr, flush=True)
-            logger.error(error_msg)
-            if not self.fail_silently:
-                raise ValueError(error_msg)
-            return 0
-        
-        if not email_messages:
-            return 0
-        
-        num_sent = 0
-        
-        # Set API key at module level (Resend requires this)
-        self.resend.api_key = self.api_key
-        
-        for message in email_messages:
-            if not isinstance(message, EmailMessage):
-                continue
-            
-            try:
-                from_email = message.from_email or settings.DEFAULT_FROM_EMAIL
-                to_emails = message.to
-                if not to_emails:
-                    continue
-                
-                # Log email attempt
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"\n{'='*80}", file=sys.stdout, flush=True)
-                print(f"[{timestamp}] *** RESEND: Starting email send ***", file=sys.stdout, flush=True)
-                print(f"RESEND: From: {from_email}", file=sys.stdout, flush=True)
-                print(f"RESEND: To: {to_emails}", file=sys.stdout, flush=True)
-                print(f"RESEND: Subject: {message.subject}", file=sys.stdout, flush=True)
-                print(f"RESEND: API key prefix: {self.api_key[:10]}..." if len(self.api_key) > 10 else "RESEND: API key: (empty)", file=sys.stdout, flush=True)
-                print(f"{'='*80}\n", file=sys.stdout, flush=True)
-                
-                # Resend supports multiple recipients
-                params = {
-                    "from": from_email,
-                    "to": to_emails,
-                    "subject": message.subject,
-                    "text": message.body,
-                }
-                
-                # Add CC if any
-                if message.cc:
-                    params["cc"] = message.cc
-                
-                # Add BCC if any
-                if message.bcc:
-                    params["bcc"] = message.bcc
-                
-                # Add reply-to if specified
-                if message.reply_to:
-                    params["reply_to"] = message.reply_to[0]
-                
-                # Send email via Resend API
-                email = self.resend.Emails.send(params)
-                
-                # Log response
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"\n{'='*80}", file=sys.stdout, flush=True)
-                print(f"[{timestamp}] *** RESEND: API Response ***", file=sys.stdout, flush=True)
-                print(f"RESEND: Response type: {type(email)}", file=sys.stdout, flush=True)
-                print(f"RESEND: Response value: {email}", file=sys.stdout, flush=True)
-                print(f"{'='*80}\n", file=sys.stdout, flush=True)
-                
-                # Resend returns a dict with 'id' on success
-                if email and isinstance(email, dict) and 'id' in email:
-                    num_sent += 1
-                    success_msg = f"Email sent successfully via Resend to {to_emails}, id: {email['id']}"
-                    logger.info(success_msg)
-                    print(f"[{timestamp}] RESEND SUCCESS: {success_msg}", file=sys.stdout, flush=True)
-                elif email:  # Some versions might return different format
-                    num_sent += 1
-                    success_msg = f"Email sent successfully via Resend to {to_emails}"
-                    logger.info(success_msg)
-                    print(f"[{timestamp}] RESEND SUCCESS: {success_msg}", file=sys.stdout, flush=True)
-                else:
-                    error_msg = f"Resend API returned unexpected response: {email}"
-                    logger.error(error_msg)
-                    print(f"[{timestamp}] RESEND ERROR: {error_msg}", file=sys.stderr, flush=True)
-                    if not self.fail_silently:
-                        raise Exception(error_msg)
-                        
-            except Exception as e:
-                error_msg = f"Error sending email via Resend: {type(e).__name__}: {e}"
-                traceback_str = traceback.format_exc()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                print(f"\n{'='*80}", file=sys.stderr, flush=True)
-                print(f"[{timestamp}] *** RESEND EXCEPTION ***", file=sys.stderr, flush=True)
-                print(f"RESEND ERROR: {error_msg}", file=sys.stderr, flush=True)
-                print(f"RESEND TRACEBACK:\n{traceback_str}", file=sys.stderr, flush=True)
-                print(f"{'='*80}\n", file=sys.stderr, flush=True)
-                
-                logger.error(error_msg, exc_info=True)
-                if not self.fail_silently:
-                    raise
-        
-        return num_sent
-
-
-class MailgunEmailBackend(BaseEmailBackend):
+
+    provider = "Resend"
+    not_configured_message = "Resend not configured. Set RESEND_API_KEY environment variable."
+
+    def is_configured(self) -> bool:
+        return bool(settings.RESEND_API_KEY)
+
+    def session_setup(self, session) -> None:
+        session.headers["Authorization"] = f"Bearer {settings.RESEND_API_KEY}"
+
+    # Emails per POST /emails/batch
+    batch_limit = 100
+
+    def _params(self, message) -> dict:
+        params = {
+            "from": message.from_email or settings.DEFAULT_FROM_EMAIL,
+            "to": message.to,
+            "subject": message.subject,
+        }
+        text, html = _text_body(message), _html_body(message)
+        if text is not None:
+            params["text"] = text
+        if html:
+            params["html"] = html
+        if message.cc:
+            params["cc"] = message.cc
+        if message.bcc:
+            params["bcc"] = message.bcc
+        if message.reply_to:
+            params["reply_to"] = message.reply_to[0]
+        return params
+
+    def send_one(self, message):
+        response = self.post(f"{settings.RESEND_API_URL}/emails", json=self._params(message))
+        return response.json().get("id")
+
+    def batch_key(self, message):
+        # The batch endpoint takes complete emails, but no attachments
+        return None if message.attachments else "batch"
+
+    def send_batch(self, messages):
+        response = self.post(f"{settings.RESEND_API_URL}/emails/batch", json=[self._params(m) for m in messages])
+        data = response.json().get("data") or []
+        ids = [item.get("id") for item in data]
+        if len(ids) != len(messages):
+            raise EmailProviderError(self.provider, f"batch returned {len(ids)} ids for {len(messages)} emails")
+        return ids
+
+
+class MailgunEmailBackend(ApiEmailBackend):
     """
     Email backend using Mailgun API.
-    
+
     Mailgun is a popular email service with good free tier.
     Free tier: 5,000 emails/month for first 3 months, then 1,000/month
-    
+
     Environment variables required:
     - MAILGUN_API_KEY: Your Mailgun API key
     - MAILGUN_DOMAIN: Your Mailgun domain (e.g., 'mg.yourdomain.com')
     - DJANGO_DEFAULT_FROM_EMAIL: The sender email address
     """
-    
-    def __init__(self, fail_silently=False, **kwargs):
+
+    provider = "Mailgun"
+    not_configured_message = "Mailgun not configured. Set MAILGUN_API_KEY and MAILGUN_DOMAIN environment variables."
+
+    def is_configured(self) -> bool:
+        return bool(settings.MAILGUN_API_KEY and settings.MAILGUN_DOMAIN)
+
+    def session_setup(self, session) -> None:
+        session.auth = ("api", settings.MAILGUN_API_KEY)
+
+    # Recipients per batch send (recipient-variables)
+    batch_limit = 1000
+
+    def _data(self, message, to) -> dict:
+        data = {
+            "from": message.from_email or settings.DEFAULT_FROM_EMAIL,
+            "to": to,  # Repeated form field, one per recipient
+            "subject": message.subject,
+        }
+        text, html = _text_body(message), _html_body(message)
+        if text is not None:
+            data["text"] = text
+        if html:
+            data["html"] = html
+        if message.cc:
+            data["cc"] = ",".join(message.cc)
+        if message.bcc:
+            data["bcc"] = ",".join(message.bcc)
+        if message.reply_to:
+            data["h:Reply-To"] = message.reply_to[0]
+        return data
+
+    def _post_data(self, data):
+        response = self.post(f"{settings.MAILGUN_API_URL}/v3/{settings.MAILGUN_DOMAIN}/messages", data=data)
+        return response.json().get("id")
+
+    def send_one(self, message):
+        return self._post_data(self._data(message, message.to))
+
+    def batch_key(self, message):
+        # A batch send gives every "to" address its own copy of one identical
+        # message, so only single-recipient messages without cc/bcc qualify
+        if len(message.to) != 1 or message.cc or message.bcc or message.attachments or message.extra_headers:
+            return None
+        return (message.from_email, message.subject, _text_body(message), _html_body(message), tuple(message.reply_to))
+
+    def batch_accepts(self, chunk, message) -> bool:
+        # Mailgun would merge repeated addresses into one delivery
+        return all(m.to[0].lower() != message.to[0].lower() for m in chunk)
+
+    def send_batch(self, messages):
+        to = [m.to[0] for m in messages]
+        data = self._data(messages[0], to)
+        data["recipient-variables"] = json.dumps({address: {"n": n} for n, address in enumerate(to)})
+        message_id = self._post_data(data)
+        return [message_id] * len(messages)
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker shared by every connection in the process.
+
+    ``failure_threshold`` consecutive retryable failures open it; after
+    ``reset_timeout`` seconds one trial request is let through (half-open) and
+    its outcome closes or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        logger.warning("Email circuit breaker for %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        metrics.email_breaker_changed(self.name, state)
+        _publish_breaker(self)
+
+    def snapshot(self) -> dict:
+        retry_in = 0.0
+        if self.state == self.OPEN:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {"state": self.state, "failures": self.failures, "retry_in": retry_in}
+
+
+BREAKER_CACHE_PREFIX = "email-breaker:"
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name, settings.EMAIL_BREAKER_FAILURES, settings.EMAIL_BREAKER_RESET_SECONDS
+            )
+        return _breakers[name]
+
+
+def _publish_breaker(breaker: CircuitBreaker) -> None:
+    # Last transition seen by any worker, for platform_stats
+    try:
+        from django.core.cache import caches
+
+        caches["status"].set(
+            f"{BREAKER_CACHE_PREFIX}{breaker.name}", dict(breaker.snapshot(), changed_at=time.time()), None
+        )
+    except Exception as e:
+        logger.debug("Could not publish breaker state for %s: %s", breaker.name, e)
+
+
+def breaker_states() -> dict:
+    """Breaker state per provider in this process."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def shared_breaker_states(names) -> dict:
+    """Last published breaker transition per provider, across all workers."""
+    from django.core.cache import caches
+
+    values = caches["status"].get_many([f"{BREAKER_CACHE_PREFIX}{name}" for name in names])
+    return {name: values.get(f"{BREAKER_CACHE_PREFIX}{name}") for name in names}
+
+
+def _provider_name(backend) -> str:
+    cls = backend if isinstance(backend, type) else type(backend)
+    return getattr(cls, "provider", "") or cls.__module__.rsplit(".", 1)[-1].upper()
+
+
+def failover_provider_names() -> List[str]:
+    from django.utils.module_loading import import_string
+
+    return [_provider_name(import_string(path)) for path in settings.EMAIL_FAILOVER_BACKENDS]
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, EmailProviderError):
+        return error.retryable
+    # Missing configuration will not fix itself; SMTP and socket errors might
+    return not isinstance(error, (ValueError, ImportError))
+
+
+class FailoverEmailBackend(BaseEmailBackend):
+    """
+    Send through ``EMAIL_FAILOVER_BACKENDS`` in priority order.
+
+    Each provider gets up to ``EMAIL_RETRY_ATTEMPTS`` tries with jittered
+    exponential backoff for retryable errors (429, 5xx, network), honouring
+    Retry-After. Messages it still cannot send move on to the next provider.
+    Providers whose circuit breaker is open are skipped, and each message is
+    given up once ``EMAIL_SEND_BUDGET_SECONDS`` have passed since its first
+    attempt, so a slow provider costs one budget rather than a timeout per
+    try. Messages for backends that send one at a time (SMTP) are checked
+    against their own budget one by one, and each message's ``send_latency``
+    runs from its first attempt to its last.
+    """
+
+    def __init__(self, fail_silently=False, backends=None, **kwargs):
         super().__init__(fail_silently=fail_silently)
-        self.fail_silently = fail_silently
-        self.api_key = None
-        self.domain = None
-        
-        # Try to import requests (Mailgun uses HTTP API)
+        from django.core.mail import get_connection
+
+        self.backends = [
+            get_connection(path, fail_silently=True, **kwargs)
+            for path in (backends or settings.EMAIL_FAILOVER_BACKENDS)
+        ]
+        self._opened = []
+
+    def open(self):
+        if self._opened:
+            return False
+        for backend in self.backends:
+            try:
+                if backend.open():
+                    self._opened.append(backend)
+            except Exception as e:
+                # An unreachable SMTP server must not block the other providers
+                logger.warning("Could not open %s: %s", _provider_name(backend), e)
+        return True
+
+    def close(self):
+        opened, self._opened = self._opened, []
+        for backend in opened:
+            try:
+                backend.close()
+            except Exception as e:
+                logger.warning("Error closing %s: %s", _provider_name(backend), e)
+
+    @staticmethod
+    def _remaining(message) -> float:
+        """Seconds left of the message's budget, which starts with its first attempt."""
+        if message.failover_started is None:
+            return settings.EMAIL_SEND_BUDGET_SECONDS
+        return message.failover_started + settings.EMAIL_SEND_BUDGET_SECONDS - time.monotonic()
+
+    @staticmethod
+    def _attempt(backend, messages) -> List[Optional[Exception]]:
+        started = time.monotonic()
+        for message in messages:
+            if message.failover_started is None:
+                message.failover_started = started
+            message.send_latency = None
+        errors = send_each(backend, messages)
+        for message in messages:
+            # Backends time each message (or the batch request carrying it)
+            latency = message.send_latency if message.send_latency is not None else time.monotonic() - started
+            message.failover_finished = started + latency
+        return errors
+
+    def _send_with_retries(self, backend, messages) -> None:
+        name = _provider_name(backend)
+        breaker = get_breaker(name)
+        pending = messages
+        for attempt in range(1, settings.EMAIL_RETRY_ATTEMPTS + 1):
+            pending = [m for m in pending if self._remaining(m) > 0]
+            if not pending or not breaker.allow():
+                return
+            if isinstance(backend, ApiEmailBackend):
+                # Sent concurrently, so they start together
+                backend.timeout = min(settings.EMAIL_TIMEOUT, min(self._remaining(m) for m in pending))
+                errors = self._attempt(backend, pending)
+            else:
+                # Sent one after another: check each against its own budget
+                attempted, errors = [], []
+                for message in pending:
+                    if self._remaining(message) > 0:
+                        attempted.append(message)
+                        errors.extend(self._attempt(backend, [message]))
+                pending = attempted
+                if not pending:
+                    return
+            for message, error in zip(pending, errors):
+                if error is None:
+                    message.sent_via = name
+            retryable = [m for m, e in zip(pending, errors) if e is not None and _is_retryable(e)]
+            if retryable:
+                breaker.record_failure()
+            else:
+                # Sent, or rejected for reasons of its own (e.g. 400): the provider is up
+                breaker.record_success()
+            pending = retryable
+            if not pending or attempt == settings.EMAIL_RETRY_ATTEMPTS:
+                return
+            delay = random.uniform(0, settings.EMAIL_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            retry_after = max((getattr(m.send_error, "retry_after", None) or 0) for m in pending)
+            delay = max(delay, retry_after)
+            # Only messages whose budget outlasts the wait are retried
+            pending = [m for m in pending if self._remaining(m) > delay]
+            if not pending:
+                return
+            time.sleep(delay)
+
+    def send_each(self, email_messages) -> List[Optional[Exception]]:
+        email_messages = list(email_messages)
+        if not email_messages:
+            return []
+        for message in email_messages:
+            message.sent_via = None
+            message.send_error = EmailProviderError("failover", "no email provider available")
+            message.failover_started = message.failover_finished = None
+
+        new_conn_created = self.open()
         try:
-            import requests
-            self.requests = requests
-        except ImportError:
-            if not fail_silently:
-                raise ImportError(
-                    "requests package is not installed. "
-                    "Install it with: pip install requests"
-                )
-            self.requests = None
-        
-        # Get API key and domain from environment
-        import os
-        self.api_key = os.environ.get('MAILGUN_API_KEY', '')
-        self.domain = os.environ.get('MAILGUN_DOMAIN', '')
-        
-        if not self.api_key and not fail_silently:
-            logger.warning("MAILGUN_API_KEY not set. Emails will not be sent.")
-        if not self.domain and not fail_silently:
-            logger.warning("MAILGUN_DOMAIN not set. Emails will not be sent.")
-    
+            for backend in self.backends:
+                pending = [m for m in email_messages if m.sent_via is None and self._remaining(m) > 0]
+                if not pending:
+                    break
+                self._send_with_retries(backend, pending)
+        finally:
+            if new_conn_created:
+                self.close()
+
+        for message in email_messages:
+            started, finished = message.failover_started, message.failover_finished
+            message.send_latency = finished - started if started is not None else 0.0
+            if message.sent_via is not None:
+                message.send_error = None
+        return [message.send_error for message in email_messages]
+
     def send_messages(self, email_messages):
-        """
-        Send one or more EmailMessage objects and return the number of emails sent.
-        """
-        if not self.requests or not self.api_key or not self.domain:
-            if not self.fail_silently:
-                raise ValueError(
-                    "Mailgun not configured. Set MAILGUN_API_KEY and MAILGUN_DOMAIN environment variables."
-                )
-            return 0
-        
         if not email_messages:
             return 0
-        
-        num_sent = 0
-        api_url = f"https://api.mailgun.net/v3/{self.domain}/messages"
-        
-        for message in email_messages:
-            if not isinstance(message, EmailMessage):
-                continue
-            
-            try:
-                from_email = message.from_email or settings.DEFAULT_FROM_EMAIL
-                to_emails = message.to
-                if not to_emails:
-                    continue
-                
-                # Mailgun API parameters
-                data = {
-                    "from": from_email,
-                    "to": to_emails,  # Can be a list or comma-separated string
-                    "subject": message.subject,
-                    "text": message.body,
-                }
-                
-                # Add CC if any
-                if message.cc:
-                    data["cc"] = message.cc if isinstance(message.cc, str) else ",".join(message.cc)
-                
-                # Add BCC if any
-                if message.bcc:
-                    data["bcc"] = message.bcc if isinstance(message.bcc, str) else ",".join(message.bcc)
-                
-                # Add reply-to if specified
-                if message.reply_to:
-                    data["h:Reply-To"] = message.reply_to[0]
-                
-                # Send email via Mailgun API
-                response = self.requests.post(
-                    api_url,
-                    auth=("api", self.api_key),
-                    data=data,
-                    timeout=10
-                )
-                
-                # Check response status
-                if response.status_code == 200:
-                    num_sent += 1
-                    logger.info(f"Email sent successfully via Mailgun to {to_emails}")
-                else:
-                    error_msg = f"Mailgun API returned status {response.status_code}: {response.text}"
-                    logger.error(error_msg)
-                    if not self.fail_silently:
-                        raise Exception(error_msg)
-                        
-            except Exception as e:
-                error_msg = f"Error sending email via Mailgun: {type(e).__name__}: {e}"
-                logger.error(error_msg, exc_info=True)
-                if not self.fail_silently:
-                    raise
-        
-        return num_sent
+        with timing.span("email"):
+            errors = self.send_each(email_messages)
+        failed = [e for e in errors if e is not None]
+        if failed and not self.fail_silently:
+            raise failed[0]
+        return len(errors) - len(failed)
+
+
+def send_each(connection, email_messages) -> List[Optional[Exception]]:
+    """
+    Send ``email_messages`` over ``connection`` and return each one's error
+    (None if it was accepted). API backends dispatch them concurrently; other
+    backends are called once per message so one failure does not hide the rest.
+    """
+    if isinstance(connection, (ApiEmailBackend, FailoverEmailBackend)):
+        return connection.send_each(email_messages)
+    errors = []
+    for message in email_messages:
+        started = time.perf_counter()
+        try:
+            if not connection.send_messages([message]):
+                raise EmailProviderError(type(connection).__name__, "backend reported 0 messages sent")
+            message.send_error = None
+        except Exception as e:
+            message.send_error = e
+        message.send_latency = time.perf_counter() - started
+        metrics.email_sent(type(connection).__name__, message.send_latency, message.send_error is None)
+        errors.append(message.send_error)
+    return errors
@@ -0,0 +1,110 @@
+"""
+Logging pipeline used by settings.LOGGING.
+
+Records are handed to ``QueueLogHandler``, which only puts them on an in-memory
+queue; a background ``QueueListener`` thread formats and writes them, so a
+request never waits on stdout. When the queue is full, records are dropped
+(and counted) rather than blocking the request.
+
+``RequestIdMiddleware`` (submissions.middleware) stores a request id and a
+sampling decision in context variables. ``RequestContextFilter`` copies the id
+onto every record, and ``SamplingFilter`` lets records below ``LOG_LEVEL``
+(verbose diagnostics logged with ``logger.debug``) through only for the
+``LOG_SAMPLE_RATE`` fraction of requests that were sampled.
+"""
+import contextvars
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+request_sampled_var = contextvars.ContextVar("request_sampled", default=False)
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Pass records at ``level`` and above; lower ones only for sampled requests."""
+
+    def __init__(self, level="INFO"):
+        super().__init__()
+        self.level = logging._checkLevel(level)
+
+    def filter(self, record):
+        return record.levelno >= self.level or request_sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra=`` fields as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", "-")
+        if request_id != "-":
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Queue records for a background thread that writes them to ``stream``.
+
+    The formatter configured for this handler runs on the listener thread.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (their objects may change or be
+        # freed), but leave formatting to the listener thread
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # Called by logging.shutdown() at exit: writes out what is still queued
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.target.close()
+        super().close()
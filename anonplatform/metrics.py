@@ -0,0 +1,181 @@
+"""
+Prometheus metrics, served at ``/metrics`` to scrapers that send
+``Authorization: Bearer <METRICS_TOKEN>``.
+
+    http_request_duration_seconds       per view, method and status (MetricsMiddleware)
+    submissions_created_total           counted when the creating transaction commits
+    submission_receipt_collisions_total receipt codes that hit the unique constraint and were retried
+    rate_limit_rejections_total         per RATE_LIMIT_POLICIES policy
+    email_send_duration_seconds         per provider request (email_backends.py)
+    email_send_failures_total           per provider
+    email_circuit_breaker_state         per provider: 0 closed, 1 half-open, 2 open
+    email_circuit_breaker_transitions_total
+                                        per provider and state entered
+    queue_depth, queue_oldest_pending_age_seconds
+                                        outbox, webhook and intake queues, read at scrape time
+
+gunicorn forks several workers, and a scrape reaches only one of them. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (gunicorn.conf.py sets it), every process
+writes its samples to mmap'd files in that directory and a scrape adds them
+up. Without it each process reports only its own samples, which is what
+runserver and management commands get.
+
+prometheus_client is optional: without it every function here returns at
+once, MetricsMiddleware removes itself and ``/metrics`` answers 404.
+"""
+import hmac
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # Must exist before prometheus_client creates its first value file
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+enabled = prometheus_client is not None
+
+# Anything else (arbitrary verbs from scanners) is reported as "other"
+_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+if enabled:
+    # registry=None: collected through ``registry`` below, never the global default
+    REQUEST_DURATION = Histogram(
+        "http_request_duration_seconds", "Time spent handling a request, by view",
+        ["view", "method", "status"], registry=None,
+    )
+    SUBMISSIONS_CREATED = Counter(
+        "submissions_created", "Submissions saved (form, API and intake flushes)", registry=None,
+    )
+    RECEIPT_COLLISIONS = Counter(
+        "submission_receipt_collisions", "Receipt codes that already existed and were retried", registry=None,
+    )
+    RATE_LIMIT_REJECTIONS = Counter(
+        "rate_limit_rejections", "Requests answered 429 by RateLimitMiddleware", ["policy"], registry=None,
+    )
+    EMAIL_SEND_DURATION = Histogram(
+        "email_send_duration_seconds", "Duration of one provider send (a message or a batch)", ["provider"],
+        buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0), registry=None,
+    )
+    EMAIL_SEND_FAILURES = Counter(
+        "email_send_failures", "Provider sends that failed (a message or a batch)", ["provider"], registry=None,
+    )
+    # Worst state among the live processes that use the provider
+    EMAIL_BREAKER_STATE = Gauge(
+        "email_circuit_breaker_state", "Email circuit breaker: 0 closed, 1 half-open, 2 open", ["provider"],
+        multiprocess_mode="livemax", registry=None,
+    )
+    EMAIL_BREAKER_TRANSITIONS = Counter(
+        "email_circuit_breaker_transitions", "Email circuit breaker state changes, by state entered",
+        ["provider", "state"], registry=None,
+    )
+
+    class QueueCollector:
+        """Queue depths, read from the database on each scrape."""
+
+        def collect(self):
+            from submissions import intake, outbox, webhooks
+
+            depth = GaugeMetricFamily("queue_depth", "Items waiting in a queue", labels=["queue", "state"])
+            age = GaugeMetricFamily(
+                "queue_oldest_pending_age_seconds", "Age of the oldest item still waiting", labels=["queue"],
+            )
+            for name, stats in (("outbox", outbox.stats()), ("webhooks", webhooks.stats())):
+                depth.add_metric([name, "pending"], stats["pending"])
+                depth.add_metric([name, "retrying"], stats["retrying"])
+                depth.add_metric([name, "failed"], stats["failed"])
+                age.add_metric([name], stats["oldest_pending_age"])
+            if intake.is_enabled():
+                depth.add_metric(["intake", "pending"], intake.pending_count())
+            yield depth
+            yield age
+
+
+def _build_registry(queues: bool):
+    registry = CollectorRegistry()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        for collector in (
+            REQUEST_DURATION, SUBMISSIONS_CREATED, RECEIPT_COLLISIONS,
+            RATE_LIMIT_REJECTIONS, EMAIL_SEND_DURATION, EMAIL_SEND_FAILURES,
+            EMAIL_BREAKER_STATE, EMAIL_BREAKER_TRANSITIONS,
+        ):
+            registry.register(collector)
+    if queues:
+        registry.register(QueueCollector())
+    return registry
+
+
+registry = _build_registry(queues=True) if enabled else None
+
+
+def observe_request(view: str, method: str, status: int, seconds: float) -> None:
+    if enabled:
+        method = method if method in _METHODS else "other"
+        REQUEST_DURATION.labels(view or "-", method, str(status)).observe(seconds)
+
+
+def submissions_created(count: int = 1) -> None:
+    """Count ``count`` new submissions once the current transaction commits."""
+    if enabled and count:
+        transaction.on_commit(lambda: SUBMISSIONS_CREATED.inc(count))
+
+
+def receipt_collision() -> None:
+    if enabled:
+        RECEIPT_COLLISIONS.inc()
+
+
+def rate_limit_rejected(policy: str) -> None:
+    if enabled:
+        RATE_LIMIT_REJECTIONS.labels(policy).inc()
+
+
+def email_sent(provider: str, seconds: float, ok: bool) -> None:
+    if enabled:
+        EMAIL_SEND_DURATION.labels(provider).observe(seconds)
+        if not ok:
+            EMAIL_SEND_FAILURES.labels(provider).inc()
+
+
+_BREAKER_STATES = {"closed": 0, "half-open": 1, "open": 2}
+
+
+def email_breaker_changed(provider: str, state: str) -> None:
+    if enabled:
+        EMAIL_BREAKER_STATE.labels(provider).set(_BREAKER_STATES[state])
+        EMAIL_BREAKER_TRANSITIONS.labels(provider, state).inc()
+
+
+def start_server(port: int) -> None:
+    """
+    Serve this process's metrics on ``port`` (for workers outside gunicorn).
+    Queue depths are left to /metrics: this server's threads have no request
+    cycle to close the database connections a scrape would open.
+    """
+    if not enabled:
+        raise RuntimeError("prometheus_client is not installed. Install it with: pip install prometheus-client")
+    prometheus_client.start_http_server(port, registry=_build_registry(queues=False))
+
+
+@require_GET
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not enabled or not token:
+        raise Http404
+    supplied = request.META.get("HTTP_AUTHORIZATION", "").encode()
+    if not hmac.compare_digest(supplied, f"Bearer {token}".encode()):
+        response = HttpResponse("Missing or invalid metrics token.", status=401, content_type="text/plain")
+        response["WWW-Authenticate"] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(prometheus_client.generate_latest(registry), content_type=prometheus_client.CONTENT_TYPE_LATEST)
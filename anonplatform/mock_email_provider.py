@@ -0,0 +1,166 @@
+"""
+Local stand-in for the Resend, SendGrid and Mailgun HTTP APIs.
+
+Used by ``manage.py benchmark_email`` to load-test the email backends without
+sending real email. It accepts the endpoints the backends call:
+
+    POST /emails                 Resend, single email
+    POST /emails/batch           Resend, batch
+    POST /v3/mail/send           SendGrid
+    POST /v3/<domain>/messages   Mailgun
+
+Every request waits ``latency`` seconds (plus up to ``jitter``), then fails with
+a 500 at ``error_rate`` or a 429 (with ``Retry-After``) at ``throttle_rate``.
+Point the backends at it with RESEND_API_URL / SENDGRID_API_URL /
+MAILGUN_API_URL, or run it standalone:
+
+    python -m anonplatform.mock_email_provider --port 8025 --latency 0.08
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+MAILGUN_PATH = re.compile(r"^/v3/[^/]+/messages$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real providers
+    # Write headers and body in one segment so delayed ACKs do not add latency
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: "MockEmailProvider"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload=None, headers=None) -> None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        server.record_connection(self.client_address)
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        roll = random.random()
+        if roll < server.throttle_rate:
+            server.record(self.path, 429, 0)
+            return self._reply(429, {"message": "Too many requests"}, {"Retry-After": str(server.retry_after)})
+        if roll < server.throttle_rate + server.error_rate:
+            server.record(self.path, 500, 0)
+            return self._reply(500, {"message": "Internal error (mock)"})
+
+        if self.path == "/emails/batch":
+            emails = json.loads(raw or b"[]")
+            server.record(self.path, 200, len(emails))
+            return self._reply(200, {"data": [{"id": str(uuid.uuid4())} for _ in emails]})
+        if self.path == "/emails":
+            server.record(self.path, 200, 1)
+            return self._reply(200, {"id": str(uuid.uuid4())})
+        if self.path == "/v3/mail/send":
+            personalizations = json.loads(raw or b"{}").get("personalizations") or []
+            server.record(self.path, 202, len(personalizations))
+            return self._reply(202, headers={"X-Message-Id": uuid.uuid4().hex})
+        if MAILGUN_PATH.match(self.path):
+            recipients = parse_qs(raw.decode("utf-8")).get("to") or []
+            server.record("/v3/<domain>/messages", 200, len(recipients))
+            return self._reply(200, {"id": f"<{uuid.uuid4().hex}@mock>", "message": "Queued. Thank you."})
+        server.record(self.path, 404, 0)
+        return self._reply(404, {"message": "Unknown endpoint"})
+
+
+class MockEmailProvider(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = Counter()
+            self.statuses = Counter()
+            self.emails = 0
+            self.connections = set()
+
+    def record(self, path: str, status: int, emails: int) -> None:
+        with self._lock:
+            self.requests[path] += 1
+            self.statuses[status] += 1
+            self.emails += emails
+
+    def record_connection(self, client_address) -> None:
+        with self._lock:
+            self.connections.add(client_address)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": sum(self.requests.values()),
+                "by_path": dict(self.requests),
+                "by_status": dict(self.statuses),
+                "emails_accepted": self.emails,
+                "connections": len(self.connections),
+            }
+
+    def start(self) -> "MockEmailProvider":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-email-provider", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered 429")
+    args = parser.parse_args()
+    server = MockEmailProvider(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+    )
+    print(f"Mock email provider listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
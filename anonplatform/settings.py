@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -56,13 +57,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'submissions.middleware.RequestIdMiddleware',  # Request ids and sampling for logs
+    'submissions.middleware.MetricsMiddleware',  # Per-view latency for /metrics
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Static files serving
+    'submissions.middleware.AdmissionControlMiddleware',  # Load shedding, before any other work (static files are cheap)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'submissions.middleware.RateLimitMiddleware',  # Rate limiting for submissions
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'submissions.middleware.ServerTimingMiddleware',  # Server-Timing for staff / sampled requests
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,7 +76,7 @@ ROOT_URLCONF = 'anonplatform.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'anonplatform.timing.DjangoTemplates',  # Times renders for ServerTimingMiddleware
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -187,18 +192,29 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # - "anonplatform.email_backends.ResendEmailBackend" (for Resend API - easiest setup)
 # - "anonplatform.email_backends.SendGridEmailBackend" (for SendGrid API)
 # - "anonplatform.email_backends.MailgunEmailBackend" (for Mailgun API)
+# - "anonplatform.email_backends.FailoverEmailBackend" (EMAIL_FAILOVER_BACKENDS in order)
 # - "django.core.mail.backends.smtp.EmailBackend" (for SMTP - works locally but not on Railway)
 # - "django.core.mail.backends.console.EmailBackend" (for development - prints to console)
 
 # Prefer API-based email services in production (Railway blocks SMTP)
+# Every configured provider, in priority order. With more than one, sends fail
+# over between them (FailoverEmailBackend); override the order with
+# EMAIL_FAILOVER_BACKENDS (comma-separated backend paths, SMTP allowed).
+EMAIL_FAILOVER_BACKENDS = [b.strip() for b in os.environ.get("EMAIL_FAILOVER_BACKENDS", "").split(",") if b.strip()]
+if not EMAIL_FAILOVER_BACKENDS:
+    if os.environ.get("RESEND_API_KEY"):
+        EMAIL_FAILOVER_BACKENDS.append("anonplatform.email_backends.ResendEmailBackend")
+    if os.environ.get("SENDGRID_API_KEY"):
+        EMAIL_FAILOVER_BACKENDS.append("anonplatform.email_backends.SendGridEmailBackend")
+    if os.environ.get("MAILGUN_API_KEY") and os.environ.get("MAILGUN_DOMAIN"):
+        EMAIL_FAILOVER_BACKENDS.append("anonplatform.email_backends.MailgunEmailBackend")
+
 EMAIL_BACKEND = os.environ.get("DJANGO_EMAIL_BACKEND")
 if not EMAIL_BACKEND:
-    if os.environ.get("RESEND_API_KEY"):
-        EMAIL_BACKEND = "anonplatform.email_backends.ResendEmailBackend"
-    elif os.environ.get("SENDGRID_API_KEY"):
-        EMAIL_BACKEND = "anonplatform.email_backends.SendGridEmailBackend"
-    elif os.environ.get("MAILGUN_API_KEY") and os.environ.get("MAILGUN_DOMAIN"):
-        EMAIL_BACKEND = "anonplatform.email_backends.MailgunEmailBackend"
+    if len(EMAIL_FAILOVER_BACKENDS) > 1:
+        EMAIL_BACKEND = "anonplatform.email_backends.FailoverEmailBackend"
+    elif EMAIL_FAILOVER_BACKENDS:
+        EMAIL_BACKEND = EMAIL_FAILOVER_BACKENDS[0]
     else:
         EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = os.environ.get("DJANGO_DEFAULT_FROM_EMAIL", "no-reply@example.com")
@@ -225,6 +241,21 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
 EMAIL_TIMEOUT = int(os.environ.get("EMAIL_TIMEOUT", "10"))  # 10 second timeout to prevent hanging
 
+# API backends: concurrent sends per connection, and API base URLs
+# (e.g. MAILGUN_API_URL=https://api.eu.mailgun.net for EU domains)
+EMAIL_MAX_WORKERS = int(os.environ.get("EMAIL_MAX_WORKERS", "4"))
+RESEND_API_URL = os.environ.get("RESEND_API_URL", "https://api.resend.com").rstrip("/")
+SENDGRID_API_URL = os.environ.get("SENDGRID_API_URL", "https://api.sendgrid.com").rstrip("/")
+MAILGUN_API_URL = os.environ.get("MAILGUN_API_URL", "https://api.mailgun.net").rstrip("/")
+
+# FailoverEmailBackend: tries per provider, backoff base, time per message,
+# and the circuit breaker (consecutive failures to open, seconds until a retry)
+EMAIL_RETRY_ATTEMPTS = int(os.environ.get("EMAIL_RETRY_ATTEMPTS", "3"))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get("EMAIL_RETRY_BASE_SECONDS", "0.5"))
+EMAIL_SEND_BUDGET_SECONDS = float(os.environ.get("EMAIL_SEND_BUDGET_SECONDS", "15"))
+EMAIL_BREAKER_FAILURES = int(os.environ.get("EMAIL_BREAKER_FAILURES", "5"))
+EMAIL_BREAKER_RESET_SECONDS = float(os.environ.get("EMAIL_BREAKER_RESET_SECONDS", "60"))
+
 # Anonymous access gate
 COMPANY_ACCESS_CODE = os.environ.get("COMPANY_ACCESS_CODE", "123456")
 
@@ -283,38 +314,258 @@ SECURE_CROSS_ORIGIN_OPENER_POLICY = 'same-origin'
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    # Status lookup results (submissions/status_cache.py). Must be shared by all
+    # workers so invalidation reaches every process; a local file cache works
+    # for a single host, point it at Redis/Memcached when running several.
+    'status': {
+        'BACKEND': os.environ.get("STATUS_CACHE_BACKEND", 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get(
+            "STATUS_CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "anonplatform-status-cache"),
+        ),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get("STATUS_CACHE_MAX_ENTRIES", "2000"))},
+    },
+    # Operational counters (submissions/counters.py). Kept apart from 'status',
+    # which culls entries once full and would drop running totals with them; it
+    # only ever holds a few dozen keys. Shared by all workers, like 'status'.
+    'counters': {
+        'BACKEND': os.environ.get("COUNTERS_CACHE_BACKEND", 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get(
+            "COUNTERS_CACHE_LOCATION",
+            os.path.join(tempfile.gettempdir(), "anonplatform-counters"),
+        ),
+    },
 }
+STATUS_CACHE_ENABLED = os.environ.get("STATUS_CACHE_ENABLED", "1") == "1"
+STATUS_CACHE_TTL = int(os.environ.get("STATUS_CACHE_TTL", "600"))
+
+# Reject access/receipt codes that cannot exist before querying the database
+# (submissions/code_filter.py). Not-found results are remembered in the status
+# cache for CODE_FILTER_NEGATIVE_TTL seconds. Legacy receipt codes are looked up
+# in the file `manage.py build_code_filter` writes to CODE_FILTER_PATH; workers
+# check its mtime every CODE_FILTER_REFRESH_SECONDS.
+CODE_FILTER_ENABLED = os.environ.get("CODE_FILTER_ENABLED", "1") == "1"
+CODE_FILTER_NEGATIVE_TTL = int(os.environ.get("CODE_FILTER_NEGATIVE_TTL", "30"))
+CODE_FILTER_REFRESH_SECONDS = int(os.environ.get("CODE_FILTER_REFRESH_SECONDS", "60"))
+CODE_FILTER_PATH = os.environ.get(
+    "CODE_FILTER_PATH",
+    os.path.join(tempfile.gettempdir(), "anonplatform-receipt-codes.bloom"),
+)
+
+# Admission control (submissions/middleware.py). Per worker process: at most
+# ADMISSION_MAX_IN_FLIGHT requests (match gunicorn --threads; raise it under ASGI),
+# the last ADMISSION_RESERVED_SLOTS of them only for critical paths. Low-priority
+# paths are also shed when requests queue longer than the budget. That needs
+# ADMISSION_TRUST_REQUEST_START=1, only behind a proxy that sets X-Request-Start
+# and overwrites any value the client sent; otherwise clients could fake it.
+ADMISSION_CONTROL_ENABLED = os.environ.get("ADMISSION_CONTROL_ENABLED", "1") == "1"
+ADMISSION_TRUST_REQUEST_START = os.environ.get("ADMISSION_TRUST_REQUEST_START", "0") == "1"
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "4"))
+ADMISSION_RESERVED_SLOTS = int(os.environ.get("ADMISSION_RESERVED_SLOTS", "1"))
+ADMISSION_LOW_PRIORITY_MAX_QUEUE_WAIT = float(os.environ.get("ADMISSION_LOW_PRIORITY_MAX_QUEUE_WAIT", "0.5"))  # seconds
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "5"))
+ADMISSION_CRITICAL_PATHS = [
+    "/submit/", "/submitted/", "/status/", "/api/v1/submissions/batch/", "/api/v1/status/",
+]
+ADMISSION_LOW_PRIORITY_PATHS = ["/pricing/", "/how-it-works/", "/admin/"]
+
+# Rate limiter state (submissions/ratelimit.py): "local" keeps it in each worker
+# process, with no I/O per request (a client may get up to one limit per process);
+# "database" shares exact limits across every worker and node, at one write per
+# policy per request.
+# RATE_LIMIT_ENABLED=0 turns every policy off (load tests, see benchmark_concurrency).
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "local")
+
+# Rate limit policies, compiled once at startup (submissions/ratelimit.py). Each
+# counts requests per "key" ("ip", "access_code" or "ip_receipt_prefix", an IP
+# and the first five digits of a receipt code), or with "cost": "receipt_codes"
+# every receipt code in a batch status request, and rejects the rest with a 429
+# and Retry-After. With "action": "delay", clients at most "max_delay" seconds
+# early get a 429 telling them how long to wait instead (nothing waits server-side).
+RATE_LIMIT_POLICIES = [
+    {
+        "name": "submit", "paths": ["/submit/"], "key": "ip",
+        "limit": int(os.environ.get("RATE_LIMIT_MAX_SUBMISSIONS", "10")),
+        "period": int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "3600")),
+    },
+    {
+        # A leaked access code cannot flood one HR account from many IPs
+        "name": "submit_code", "paths": ["/submit/"], "key": "access_code",
+        "limit": int(os.environ.get("RATE_LIMIT_ACCESS_CODE_MAX", "200")),
+        "period": int(os.environ.get("RATE_LIMIT_ACCESS_CODE_WINDOW_SECONDS", "3600")),
+    },
+    {
+        "name": "hr_register", "paths": ["/hr/register/"], "key": "ip",
+        "limit": int(os.environ.get("RATE_LIMIT_HR_REGISTER_MAX", "10")),
+        "period": int(os.environ.get("RATE_LIMIT_HR_REGISTER_WINDOW_SECONDS", "3600")),
+    },
+    {
+        "name": "status", "paths": ["/status/"], "key": "ip",
+        "limit": int(os.environ.get("RATE_LIMIT_STATUS_LOOKUP_MAX", "60")),
+        "period": int(os.environ.get("RATE_LIMIT_STATUS_LOOKUP_WINDOW_SECONDS", "3600")),
+    },
+    {
+        # Slows one client walking through receipt codes that share a prefix
+        "name": "status_prefix", "paths": ["/status/"], "key": "ip_receipt_prefix",
+        "limit": 20, "period": 600, "action": "delay", "max_delay": 30,
+    },
+    {
+        # Counts receipt codes, not requests: one request can check up to
+        # STATUS_API_MAX_CODES, which must stay below this limit
+        "name": "status_api", "paths": ["/api/v1/status/"], "key": "ip", "cost": "receipt_codes",
+        "limit": int(os.environ.get("RATE_LIMIT_STATUS_MAX", "300")),
+        "period": int(os.environ.get("RATE_LIMIT_STATUS_WINDOW_SECONDS", "3600")),
+    },
+    {
+        "name": "contact", "paths": ["/contact/"], "key": "ip",
+        "limit": int(os.environ.get("RATE_LIMIT_CONTACT_MAX", "5")),
+        "period": int(os.environ.get("RATE_LIMIT_CONTACT_WINDOW_SECONDS", "3600")),
+    },
+    {
+        "name": "admin_login", "paths": ["/admin/login/"], "key": "ip",
+        "limit": int(os.environ.get("RATE_LIMIT_ADMIN_LOGIN_MAX", "20")),
+        "period": int(os.environ.get("RATE_LIMIT_ADMIN_LOGIN_WINDOW_SECONDS", "900")),
+        "action": "delay", "max_delay": 45,
+    },
+]
+
+# Idempotency keys on the submit and HR registration forms (submissions/idempotency.py),
+# claimed in the IdempotencyKey table. A retried POST replays the first result for
+# IDEMPOTENCY_TTL seconds; one arriving mid-flight gets a 409 at once.
+IDEMPOTENCY_ENABLED = os.environ.get("IDEMPOTENCY_ENABLED", "1") == "1"
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_PENDING_TTL = int(os.environ.get("IDEMPOTENCY_PENDING_TTL", "60"))  # claim of a request that died
+
+# Shared index of active HR access codes (see submissions/access_index.py).
+# Every worker on the host maps the same file, so keep it on a local disk.
+ACCESS_CODE_INDEX_ENABLED = os.environ.get("ACCESS_CODE_INDEX_ENABLED", "1") == "1"
+ACCESS_CODE_INDEX_PATH = os.environ.get(
+    "ACCESS_CODE_INDEX_PATH",
+    os.path.join(tempfile.gettempdir(), "anonplatform-access-codes.idx"),
+)
+ACCESS_CODE_INDEX_MAX_AGE = int(os.environ.get("ACCESS_CODE_INDEX_MAX_AGE", "300"))  # seconds
+
+# Receipt code allocator (see submissions/allocators.py). Changing the key after
+# codes have been issued can produce duplicates, so set it once and keep it.
+RECEIPT_CODE_KEY = os.environ.get("RECEIPT_CODE_KEY", "")  # Defaults to a key derived from SECRET_KEY
+RECEIPT_CODE_BLOCK_SIZE = int(os.environ.get("RECEIPT_CODE_BLOCK_SIZE", "100"))
+
+# HR access code allocator. Released codes are only reused after the cooldown,
+# once all 1,000,000 fresh codes have been issued.
+ACCESS_CODE_KEY = os.environ.get("ACCESS_CODE_KEY", "")  # Defaults to a key derived from SECRET_KEY
+ACCESS_CODE_BLOCK_SIZE = int(os.environ.get("ACCESS_CODE_BLOCK_SIZE", "20"))
+ACCESS_CODE_REUSE_COOLDOWN_DAYS = int(os.environ.get("ACCESS_CODE_REUSE_COOLDOWN_DAYS", "90"))
+
+# Provisioning jobs queued from the admin are run by `manage.py run_provisioning`;
+# a RUNNING job whose lease is not renewed for this long is resumed by another worker
+PROVISIONING_JOB_LEASE_SECONDS = int(os.environ.get("PROVISIONING_JOB_LEASE_SECONDS", "300"))
+
+# Submission intake: "direct" inserts on each POST, "queued" stages a narrow
+# IntakeEntry row and relies on `manage.py flush_intake --loop` to create the
+# submissions in batches.
+SUBMISSION_INTAKE_MODE = os.environ.get("SUBMISSION_INTAKE_MODE", "direct")
+SUBMISSION_INTAKE_BATCH_SIZE = int(os.environ.get("SUBMISSION_INTAKE_BATCH_SIZE", "500"))
+
+# Email outbox drained by `manage.py run_outbox --loop` (see the Procfile)
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get("OUTBOX_RETRY_BASE_SECONDS", "30"))
+OUTBOX_KEEP_SENT_DAYS = int(os.environ.get("OUTBOX_KEEP_SENT_DAYS", "7"))
+# How long a worker's claim on a batch lasts; longer than a batch takes to send
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "300"))
+
+# Outbound webhooks delivered by `manage.py run_webhooks --loop` (see the Procfile)
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", "500"))  # events claimed per transaction
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", "10"))
+WEBHOOK_RETRY_BASE_SECONDS = int(os.environ.get("WEBHOOK_RETRY_BASE_SECONDS", "30"))
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_WORKERS = int(os.environ.get("WEBHOOK_MAX_WORKERS", "4"))  # endpoints posted to concurrently
+WEBHOOK_KEEP_SENT_DAYS = int(os.environ.get("WEBHOOK_KEEP_SENT_DAYS", "7"))
+# How often each process reloads which HR accounts have endpoints
+WEBHOOK_ENDPOINTS_REFRESH_SECONDS = int(os.environ.get("WEBHOOK_ENDPOINTS_REFRESH_SECONDS", "30"))
+
+# HR notification digests (HrAccessCode.notification_mode BATCHED / DAILY)
+NOTIFICATION_DIGEST_DAILY_HOUR = int(os.environ.get("NOTIFICATION_DIGEST_DAILY_HOUR", "8"))  # UTC
+# Overdue submission reminders (`manage.py send_reminders --loop`)
+SUBMISSION_REMINDER_NEW_HOURS = int(os.environ.get("SUBMISSION_REMINDER_NEW_HOURS", "48"))
+SUBMISSION_REMINDER_IN_REVIEW_HOURS = int(os.environ.get("SUBMISSION_REMINDER_IN_REVIEW_HOURS", "168"))
+SUBMISSION_REMINDER_INTERVAL_HOURS = int(os.environ.get("SUBMISSION_REMINDER_INTERVAL_HOURS", "24"))  # per HR account
+# Public base URL for links in emails sent outside a request (no trailing slash)
+SITE_URL = os.environ.get("SITE_URL", "").rstrip("/")
+
+# JSON batch submission API (token-authenticated, one transaction per request)
+SUBMISSION_API_MAX_BATCH = int(os.environ.get("SUBMISSION_API_MAX_BATCH", "500"))
+# Receipt codes accepted per request by the batch status API
+STATUS_API_MAX_CODES = int(os.environ.get("STATUS_API_MAX_CODES", "50"))
+
+# Route submit/submitted/status to the async views (submissions/async_views.py).
+# Enable together with an ASGI server, see the Procfile.
+SUBMISSION_ASYNC_VIEWS = os.environ.get("SUBMISSION_ASYNC_VIEWS", "0") == "1"
+
+# Server-Timing breakdown (submissions.middleware.ServerTimingMiddleware): as a
+# response header and log record for staff users, and as a log record only for
+# SERVER_TIMING_SAMPLE_RATE of all other requests.
+SERVER_TIMING_STAFF = os.environ.get("SERVER_TIMING_STAFF", "1") == "1"
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get("SERVER_TIMING_SAMPLE_RATE", "0"))
+
+# Prometheus metrics at /metrics (anonplatform/metrics.py) for scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>". Without a token the endpoint is 404.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Logging: records are queued and written by a background thread (anonplatform/log.py).
+# LOG_FORMAT is "json" (one object per line) or "text". LOG_SAMPLE_RATE is the
+# fraction of requests whose DEBUG diagnostics are logged as well.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))  # records beyond this are dropped
 
-# Logging configuration
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
+        'json': {
+            '()': 'anonplatform.log.JsonFormatter',
+        },
+        'text': {
+            'format': '{levelname} {asctime} {module} [{request_id}] {message}',
             'style': '{',
         },
     },
+    'filters': {
+        'request_context': {
+            '()': 'anonplatform.log.RequestContextFilter',
+        },
+        'sampling': {
+            '()': 'anonplatform.log.SamplingFilter',
+            'level': LOG_LEVEL,
+        },
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'class': 'anonplatform.log.QueueLogHandler',
+            'stream': 'ext://sys.stderr',
+            'maxsize': LOG_QUEUE_SIZE,
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'text',
+            'filters': ['request_context', 'sampling'],
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'INFO',
+        'level': LOG_LEVEL,
     },
     'loggers': {
         'django': {
             'handlers': ['console'],
-            'level': 'INFO',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'submissions': {
             'handlers': ['console'],
-            'level': 'ERROR',
+            # DEBUG records only reach the sampling filter when sampling is on
+            'level': 'DEBUG' if LOG_SAMPLE_RATE > 0 else LOG_LEVEL,
             'propagate': False,
         },
     },
@@ -0,0 +1,124 @@
+"""
+Per-request timing breakdown for the Server-Timing header and request logs.
+
+``ServerTimingMiddleware`` (submissions.middleware) puts a ``RequestTimings``
+in a context variable for the requests it instruments (staff, or a
+``SERVER_TIMING_SAMPLE_RATE`` fraction of the rest) and installs it as a
+``connection.execute_wrapper`` to time every query. The other sources report
+into it through the helpers below:
+
+    database   every query on the default connection (execute_wrapper)
+    templates  DjangoTemplates below, set as the TEMPLATES backend
+    cache      status_cache and code_filter hits and misses (``cache_result``)
+    email      outbox.enqueue() and direct provider sends (``span("email")``)
+
+For every other request the context variable is None and each helper returns
+after one ``ContextVar.get()``.
+"""
+import contextvars
+import time
+from typing import Optional
+
+from django.template.backends import django as django_backend
+
+timings_var = contextvars.ContextVar("server_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+        self.email = 0.0
+        self.email_calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """Server-Timing header value; durations in milliseconds."""
+        return ", ".join((
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f"tpl;dur={self.template * 1000:.1f}",
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'email;dur={self.email * 1000:.1f};desc="{self.email_calls} calls"',
+            f"total;dur={self.elapsed() * 1000:.1f}",
+        ))
+
+    def log_fields(self) -> dict:
+        return {
+            "duration_ms": round(self.elapsed() * 1000, 1),
+            "db_ms": round(self.db * 1000, 1),
+            "db_queries": self.queries,
+            "template_ms": round(self.template * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "email_ms": round(self.email * 1000, 1),
+            "email_calls": self.email_calls,
+        }
+
+
+def current() -> Optional[RequestTimings]:
+    return timings_var.get()
+
+
+def cache_result(hits: int = 0, misses: int = 0) -> None:
+    timings = timings_var.get()
+    if timings is not None:
+        timings.cache_hits += hits
+        timings.cache_misses += misses
+
+
+class span:
+    """``with span("email"):`` adds the block's duration to that timing (email or template)."""
+
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = timings_var.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            elapsed = time.perf_counter() - self.started
+            if self.name == "email":
+                self.timings.email += elapsed
+                self.timings.email_calls += 1
+            else:
+                self.timings.template += elapsed
+        return False
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        if timings_var.get() is None:
+            return super().render(context, request)
+        with span("template"):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock backend, with top-level renders timed (includes run inside them)."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
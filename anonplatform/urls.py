@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.http import HttpResponse
 from django.urls import include, path
 
+from anonplatform import metrics
+
 
 def favicon_view(request):
     """Return empty response for favicon requests to avoid 404 warnings."""
@@ -27,5 +29,6 @@ def favicon_view(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('favicon.ico', favicon_view, name='favicon'),
+    path('metrics', metrics.metrics_view, name='metrics'),
     path("", include("submissions.urls")),
 ]
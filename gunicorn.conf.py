@@ -0,0 +1,29 @@
+"""
+gunicorn settings, read automatically when gunicorn starts in this directory.
+
+Sets up prometheus_client's multiprocess mode for /metrics (anonplatform/metrics.py):
+every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and a scrape, served
+by any one worker, adds them up. The directory is emptied when gunicorn starts so
+a restart does not add the previous run's totals again.
+"""
+import os
+import shutil
+import tempfile
+
+multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "anonplatform-metrics")
+)
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's live-gauge files; its counters and histograms are kept
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
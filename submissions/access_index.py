@@ -0,0 +1,332 @@
+"""
+Shared lookup index of active HR access codes.
+
+Every submission has to resolve the 6-digit access code the employee typed.
+Instead of querying ``submissions_hraccesscode`` on each POST, the active codes
+are written to a single file that every gunicorn worker on the host maps into
+memory:
+
+    header | 1,000,000 slots (one per 6-digit code) | packed records
+
+A slot holds ``offset + 1`` of the code's record (``0`` = no active code), and a
+record holds the HrAccessCode id, user id, notification mode and the resolved
+notification email.
+A lookup is two struct reads on shared pages - no query, no syscall.
+
+Invalidation uses a small companion ``.gen`` file holding a random token. Saving
+or deleting an HrAccessCode (and the bulk admin actions, which bypass signals)
+writes a new token once the transaction commits and then rebuilds the file, in
+the process that made the change. Every other worker sees the new token through
+its own mapping of the ``.gen`` file and only remaps the file; until the rebuilt
+copy carries the current token its lookups go to the database. Rebuilds take an
+exclusive ``flock`` on a ``.lock`` file, so a burst of changes rebuilds one at a
+time and the last one sees every change.
+
+The file also expires after ``ACCESS_CODE_INDEX_MAX_AGE`` seconds as a backstop
+for changes made on another host, or a process that died between invalidating
+and rebuilding. The first worker on the host to notice rebuilds it in a
+background thread while lookups keep using the current copy; request threads
+never rebuild. ``manage.py build_access_index`` writes the file before the
+workers start.
+
+If the index cannot answer (disabled, non 6-digit code, filesystem error), the
+caller falls back to the database by catching ``IndexUnavailable``.
+"""
+import fcntl
+import functools
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CODE_SPACE = 1_000_000
+MAGIC = b"HRIDX002"
+TOKEN_SIZE = 8
+
+# magic, generation token, built_at (unix time), record count
+HEADER = struct.Struct("<8s8sdI")
+SLOT = struct.Struct("<I")
+# HrAccessCode id, user id, notification mode, email length (email bytes follow)
+RECORD = struct.Struct("<qqBH")
+
+# HrAccessCode fields copied into the index; saves touching none of them keep it
+INDEXED_FIELDS = frozenset({"access_code", "is_active", "user", "notification_mode", "notification_email"})
+
+SLOTS_OFFSET = HEADER.size
+RECORDS_OFFSET = SLOTS_OFFSET + SLOT.size * CODE_SPACE
+
+
+@functools.lru_cache(maxsize=None)
+def _modes() -> tuple:
+    """Notification modes in the order their index is stored in records."""
+    from .models import HrAccessCode
+
+    return tuple(HrAccessCode.NotificationMode.values)
+
+
+class IndexUnavailable(Exception):
+    """The index cannot answer this lookup; query the database instead."""
+
+
+@dataclass(frozen=True)
+class AccessCodeEntry:
+    id: int
+    user_id: int
+    access_code: str
+    notification_email: str
+    notification_mode: str
+
+    def to_model(self):
+        """Build an unsaved-looking HrAccessCode bound to the existing row."""
+        from .models import HrAccessCode
+
+        hr_code = HrAccessCode(
+            id=self.id,
+            user_id=self.user_id,
+            access_code=self.access_code,
+            notification_email=self.notification_email,
+            notification_mode=self.notification_mode,
+            is_active=True,
+        )
+        hr_code._state.adding = False
+        hr_code._state.db = "default"
+        return hr_code
+
+
+class AccessCodeIndex:
+    def __init__(self, path: str, max_age: float = 300.0):
+        self.path = path
+        self.stamp_path = f"{path}.gen"
+        self.lock_path = f"{path}.lock"
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # Held for a whole rebuild; lookups only ever wait for _lock
+        self._build_mutex = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+        # (inode, mtime) of the file behind _map, so a stale copy is not remapped
+        self._map_stat = None
+        self._stamp: Optional[mmap.mmap] = None
+        self._refreshing = False
+
+    # -- public API -----------------------------------------------------------
+
+    def lookup(self, access_code: str) -> Optional[AccessCodeEntry]:
+        """
+        Return the active entry for ``access_code`` or None if no active code matches.
+        Raises IndexUnavailable when the database has to be consulted instead.
+        """
+        if len(access_code) != 6 or not access_code.isdigit():
+            raise IndexUnavailable("not a 6-digit code")
+        data = self._current_map()
+        (pointer,) = SLOT.unpack_from(data, SLOTS_OFFSET + SLOT.size * int(access_code))
+        if not pointer:
+            return None
+        offset = RECORDS_OFFSET + pointer - 1
+        code_id, user_id, mode, email_len = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        email = data[start:start + email_len].decode("utf-8")
+        return AccessCodeEntry(code_id, user_id, access_code, email, _modes()[mode])
+
+    def invalidate(self) -> None:
+        """Mark the index stale for every process mapping it."""
+        try:
+            self._write_token(os.urandom(TOKEN_SIZE))
+        except OSError as e:
+            logger.warning("Could not invalidate access code index at %s: %s", self.stamp_path, e)
+
+    def refresh(self) -> None:
+        """Invalidate, then rebuild once for every worker on the host (after a change)."""
+        self.invalidate()
+        try:
+            self.rebuild()
+        except (OSError, ValueError) as e:
+            # Workers use the database until the next rebuild (at most max_age)
+            logger.warning("Could not rebuild access code index at %s: %s", self.path, e)
+
+    def rebuild(self) -> int:
+        """Rebuild the index file from the database and map the new copy; returns the code count."""
+        with self._build_mutex, self._build_lock():
+            return self._rebuild_locked()
+
+    # -- internals ------------------------------------------------------------
+
+    def _current_map(self) -> mmap.mmap:
+        data = self._map
+        if data is None or not self._is_current(data):
+            data = self._remap()
+        if self._is_expired(data):
+            self._rebuild_in_background()
+        return data
+
+    def _remap(self) -> mmap.mmap:
+        """Map the file the last rebuild wrote; IndexUnavailable if it is not current yet."""
+        with self._lock:
+            try:
+                data = self._map
+                if data is None or not self._is_current(data):
+                    data = self._open_map()
+                current = data is not None and self._is_current(data)
+            except (OSError, ValueError, struct.error) as e:
+                raise IndexUnavailable(str(e)) from e
+        if not current:
+            # Normally the process that made the change is rebuilding; this only
+            # matters if it died first (or the file was never built)
+            self._rebuild_in_background()
+            raise IndexUnavailable("index is being rebuilt")
+        return data
+
+    def _is_current(self, data: mmap.mmap) -> bool:
+        _, token, _, _ = HEADER.unpack_from(data, 0)
+        return token == self._stamp_token()
+
+    def _is_expired(self, data: mmap.mmap) -> bool:
+        _, _, built_at, _ = HEADER.unpack_from(data, 0)
+        return time.time() - built_at > self.max_age
+
+    def _rebuild_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_stale, name="access-index-rebuild", daemon=True).start()
+
+    def _refresh_stale(self) -> None:
+        try:
+            with self._build_mutex, self._build_lock():
+                # Another process may have rebuilt while this one waited for the lock
+                with self._lock:
+                    data = self._open_map()
+                if data is None or not self._is_current(data) or self._is_expired(data):
+                    self._rebuild_locked()
+        except Exception:
+            logger.exception("Could not rebuild access code index at %s", self.path)
+        finally:
+            self._refreshing = False
+            connection.close()
+
+    def _build_lock(self):
+        """Exclusive across processes on this host; released when the file closes."""
+        f = open(self.lock_path, "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _stamp_token(self) -> bytes:
+        if self._stamp is None:
+            if not os.path.exists(self.stamp_path):
+                self._write_token(os.urandom(TOKEN_SIZE))
+            with open(self.stamp_path, "rb") as f:
+                self._stamp = mmap.mmap(f.fileno(), TOKEN_SIZE, access=mmap.ACCESS_READ)
+        return self._stamp[:TOKEN_SIZE]
+
+    def _write_token(self, token: bytes) -> None:
+        # Write in place (not replace) so existing mappings observe the new token
+        fd = os.open(self.stamp_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, token)
+        finally:
+            os.close(fd)
+
+    def _open_map(self) -> Optional[mmap.mmap]:
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if self._map is not None and (stat.st_ino, stat.st_mtime_ns) == self._map_stat:
+                    return self._map
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.size() < RECORDS_OFFSET or data[:len(MAGIC)] != MAGIC:
+            data.close()
+            return None
+        # Earlier mappings are left to the GC; a concurrent reader may still hold one.
+        self._map, self._map_stat = data, (stat.st_ino, stat.st_mtime_ns)
+        return data
+
+    def _rebuild_locked(self) -> int:
+        from .models import HrAccessCode
+
+        # Read the token before querying so a change committed mid-rebuild
+        # leaves this copy stale rather than hiding the change.
+        token = self._stamp_token()
+        rows = HrAccessCode.objects.filter(is_active=True).values_list(
+            "id", "access_code", "user_id", "notification_mode", "notification_email", "user__email"
+        )
+        modes = _modes()
+
+        slots = bytearray(SLOT.size * CODE_SPACE)
+        records = bytearray()
+        count = 0
+        for code_id, access_code, user_id, mode, notification_email, user_email in rows.iterator():
+            if len(access_code) != 6 or not access_code.isdigit():
+                continue
+            email = (notification_email or user_email or "").encode("utf-8")
+            SLOT.pack_into(slots, SLOT.size * int(access_code), len(records) + 1)
+            records += RECORD.pack(code_id, user_id, modes.index(mode), len(email)) + email
+            count += 1
+
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".hridx-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, token, time.time(), count))
+                f.write(slots)
+                f.write(records)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        logger.info("Rebuilt access code index with %d active codes", count)
+
+        with self._lock:
+            data = self._open_map()
+        if data is None:
+            raise OSError(f"Access code index at {self.path} is unreadable after rebuild")
+        return count
+
+
+_index: Optional[AccessCodeIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> AccessCodeIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = AccessCodeIndex(
+                    settings.ACCESS_CODE_INDEX_PATH,
+                    max_age=settings.ACCESS_CODE_INDEX_MAX_AGE,
+                )
+    return _index
+
+
+def lookup(access_code: str) -> Optional[AccessCodeEntry]:
+    """Resolve an active access code through the shared index."""
+    if not settings.ACCESS_CODE_INDEX_ENABLED:
+        raise IndexUnavailable("disabled")
+    return get_index().lookup(access_code)
+
+
+def _refresh() -> None:
+    get_index().refresh()
+
+
+def invalidate_on_commit() -> None:
+    """Invalidate and rebuild the shared index once the current transaction commits."""
+    if not settings.ACCESS_CODE_INDEX_ENABLED:
+        return
+    # One rebuild per transaction, however many codes a bulk action changed
+    pending = transaction.get_connection().run_on_commit
+    if not any(callback is _refresh for _, callback, _ in pending):
+        transaction.on_commit(_refresh)
@@ -1,13 +1,18 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User, Group
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.template.response import TemplateResponse
 from django.urls import path
-from django.db import connection
+from django.db import connection, transaction
 
-from .models import HrAccessCode, HrResponse, Submission
+from . import access_index, notifications, provisioning, status_cache, webhooks
+from .models import (
+    HrAccessCode, HrResponse, IntakeApiToken, OutboxMessage, ReminderLog, Submission, WebhookDelivery,
+    WebhookEndpoint,
+)
 
 admin.site.site_header = "HR Dashboard"
 admin.site.site_title = "HR Dashboard"
@@ -85,7 +90,7 @@ admin.site.unregister(Group)
 @admin.register(HrAccessCode)
 class HrAccessCodeAdmin(admin.ModelAdmin):
     list_display = ("user", "access_code_display", "notification_email_display", "is_active_badge", "created_at")
-    list_filter = ("is_active", "created_at")
+    list_filter = ("is_active", "notification_mode", "created_at")
     search_fields = ("user__username", "user__email", "access_code")
     readonly_fields = ("access_code", "created_at", "updated_at")
     
@@ -105,7 +110,7 @@ class HrAccessCodeAdmin(admin.ModelAdmin):
         )
     notification_email_display.short_description = "Notification Email"
     list_per_page = 25
-    actions = ["generate_new_code", "activate_codes", "deactivate_codes"]
+    actions = ["generate_new_code", "rotate_codes_in_background", "activate_codes", "deactivate_codes", "create_api_tokens"]
     
     fieldsets = (
         ("HR User", {
@@ -113,8 +118,8 @@ class HrAccessCodeAdmin(admin.ModelAdmin):
             "description": "Each HR user gets a unique 6-digit access code. Employees use this code to submit feedback."
         }),
         ("Email Notifications", {
-            "fields": ("notification_email",),
-            "description": "Email address to receive notifications when employees submit feedback using this code. If empty, uses the user's email address."
+            "fields": ("notification_email", "notification_mode", "digest_interval_minutes"),
+            "description": "Email address to receive notifications when employees submit feedback using this code. If empty, uses the user's email address. Digests send one summary email instead of one email per submission."
         }),
         ("Status", {
             "fields": ("is_active",)
@@ -152,30 +157,83 @@ class HrAccessCodeAdmin(admin.ModelAdmin):
         """Generate new access codes for selected HR users."""
         count = 0
         for hr_code in queryset:
-            hr_code.access_code = HrAccessCode.generate_unique_code()
-            hr_code.save()
+            hr_code.rotate_code()
             count += 1
+        access_index.invalidate_on_commit()
         self.message_user(request, f"Generated new access codes for {count} HR user(s).")
     generate_new_code.short_description = "Generate new access code for selected"
     
+    def rotate_codes_in_background(self, request, queryset):
+        """Rotate access codes in bulk without holding up the admin request."""
+        ids = list(queryset.values_list("id", flat=True))
+        provisioning.create_rotation_job(ids)
+        self.message_user(request, f"Queued access code rotation for {len(ids)} HR user(s); run_provisioning will process it.")
+    rotate_codes_in_background.short_description = "Rotate access codes for selected (background, bulk)"
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        return [
+            path("provision/", self.admin_site.admin_view(self.provision_view), name="submissions_hraccesscode_provision"),
+        ] + urls
+    
+    def provision_view(self, request):
+        """Upload a CSV/JSONL of companies and provision them in the background."""
+        if not request.user.is_superuser:
+            from django.core.exceptions import PermissionDenied
+            raise PermissionDenied
+        if request.method == "POST" and request.FILES.get("file"):
+            upload = request.FILES["file"]
+            try:
+                data = upload.read().decode("utf-8-sig")
+            except UnicodeDecodeError:
+                self.message_user(request, f"{upload.name} is not a UTF-8 text file.", level=messages.ERROR)
+            else:
+                provisioning.create_provision_job(upload.name, data, rotate=bool(request.POST.get("rotate")))
+                self.message_user(request, f"Queued provisioning from {upload.name}; run_provisioning will process it.")
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Bulk provision HR tenants",
+            "jobs": provisioning.recent_jobs(),
+        }
+        return TemplateResponse(request, "admin/submissions/hraccesscode/provision.html", context)
+    
     def activate_codes(self, request, queryset):
         """Activate selected access codes."""
         queryset.update(is_active=True)
+        # queryset.update() skips post_save, so invalidate the shared index here
+        access_index.invalidate_on_commit()
         self.message_user(request, f"{queryset.count()} access code(s) activated.")
     activate_codes.short_description = "Activate selected access codes"
     
     def deactivate_codes(self, request, queryset):
         """Deactivate selected access codes."""
         queryset.update(is_active=False)
+        # queryset.update() skips post_save, so invalidate the shared index here
+        access_index.invalidate_on_commit()
         self.message_user(request, f"{queryset.count()} access code(s) deactivated.")
     deactivate_codes.short_description = "Deactivate selected access codes"
     
+    def create_api_tokens(self, request, queryset):
+        """Issue a batch submission API token per selected access code. Tokens are shown once."""
+        if not request.user.is_superuser:
+            self.message_user(request, "Only superusers can create API tokens.", level="error")
+            return
+        for hr_code in queryset:
+            _, token = IntakeApiToken.issue(hr_code, name=f"Issued by {request.user.username}")
+            self.message_user(request, f"API token for {hr_code.access_code} (copy it now, it will not be shown again): {token}")
+    create_api_tokens.short_description = "Create intake API token for selected"
+    
     def save_model(self, request, obj, form, change):
         """Auto-generate access code if creating new."""
         if not change:  # Creating new
             if not obj.access_code:
                 obj.access_code = HrAccessCode.generate_unique_code()
         super().save_model(request, obj, form, change)
+        if change and "notification_mode" in form.changed_data:
+            # What waited for the old schedule should not wait for the new one
+            flushed = notifications.flush_pending_digest(obj)
+            if flushed:
+                self.message_user(request, f"Sent a digest of {flushed} waiting submission(s) to {obj.get_notification_email()}.")
 
 
 # Custom User Admin for Authentication and Authorization
@@ -359,22 +417,33 @@ class SubmissionAdmin(admin.ModelAdmin):
             return format_html('<span style="color: #6b7280;">—</span>')
     hr_code_display.short_description = "HR Code"
     
+    def _set_status(self, request, queryset, status, label):
+        submissions = list(queryset)
+        previous = {s.id: s.status for s in submissions}
+        with transaction.atomic():
+            # update() skips auto_now; reminders measure age from updated_at
+            queryset.update(status=status, updated_at=timezone.now())
+            for submission in submissions:
+                submission.status = status
+            # queryset.update() skips post_save, so drop the cached status pages
+            # and queue the webhook events here
+            status_cache.invalidate_on_commit(*[s.receipt_code for s in submissions])
+            webhooks.status_changed(submissions, previous)
+        self.message_user(request, f"{len(submissions)} submission(s) marked as {label}.")
+
     def mark_as_in_review(self, request, queryset):
         """Mark selected submissions as in review."""
-        queryset.update(status=Submission.Status.IN_REVIEW)
-        self.message_user(request, f"{queryset.count()} submission(s) marked as In Review.")
+        self._set_status(request, queryset, Submission.Status.IN_REVIEW, "In Review")
     mark_as_in_review.short_description = "Mark selected as In Review"
     
     def mark_as_responded(self, request, queryset):
         """Mark selected submissions as responded."""
-        queryset.update(status=Submission.Status.RESPONDED)
-        self.message_user(request, f"{queryset.count()} submission(s) marked as Responded.")
+        self._set_status(request, queryset, Submission.Status.RESPONDED, "Responded")
     mark_as_responded.short_description = "Mark selected as Responded"
     
     def mark_as_closed(self, request, queryset):
         """Mark selected submissions as closed."""
-        queryset.update(status=Submission.Status.CLOSED)
-        self.message_user(request, f"{queryset.count()} submission(s) marked as Closed.")
+        self._set_status(request, queryset, Submission.Status.CLOSED, "Closed")
     mark_as_closed.short_description = "Mark selected as Closed"
     
     def save_model(self, request, obj, form, change):
@@ -675,3 +744,116 @@ class HrResponseAdmin(admin.ModelAdmin):
             obj.body
         )
     response_preview_field.short_description = "Preview"
+
+
+@admin.register(IntakeApiToken)
+class IntakeApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("token_prefix", "name", "hr_access_code", "is_active", "created_at", "last_used_at")
+    list_filter = ("is_active",)
+    search_fields = ("token_prefix", "name", "hr_access_code__access_code")
+    readonly_fields = ("hr_access_code", "token_prefix", "created_at", "last_used_at")
+    exclude = ("token_hash",)
+    actions = ["revoke_tokens"]
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        # Tokens are issued from the HR Access Codes list so the plaintext can be shown once
+        return False
+
+    def revoke_tokens(self, request, queryset):
+        """Deactivate selected tokens."""
+        count = queryset.update(is_active=False)
+        self.message_user(request, f"{count} API token(s) revoked.")
+    revoke_tokens.short_description = "Revoke selected tokens"
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "subject", "status", "attempts", "available_at", "created_at", "sent_at")
+    list_filter = ("status", "kind")
+    search_fields = ("subject",)
+    # Bodies can contain temporary passwords until they are sent
+    exclude = ("body",)
+    readonly_fields = [f.name for f in OutboxMessage._meta.fields if f.name != "body"]
+    actions = ["retry_now"]
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_now(self, request, queryset):
+        """Make selected unsent messages due immediately."""
+        count = queryset.exclude(status=OutboxMessage.Status.SENT).update(
+            status=OutboxMessage.Status.PENDING, available_at=timezone.now()
+        )
+        self.message_user(request, f"{count} message(s) queued for immediate delivery.")
+    retry_now.short_description = "Retry selected messages now"
+
+
+
+@admin.register(ReminderLog)
+class ReminderLogAdmin(admin.ModelAdmin):
+    list_display = ("hr_access_code", "created_at", "new_count", "in_review_count", "oldest_updated_at")
+    search_fields = ("hr_access_code__access_code",)
+    date_hierarchy = "created_at"
+    readonly_fields = [f.name for f in ReminderLog._meta.fields]
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ("url", "hr_access_code", "is_active", "last_success_at", "last_failure_at", "consecutive_failures")
+    list_filter = ("is_active",)
+    search_fields = ("url", "hr_access_code__access_code")
+    autocomplete_fields = ("hr_access_code",)
+    # The secret is generated on creation and shown here for the receiver's configuration
+    readonly_fields = ("secret", "created_at", "last_success_at", "last_failure_at", "consecutive_failures")
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return request.user.is_superuser
+
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "event", "endpoint", "status", "attempts", "available_at", "created_at", "sent_at")
+    list_filter = ("status", "event")
+    search_fields = ("endpoint__url", "event_id")
+    # Payloads contain submission text
+    exclude = ("payload",)
+    readonly_fields = [f.name for f in WebhookDelivery._meta.fields if f.name != "payload"]
+    actions = ["retry_now"]
+
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return False
+
+    def retry_now(self, request, queryset):
+        """Make selected undelivered events due immediately."""
+        count = queryset.exclude(status=WebhookDelivery.Status.SENT).update(
+            status=WebhookDelivery.Status.PENDING, available_at=timezone.now()
+        )
+        self.message_user(request, f"{count} event(s) queued for immediate delivery.")
+    retry_now.short_description = "Retry selected events now"
@@ -0,0 +1,321 @@
+"""
+Collision-free code allocators.
+
+Codes are produced by running a database counter through a keyed Feistel
+permutation: every counter value maps to a distinct code, so codes never
+repeat, while the key keeps the sequence unpredictable to anyone without it.
+
+Counters live in ``AllocatorCounter`` and are handed out to each process in
+blocks, so a process touches the database once per block rather than once per
+code. A block kept in memory must outlive the transaction that reserved it, so
+inside a transaction the counter is advanced on a separate autocommit
+connection. SQLite allows a single writer, and that connection would wait on
+the caller's own write lock; there, a reservation made inside a transaction
+covers only the values the call needs and is not kept, so a rollback undoes
+the advance and the values together.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+
+class FeistelPermutation:
+    """
+    Keyed bijection on ``range(half ** 2)``.
+
+    A value is split into two base-``half`` digits that are mixed by a balanced
+    Feistel network whose round function is keyed BLAKE2b.
+    """
+
+    def __init__(self, key: bytes, half: int, rounds: int = 8):
+        self.key = hashlib.blake2b(key, digest_size=32).digest()
+        self.half = half
+        self.size = half * half
+        self.rounds = rounds
+
+    def _round(self, i: int, value: int) -> int:
+        digest = hashlib.blake2b(f"{i}:{value}".encode(), key=self.key, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.half
+
+    def encrypt(self, value: int) -> int:
+        if not 0 <= value < self.size:
+            raise ValueError(f"{value} is outside the permutation domain")
+        left, right = divmod(value, self.half)
+        for i in range(self.rounds):
+            left, right = right, (left + self._round(i, right)) % self.half
+        return left * self.half + right
+
+    def decrypt(self, value: int) -> int:
+        if not 0 <= value < self.size:
+            raise ValueError(f"{value} is outside the permutation domain")
+        left, right = divmod(value, self.half)
+        for i in reversed(range(self.rounds)):
+            left, right = (right - self._round(i, left)) % self.half, left
+        return left * self.half + right
+
+
+def _reserve_on(connection, name: str, size: int) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE submissions_allocatorcounter SET value = value + %s WHERE name = %s RETURNING value",
+            [size, name],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Counter rows are seeded by migrations; recreate one that went missing
+            cursor.execute(
+                "INSERT INTO submissions_allocatorcounter (name, value) VALUES (%s, %s) RETURNING value",
+                [name, size],
+            )
+            row = cursor.fetchone()
+    return row[0] - size
+
+
+# Autocommit connections for reserving blocks while the caller is inside a
+# transaction, one per thread and database alias, kept open between blocks
+_side_connections = threading.local()
+
+
+def _side_connection(using: str):
+    pool = _side_connections.__dict__.setdefault("by_alias", {})
+    if using not in pool:
+        pool[using] = connections.create_connection(using)
+    return pool[using]
+
+
+def reservation_survives_rollback(using: str = "default") -> bool:
+    """Whether a block reserved now stays reserved if the caller's transaction rolls back."""
+    connection = connections[using]
+    return not connection.in_atomic_block or connection.vendor != "sqlite"
+
+
+def reserve_block(name: str, size: int, using: str = "default") -> int:
+    """
+    Atomically advance counter ``name`` by ``size`` and return the block start.
+
+    Inside a transaction on SQLite the advance is part of that transaction; see
+    ``reservation_survives_rollback``.
+    """
+    connection = connections[using]
+    if connection.in_atomic_block and connection.vendor != "sqlite":
+        # Reserve outside the caller's transaction: if the caller rolls back, the
+        # counter must stay advanced or another process would get the same block.
+        connection = _side_connection(using)
+        try:
+            return _reserve_on(connection, name, size)
+        except DatabaseError:
+            # Most likely the server dropped the idle connection; reconnect once.
+            # At worst a block reserved by the failed attempt goes unused.
+            connection.close()
+            return _reserve_on(connection, name, size)
+    return _reserve_on(connection, name, size)
+
+
+class BlockAllocator:
+    """Hands out permuted counter values, reserving counter blocks on demand."""
+
+    def __init__(self, name: str, permutation: FeistelPermutation, block_size: int):
+        self.name = name
+        self.permutation = permutation
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._exhausted = False
+
+    def next_value(self) -> int:
+        return self.values(1)[0]
+
+    def values(self, count: int) -> list:
+        """
+        Return ``count`` distinct permuted values, or fewer if the code space
+        runs out part way. Raises RuntimeError once no values are left.
+        """
+        out = []
+        with self._lock:
+            while len(out) < count:
+                if self._next >= self._end:
+                    if self._exhausted:
+                        break
+                    needed = count - len(out)
+                    keep = reservation_survives_rollback()
+                    size = max(self.block_size, needed) if keep else needed
+                    start = reserve_block(self.name, size)
+                    # Values past the code space are never handed out; once the
+                    # counter is there, stop reserving blocks altogether
+                    end = min(start + size, self.permutation.size)
+                    self._exhausted = end < start + size
+                    if not keep:
+                        out.extend(range(start, max(start, end)))
+                        continue
+                    self._next, self._end = start, end
+                take = min(self._end - self._next, count - len(out))
+                out.extend(range(self._next, self._next + take))
+                self._next += take
+        if not out:
+            raise RuntimeError(f"Allocator '{self.name}' has exhausted its code space.")
+        return [self.permutation.encrypt(v) for v in out]
+
+
+def _derive_key(purpose: str, configured: str) -> bytes:
+    return hashlib.sha256(f"{purpose}:{configured or settings.SECRET_KEY}".encode()).digest()
+
+
+class ReceiptCodeAllocator(BlockAllocator):
+    """10-digit receipt codes formatted as 12345-67890."""
+
+    def __init__(self):
+        super().__init__(
+            "receipt_code",
+            FeistelPermutation(_derive_key("receipt-codes", settings.RECEIPT_CODE_KEY), half=100_000),
+            block_size=settings.RECEIPT_CODE_BLOCK_SIZE,
+        )
+
+    @staticmethod
+    def format(value: int) -> str:
+        raw = f"{value:010d}"
+        return f"{raw[:5]}-{raw[5:]}"
+
+    def next_code(self) -> str:
+        return self.format(self.next_value())
+
+    def codes(self, count: int) -> list:
+        values = self.values(count)
+        if len(values) < count:
+            raise RuntimeError(f"Allocator '{self.name}' has exhausted its code space.")
+        return [self.format(v) for v in values]
+
+
+class AccessCodeAllocator(BlockAllocator):
+    """
+    6-digit HR access codes.
+
+    Fresh codes come from the permuted counter. Once all 1,000,000 have been
+    issued, codes returned through ``release()`` are reused, oldest first, after
+    ``ACCESS_CODE_REUSE_COOLDOWN_DAYS`` so a retired code cannot immediately
+    route an employee's feedback to a different company.
+    """
+
+    CAPACITY = 1_000_000
+
+    def __init__(self):
+        super().__init__(
+            "access_code",
+            FeistelPermutation(_derive_key("access-codes", settings.ACCESS_CODE_KEY), half=1000),
+            block_size=settings.ACCESS_CODE_BLOCK_SIZE,
+        )
+        # Fresh codes already checked against existing ones, handed out first
+        self._vetted = []
+        self._vetted_lock = threading.Lock()
+
+    def allocate(self) -> str:
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count: int) -> list:
+        """
+        Return ``count`` unused codes.
+
+        Fresh codes are checked against existing ones a block at a time, so most
+        calls need no query at all; a new block costs the counter update and one
+        collision query.
+        """
+        codes = []
+        with self._vetted_lock:
+            while len(codes) < count:
+                if not self._vetted:
+                    try:
+                        self._vetted = self._vet(self.values(max(self.block_size, count - len(codes))))
+                    except RuntimeError:
+                        codes.extend(self._reuse_released(count - len(codes)))
+                        break
+                take = count - len(codes)
+                codes.extend(self._vetted[:take])
+                del self._vetted[:take]
+        return codes
+
+    @staticmethod
+    def _vet(values) -> list:
+        from .models import HrAccessCode, ReleasedAccessCode
+
+        candidates = [f"{v:06d}" for v in values]
+        # Fresh codes never repeat, but may still match codes issued randomly
+        # before the allocator existed (or released ones among them). Those never
+        # become free again, so a block checked once stays valid.
+        taken = set(
+            HrAccessCode.objects.filter(access_code__in=candidates).values_list("access_code", flat=True).union(
+                ReleasedAccessCode.objects.filter(code__in=candidates).values_list("code", flat=True)
+            )
+        )
+        return [c for c in candidates if c not in taken]
+
+    def _reuse_released(self, count: int) -> list:
+        from .models import ReleasedAccessCode
+
+        cutoff = timezone.now() - timedelta(days=settings.ACCESS_CODE_REUSE_COOLDOWN_DAYS)
+        with transaction.atomic():
+            rows = list(
+                ReleasedAccessCode.objects.select_for_update(skip_locked=True)
+                .filter(released_at__lte=cutoff)
+                .order_by("released_at")
+                .values_list("id", "code")[:count]
+            )
+            if len(rows) < count:
+                raise RuntimeError("No HR access codes are available; the 6-digit code space is exhausted.")
+            ReleasedAccessCode.objects.filter(id__in=[row[0] for row in rows]).delete()
+        return [row[1] for row in rows]
+
+    @staticmethod
+    def release(*codes: str) -> None:
+        """Return codes that are no longer assigned to the reuse pool."""
+        from .models import ReleasedAccessCode
+
+        ReleasedAccessCode.objects.bulk_create(
+            [ReleasedAccessCode(code=c) for c in codes if c and len(c) == 6 and c.isdigit()],
+            ignore_conflicts=True,
+        )
+
+    def stats(self) -> dict:
+        """Occupancy of the 6-digit code space."""
+        from .models import AllocatorCounter, HrAccessCode, ReleasedAccessCode
+
+        issued = AllocatorCounter.objects.filter(name=self.name).values_list("value", flat=True).first() or 0
+        issued = min(issued, self.CAPACITY)
+        cutoff = timezone.now() - timedelta(days=settings.ACCESS_CODE_REUSE_COOLDOWN_DAYS)
+        assigned = HrAccessCode.objects.count()
+        return {
+            "capacity": self.CAPACITY,
+            "assigned": assigned,
+            "active": HrAccessCode.objects.filter(is_active=True).count(),
+            "fresh_issued": issued,
+            "fresh_remaining": self.CAPACITY - issued,
+            "released": ReleasedAccessCode.objects.count(),
+            "reusable_now": ReleasedAccessCode.objects.filter(released_at__lte=cutoff).count(),
+            "occupancy": assigned / self.CAPACITY,
+        }
+
+
+_receipt_allocator = None
+_access_code_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def receipt_allocator() -> ReceiptCodeAllocator:
+    global _receipt_allocator
+    if _receipt_allocator is None:
+        with _allocator_lock:
+            if _receipt_allocator is None:
+                _receipt_allocator = ReceiptCodeAllocator()
+    return _receipt_allocator
+
+
+def access_code_allocator() -> AccessCodeAllocator:
+    global _access_code_allocator
+    if _access_code_allocator is None:
+        with _allocator_lock:
+            if _access_code_allocator is None:
+                _access_code_allocator = AccessCodeAllocator()
+    return _access_code_allocator
@@ -0,0 +1,173 @@
+"""
+JSON API endpoints for kiosks and HRIS integrations.
+"""
+import html
+import json
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from anonplatform import metrics
+
+from . import intake, status_cache, webhooks
+from .allocators import receipt_allocator
+from .models import IntakeApiToken, Submission
+from .notifications import initial_notified_at, notify_new_submissions_batch
+from .views import validate_receipt_code, validate_submission
+
+logger = logging.getLogger(__name__)
+
+
+def _error(message: str, status: int) -> JsonResponse:
+    return JsonResponse({"error": message}, status=status)
+
+
+def _authenticate(request: HttpRequest):
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if not header.startswith("Bearer "):
+        return None
+    token_hash = IntakeApiToken.hash_token(header[len("Bearer "):].strip())
+    return (
+        IntakeApiToken.objects.select_related("hr_access_code__user")
+        .filter(token_hash=token_hash, is_active=True, hr_access_code__is_active=True)
+        .first()
+    )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def submit_batch(request: HttpRequest) -> JsonResponse:
+    """
+    Create many submissions for one access code in a single transaction.
+
+    Request:  {"access_code": "123456", "submissions": [{"type", "title", "body"}, ...]}
+    Response: {"created": n, "failed": m, "results": [{"index", "receipt_code"} | {"index", "errors"}]}
+    """
+    token = _authenticate(request)
+    if token is None:
+        return _error("Missing or invalid API token.", 401)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return _error("Request body must be JSON.", 400)
+    if not isinstance(payload, dict) or not isinstance(payload.get("submissions"), list):
+        return _error('Expected an object with a "submissions" array.', 400)
+
+    hr_code = token.hr_access_code
+    if str(payload.get("access_code", "")).strip() != hr_code.access_code:
+        return _error("Access code does not match this API token.", 403)
+
+    items = payload["submissions"]
+    max_batch = settings.SUBMISSION_API_MAX_BATCH
+    if len(items) > max_batch:
+        return _error(f"At most {max_batch} submissions per request.", 413)
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "errors": ["Each submission must be an object."]}
+            continue
+        submission_type, title, body, errors = validate_submission(
+            str(item.get("type") or "").upper(), str(item.get("title") or ""), str(item.get("body") or "")
+        )
+        if errors:
+            results[index] = {"index": index, "errors": errors}
+            continue
+        valid.append((index, Submission(
+            type=submission_type,
+            title=html.unescape(title),  # Store unescaped in DB
+            body=html.unescape(body),
+            hr_access_code=hr_code,
+            notified_at=initial_notified_at(hr_code),
+        )))
+
+    created = []
+    if valid:
+        for attempt in range(3):
+            for (_, submission), code in zip(valid, receipt_allocator().codes(len(valid))):
+                submission.receipt_code = code
+            try:
+                with transaction.atomic():
+                    created = Submission.objects.bulk_create([s for _, s in valid])
+                    # bulk_create skips post_save; drop "not found" entries from status lookups
+                    status_cache.invalidate_on_commit(*[s.receipt_code for s in created])
+                    recipient = hr_code.get_notification_email()
+                    notify_new_submissions_batch(
+                        created,
+                        [recipient] if recipient else [],
+                        admin_url=request.build_absolute_uri("/admin/submissions/submission/"),
+                    )
+                    webhooks.submissions_created(created)
+                    metrics.submissions_created(len(created))
+                break
+            except IntegrityError:
+                metrics.receipt_collision()
+                # Only possible against legacy random receipt codes; retry with new ones
+                if attempt == 2:
+                    logger.exception("Batch submission insert failed for access code id %s", hr_code.id)
+                    return _error("Could not store submissions. Please retry.", 503)
+        for index, submission in valid:
+            results[index] = {"index": index, "receipt_code": submission.receipt_code}
+
+    IntakeApiToken.objects.filter(id=token.id).update(last_used_at=timezone.now())
+
+    return JsonResponse({
+        "created": len(created),
+        "failed": len(items) - len(created),
+        "results": results,
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def status_batch(request: HttpRequest) -> JsonResponse:
+    """
+    Look up several receipt codes at once.
+
+    Request:  {"receipt_codes": ["12345-67890", ...]}
+    Response: {"results": [{"receipt_code", "status", "type", "title", "response"}
+                           | {"receipt_code", "found": false} | {"receipt_code", "error"}]}
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return _error("Request body must be JSON.", 400)
+    codes = payload.get("receipt_codes") if isinstance(payload, dict) else None
+    if not isinstance(codes, list):
+        return _error('Expected an object with a "receipt_codes" array.', 400)
+    max_codes = settings.STATUS_API_MAX_CODES
+    if len(codes) > max_codes:
+        return _error(f"At most {max_codes} receipt codes per request.", 413)
+
+    codes = [str(code).strip().replace(" ", "") for code in codes]
+    valid = [code for code in codes if validate_receipt_code(code)]
+    found = status_cache.get_statuses(valid)
+
+    results = []
+    for code in codes:
+        if not validate_receipt_code(code):
+            results.append({"receipt_code": code, "error": "Invalid receipt code format."})
+            continue
+        dto = found.get(code)
+        if dto is None and intake.is_enabled():
+            # Accepted but not flushed yet in queued intake mode
+            pending = intake.find_pending(code)
+            dto = status_cache.to_dto(pending) if pending else None
+        if dto is None:
+            results.append({"receipt_code": code, "found": False})
+            continue
+        results.append({
+            "receipt_code": code,
+            "status": dto["status"],
+            "type": dto["type_display"],
+            "title": dto["title"],
+            "response": dto["response"],
+        })
+    return JsonResponse({"results": results})
@@ -0,0 +1,197 @@
+"""
+Native async versions of the employee intake pages for ASGI deployments.
+
+With ``SUBMISSION_ASYNC_VIEWS = True`` the ``submit``, ``submitted`` and
+``status`` URLs route here instead of to views.py. Validation and templates are
+shared with the sync views; lookups go through the async ORM and cache APIs
+(file or database work that has no async API runs in a thread), and the submission
+is created together with its outbox notification (outbox.py) in one
+transaction, so the response never waits on the email provider. Serve with an
+ASGI server, e.g.
+
+    gunicorn anonplatform.asgi:application -k uvicorn.workers.UvicornWorker
+
+Under WSGI these views still work, but every request pays for an event loop.
+"""
+import html
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_http_methods
+
+from . import access_index, code_filter, idempotency, intake, status_cache
+from .models import HrAccessCode, Submission
+from .notifications import initial_notified_at, notify_new_submission
+from .views import validate_receipt_code, validate_submission
+
+logger = logging.getLogger(__name__)
+
+
+async def _find_active_hr_code(access_code: str):
+    """Resolve an active access code and its notification email (or (None, None))."""
+    try:
+        # Lookups are mmap reads; the wrapper covers the occasional index rebuild
+        entry = await sync_to_async(access_index.lookup)(access_code)
+        if entry is None:
+            await code_filter.counters.aincr("access_filtered")
+            return None, None
+        return entry.to_model(), entry.notification_email
+    except access_index.IndexUnavailable:
+        pass
+
+    if await code_filter.aaccess_code_known_invalid(access_code):
+        return None, None
+    await code_filter.counters.aincr("access_db_checked")
+    try:
+        hr_code = await HrAccessCode.objects.only(
+            "id", "access_code", "notification_email", "notification_mode", "is_active", "user_id"
+        ).aget(access_code=access_code, is_active=True)
+    except HrAccessCode.DoesNotExist:
+        await code_filter.aremember_invalid_access_code(access_code)
+        return None, None
+    email = hr_code.notification_email or await User.objects.filter(id=hr_code.user_id).values_list(
+        "email", flat=True
+    ).afirst()
+    return hr_code, email
+
+
+@sync_to_async
+def _create_and_notify(submission_kwargs, recipient_emails, site_url: str) -> Submission:
+    # Transactions are per-thread, so the whole unit runs in one sync call
+    with transaction.atomic():
+        s = Submission.create_with_unique_receipt(
+            notified_at=initial_notified_at(submission_kwargs["hr_access_code"]), **submission_kwargs
+        )
+        notify_new_submission(
+            s,
+            recipient_emails,
+            admin_url=f"{site_url.rstrip('/')}/admin/submissions/submission/{s.id}/change/",
+        )
+    return s
+
+
+@require_http_methods(["GET", "POST"])
+async def submit(request: HttpRequest) -> HttpResponse:
+    if request.method == "GET":
+        return render(request, "submissions/submit.html")
+
+    access_code = (request.POST.get("access_code") or "").strip()
+    hr_code, hr_email = await _find_active_hr_code(access_code)
+    if not hr_code:
+        return render(
+            request,
+            "submissions/submit.html",
+            {
+                "error": "Invalid access code. Please check and try again.",
+                "access_code": access_code,
+            },
+            status=400,
+        )
+
+    submission_type, title, body, errors = validate_submission(
+        request.POST.get("type"), request.POST.get("title"), request.POST.get("body")
+    )
+    if errors:
+        return render(
+            request,
+            "submissions/submit.html",
+            {
+                "error": " ".join(errors),
+                "access_code": access_code,
+                "submission_type": submission_type,
+                "title": html.unescape(title) if title else "",
+                "body": html.unescape(body) if body else "",
+            },
+            status=400,
+        )
+
+    submission_kwargs = {
+        "type": submission_type,
+        "title": html.unescape(title),  # Store unescaped in DB
+        "body": html.unescape(body),  # Store unescaped in DB
+        "hr_access_code": hr_code,
+    }
+    recipient_emails = [hr_email] if hr_email else []
+
+    # A repeated POST of the same form (double-click, retry) gets the first receipt
+    idempotency_key = request.POST.get(idempotency.FIELD_NAME)
+    claimed, previous = await idempotency.aclaim("submit", idempotency_key)
+    if previous is not None:
+        await request.session.aset("last_receipt_code", previous["receipt_code"])
+        return redirect("submissions:submitted")
+    if not claimed:
+        return render(
+            request,
+            "submissions/submit.html",
+            {"error": "Your submission is still being processed. Please wait a moment and check again."},
+            status=409,
+        )
+
+    try:
+        if intake.is_enabled():
+            s = await sync_to_async(intake.enqueue)(
+                site_url=request.build_absolute_uri("/"), notify=recipient_emails, **submission_kwargs
+            )
+        else:
+            s = await _create_and_notify(submission_kwargs, recipient_emails, request.build_absolute_uri("/"))
+    except Exception as e:
+        await idempotency.arelease("submit", idempotency_key)
+        logger.exception("Error creating submission: %s: %s", type(e).__name__, e)
+        return render(
+            request,
+            "submissions/submit.html",
+            {
+                "error": "An error occurred while submitting. Please try again.",
+                "access_code": access_code,
+            },
+            status=500,
+        )
+
+    await idempotency.acomplete("submit", idempotency_key, {"receipt_code": s.receipt_code})
+    await request.session.aset("last_receipt_code", s.receipt_code)
+    return redirect("submissions:submitted")
+
+
+async def submitted(request: HttpRequest) -> HttpResponse:
+    receipt_code = await request.session.aget("last_receipt_code")
+    return render(request, "submissions/submitted.html", {"receipt_code": receipt_code})
+
+
+@require_http_methods(["GET", "POST"])
+async def status_lookup(request: HttpRequest) -> HttpResponse:
+    if request.method == "GET":
+        return render(request, "submissions/status_lookup.html")
+
+    receipt_code = (request.POST.get("receipt_code") or "").strip().replace(" ", "")
+    if not validate_receipt_code(receipt_code):
+        return render(
+            request,
+            "submissions/status_lookup.html",
+            {
+                "error": "Invalid receipt code format. It should be 10 digits (e.g., 12345-67890).",
+                "receipt_code": receipt_code,
+            },
+            status=400,
+        )
+
+    submission = await status_cache.aget_status(receipt_code)
+    if submission is None and intake.is_enabled():
+        # Accepted but not flushed yet in queued intake mode
+        pending = await sync_to_async(intake.find_pending)(receipt_code)
+        submission = status_cache.to_dto(pending) if pending else None
+    if submission is None:
+        return render(
+            request,
+            "submissions/status_lookup.html",
+            {
+                "error": "Receipt code not found. Please double-check your code and try again.",
+                "receipt_code": receipt_code,
+            },
+            status=404,
+        )
+
+    return render(request, "submissions/status_result.html", {"submission": submission})
@@ -0,0 +1,262 @@
+"""
+Cheap rejection of access codes and receipt codes that cannot exist.
+
+Enumeration attempts guess codes at random, and without a filter every guess
+costs a database query. Before anything touches the database:
+
+* Access codes are answered by the shared access index (access_index.py),
+  which is an exact membership structure for active codes. When the index is
+  unavailable, codes that were just looked up and not found are remembered in
+  a short-TTL negative cache.
+* Receipt codes are decrypted with the receipt allocator's permutation. A
+  code whose counter value is below the allocator's high-water mark (plus
+  slack for blocks reserved since it was read) may exist; anything else
+  could only be a legacy random code from before the allocator. Those are
+  checked against a Bloom filter of the legacy codes, which
+  ``manage.py build_code_filter`` writes to ``CODE_FILTER_PATH`` before the
+  workers start (see the Procfile). Legacy codes are a closed set, so the
+  file never goes stale; workers only re-read it when its mtime changes.
+  Without the file, such codes are let through to the database. Receipt
+  codes that were looked up and not found are remembered by status_cache.
+
+``counters`` records how many lookups were filtered, answered from a
+negative cache, or checked against the database.
+"""
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from anonplatform import timing
+
+from .allocators import receipt_allocator
+from .counters import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+ACCESS_MISSING_PREFIX = "access-missing:"
+
+# Codes the allocator may have issued since the high-water mark was last read
+HIGH_WATER_SLACK = 1_000_000
+HIGH_WATER_MIN_REREAD_SECONDS = 1.0
+
+counters = SharedCounters(
+    "code-filter",
+    (
+        "access_filtered", "access_negative_cached", "access_db_checked",
+        "receipt_filtered", "receipt_negative_cached", "receipt_db_checked",
+    ),
+)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one BLAKE2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1000)
+        self.size = int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_bytes(self) -> bytes:
+        return BLOOM_HEADER.pack(BLOOM_MAGIC, self.capacity, self.size, self.hashes, self.count) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, capacity, size, hashes, count = BLOOM_HEADER.unpack_from(data, 0)
+        if magic != BLOOM_MAGIC or len(data) != BLOOM_HEADER.size + (size + 7) // 8:
+            raise ValueError("not a receipt code filter file")
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.size, bloom.hashes, bloom.count = capacity, size, hashes, count
+        bloom.bits = bytearray(data[BLOOM_HEADER.size:])
+        return bloom
+
+
+# magic, capacity, size in bits, hash count, item count
+BLOOM_HEADER = struct.Struct("<8sQQII")
+BLOOM_MAGIC = b"RCBLOOM1"
+
+
+def _decode_counter(receipt_code: str) -> Optional[int]:
+    """The allocator counter value behind ``receipt_code``, or None if it has none."""
+    try:
+        return receipt_allocator().permutation.decrypt(int(receipt_code.replace("-", "")))
+    except ValueError:
+        return None
+
+
+def _read_high_water() -> int:
+    from .models import AllocatorCounter
+
+    return AllocatorCounter.objects.filter(name=receipt_allocator().name).values_list("value", flat=True).first() or 0
+
+
+class ReceiptCodeFilter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._high_water = 0
+        self._high_water_read_at = 0.0
+        self._legacy: Optional[BloomFilter] = None
+        self._legacy_mtime = None
+        self._legacy_checked_at = 0.0
+
+    def may_exist(self, receipt_code: str) -> bool:
+        counter = _decode_counter(receipt_code)
+        if counter is not None:
+            if counter < self._high_water + HIGH_WATER_SLACK:
+                return True
+            # Far beyond what we last saw; the counter may have jumped since then
+            if time.monotonic() - self._high_water_read_at >= HIGH_WATER_MIN_REREAD_SECONDS:
+                with self._lock:
+                    self._high_water = _read_high_water()
+                    self._high_water_read_at = time.monotonic()
+                if counter < self._high_water + HIGH_WATER_SLACK:
+                    return True
+        legacy = self._legacy_codes()
+        return legacy is None or receipt_code in legacy
+
+    def _legacy_codes(self) -> Optional[BloomFilter]:
+        if time.monotonic() - self._legacy_checked_at < settings.CODE_FILTER_REFRESH_SECONDS:
+            return self._legacy
+        with self._lock:
+            self._legacy_checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._legacy_mtime:
+                    with open(self.path, "rb") as f:
+                        self._legacy = BloomFilter.from_bytes(f.read())
+                    self._legacy_mtime = mtime
+            except (OSError, ValueError, struct.error) as e:
+                if self._legacy is not None or self._legacy_mtime is None:
+                    logger.warning("Receipt code filter unavailable at %s: %s", self.path, e)
+                self._legacy, self._legacy_mtime = None, False
+        return self._legacy
+
+
+def build(path: Optional[str] = None) -> int:
+    """
+    Write the Bloom filter of receipt codes the allocator did not issue to
+    ``path`` (default ``CODE_FILTER_PATH``) and return how many it holds.
+    """
+    from .models import Submission
+
+    path = path or settings.CODE_FILTER_PATH
+    # Read the mark first: every code issued after this point is below it
+    high_water = _read_high_water()
+    legacy = []
+    for receipt_code in Submission.objects.values_list("receipt_code", flat=True).iterator(chunk_size=10000):
+        counter = _decode_counter(receipt_code)
+        if counter is None or counter >= high_water:
+            legacy.append(receipt_code)
+    bloom = BloomFilter(capacity=len(legacy) * 2)
+    for receipt_code in legacy:
+        bloom.add(receipt_code)
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".rcfilter-", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(bloom.to_bytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(legacy)
+
+
+_receipt_filter = None
+_filter_lock = threading.Lock()
+
+
+def _get_receipt_filter() -> ReceiptCodeFilter:
+    global _receipt_filter
+    if _receipt_filter is None:
+        with _filter_lock:
+            if _receipt_filter is None:
+                _receipt_filter = ReceiptCodeFilter(settings.CODE_FILTER_PATH)
+    return _receipt_filter
+
+
+def receipt_may_exist(receipt_code: str) -> bool:
+    """False only for receipt codes that are certainly not in the database."""
+    if not settings.CODE_FILTER_ENABLED:
+        return True
+    if _get_receipt_filter().may_exist(receipt_code):
+        return True
+    counters.incr("receipt_filtered")
+    return False
+
+
+def access_code_known_invalid(access_code: str) -> bool:
+    """True if ``access_code`` was looked up recently and no active code matched."""
+    if not settings.CODE_FILTER_ENABLED:
+        return False
+    if caches["status"].get(f"{ACCESS_MISSING_PREFIX}{access_code}") is None:
+        timing.cache_result(misses=1)
+        return False
+    timing.cache_result(hits=1)
+    counters.incr("access_negative_cached")
+    return True
+
+
+async def aaccess_code_known_invalid(access_code: str) -> bool:
+    """Async counterpart of access_code_known_invalid for the ASGI views."""
+    if not settings.CODE_FILTER_ENABLED:
+        return False
+    if await caches["status"].aget(f"{ACCESS_MISSING_PREFIX}{access_code}") is None:
+        timing.cache_result(misses=1)
+        return False
+    timing.cache_result(hits=1)
+    await counters.aincr("access_negative_cached")
+    return True
+
+
+def remember_invalid_access_code(access_code: str) -> None:
+    if settings.CODE_FILTER_ENABLED:
+        caches["status"].set(f"{ACCESS_MISSING_PREFIX}{access_code}", "missing", settings.CODE_FILTER_NEGATIVE_TTL)
+
+
+async def aremember_invalid_access_code(access_code: str) -> None:
+    if settings.CODE_FILTER_ENABLED:
+        await caches["status"].aset(
+            f"{ACCESS_MISSING_PREFIX}{access_code}", "missing", settings.CODE_FILTER_NEGATIVE_TTL
+        )
+
+
+def forget_invalid_access_codes(*access_codes: str) -> None:
+    if settings.CODE_FILTER_ENABLED and access_codes:
+        caches["status"].delete_many([f"{ACCESS_MISSING_PREFIX}{code}" for code in access_codes])
+
+
+def stats() -> dict:
+    totals = counters.snapshot()
+    for kind in ("access", "receipt"):
+        checked = totals[f"{kind}_db_checked"]
+        avoided = totals[f"{kind}_filtered"] + totals[f"{kind}_negative_cached"]
+        totals[f"{kind}_avoided_rate"] = avoided / (avoided + checked) if avoided + checked else 0.0
+    totals["enabled"] = settings.CODE_FILTER_ENABLED
+    return totals
@@ -0,0 +1,71 @@
+"""
+Lightweight operational counters shared by all workers.
+
+Increments are kept per process and added to counters in the shared
+``counters`` cache every ``flush_every`` increments, so the hot path never waits on the cache. Totals
+are therefore approximate by up to ``flush_every`` per process. Async views
+use ``aincr``, which runs that occasional cache write in a thread.
+
+The counters are stored without a timeout, so they must not share a cache that
+culls when full (such as ``status``): culling deletes keys at random, running
+totals included.
+"""
+import threading
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+
+class SharedCounters:
+    def __init__(self, prefix: str, names, alias: str = "counters", flush_every: int = 100):
+        self.prefix = prefix
+        self.names = tuple(names)
+        self.alias = alias
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = Counter()
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def _take_if_due(self, name: str, amount: int):
+        with self._lock:
+            self._pending[name] += amount
+            if sum(self._pending.values()) < self.flush_every:
+                return None
+            pending, self._pending = self._pending, Counter()
+        return pending
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        pending = self._take_if_due(name, amount)
+        if pending:
+            self._add(pending)
+
+    async def aincr(self, name: str, amount: int = 1) -> None:
+        pending = self._take_if_due(name, amount)
+        if pending:
+            await sync_to_async(self._add, thread_sensitive=False)(pending)
+
+    def _add(self, pending: Counter) -> None:
+        cache = caches[self.alias]
+        for name, value in pending.items():
+            if not value:
+                continue
+            try:
+                if not cache.add(self._key(name), value, timeout=None):
+                    cache.incr(self._key(name), value)
+            except ValueError:
+                # Counter evicted between add() and incr(); losing one batch is fine
+                pass
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        self._add(pending)
+
+    def snapshot(self) -> dict:
+        """Totals across all workers, including this process's unflushed counts."""
+        self.flush()
+        values = caches[self.alias].get_many([self._key(name) for name in self.names])
+        return {name: values.get(self._key(name), 0) for name in self.names}
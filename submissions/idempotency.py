@@ -0,0 +1,105 @@
+"""
+Idempotency keys for the submit and HR registration forms.
+
+Each form render carries a fresh random key (``{% idempotency_field %}``). A POST
+claims its key by inserting an IdempotencyKey row before writing anything, and
+stores a small result on that row when it succeeds. A double-click or a mobile
+retry with the same key then replays that result (the same receipt, the same
+registration page) instead of inserting, hashing a password or queueing an
+email again. A request that arrives while the first is still running is told so
+at once (the views answer 409) rather than waiting for it. Failed attempts
+release the key so the user can simply resubmit.
+
+Claims live in the database because its primary key makes the claim atomic
+across every worker and host, and because a cache that culls or evicts entries
+could forget a claim and let the duplicate through. Rows older than
+``IDEMPOTENCY_TTL`` are deleted by ``purge_expired``, which ``run_outbox``
+calls hourly.
+"""
+import re
+import uuid
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+FIELD_NAME = "idempotency_key"
+KEY_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_key() -> str:
+    return uuid.uuid4().hex
+
+
+def _claim_key(scope: str, key: Optional[str]) -> Optional[str]:
+    if not settings.IDEMPOTENCY_ENABLED or not key or not KEY_PATTERN.match(key):
+        # Missing or malformed (e.g. a form rendered before keys existed): no protection
+        return None
+    return f"{scope}:{key}"
+
+
+def claim(scope: str, key: Optional[str]) -> Tuple[bool, Optional[dict]]:
+    """
+    Returns (claimed, previous result). ``claimed`` means go ahead and call
+    ``complete()`` or ``release()`` afterwards; otherwise replay the previous
+    result, or report that the first request is still in progress if it is None.
+    """
+    from .models import IdempotencyKey
+
+    claim_key = _claim_key(scope, key)
+    if claim_key is None:
+        return True, None
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=claim_key)
+            return True, None
+        except IntegrityError:
+            pass
+        row = IdempotencyKey.objects.filter(key=claim_key).values("result", "claimed_at").first()
+        if row is None:
+            # Released in the meantime
+            continue
+        now = timezone.now()
+        ttl = settings.IDEMPOTENCY_TTL if row["result"] is not None else settings.IDEMPOTENCY_PENDING_TTL
+        if row["claimed_at"] >= now - timedelta(seconds=ttl):
+            return False, row["result"]
+        # An expired result, or the claim of a request that died: take it over
+        # unless another request just did
+        taken = IdempotencyKey.objects.filter(key=claim_key, claimed_at=row["claimed_at"]).update(
+            result=None, claimed_at=now
+        )
+        return bool(taken), None
+    return False, None
+
+
+def complete(scope: str, key: Optional[str], result: dict) -> None:
+    from .models import IdempotencyKey
+
+    claim_key = _claim_key(scope, key)
+    if claim_key is not None:
+        IdempotencyKey.objects.filter(key=claim_key).update(result=result)
+
+
+def release(scope: str, key: Optional[str]) -> None:
+    from .models import IdempotencyKey
+
+    claim_key = _claim_key(scope, key)
+    if claim_key is not None:
+        IdempotencyKey.objects.filter(key=claim_key, result__isnull=True).delete()
+
+
+aclaim = sync_to_async(claim)
+acomplete = sync_to_async(complete)
+arelease = sync_to_async(release)
+
+
+def purge_expired() -> int:
+    from .models import IdempotencyKey
+
+    cutoff = timezone.now() - timedelta(seconds=max(settings.IDEMPOTENCY_TTL, settings.IDEMPOTENCY_PENDING_TTL))
+    deleted, _ = IdempotencyKey.objects.filter(claimed_at__lt=cutoff).delete()
+    return deleted
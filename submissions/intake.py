@@ -0,0 +1,192 @@
+"""
+Write-behind intake for submissions.
+
+With ``SUBMISSION_INTAKE_MODE = "queued"`` the submit view does not create the
+Submission itself. It reserves a receipt code and stores the validated
+submission as one narrow IntakeEntry row, and ``manage.py flush_intake``
+creates the submissions in batches with ``bulk_create`` and queues the HR
+notifications and webhook events.
+
+The staging table is in the database rather than on local disk because the
+flusher usually runs in its own container (a separate Procfile process on
+Railway or Heroku), which cannot see the web containers' files, and because a
+web container's disk does not survive a redeploy.
+
+Each flusher claims a batch with ``select_for_update(skip_locked=True)``,
+creates the submissions and deletes the claimed entries in one transaction,
+so several flushers never take the same entries, and a flusher that dies
+mid-batch leaves them to be claimed again.
+
+Until an entry is flushed, ``find_pending`` lets status lookups resolve the
+receipt from the staging table.
+
+A queued POST costs one single-row INSERT into the staging table and nothing
+else: the receipt code comes from an allocator block already in memory, and
+the Submission row, its indexes, the outbox message and the webhook events
+are written later, hundreds at a time. That INSERT is what makes the receipt
+shown to the employee durable, so it cannot be deferred further.
+
+Allocated receipt codes never repeat, so the POST does not check them. A code
+that collides with a legacy random one is found at flush time; that entry gets
+a fresh code (logged at error level with both codes) rather than being dropped.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from anonplatform import metrics
+
+from . import status_cache, webhooks
+from .allocators import receipt_allocator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FlushResult:
+    rows: int = 0
+    batches: List[int] = field(default_factory=list)
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+
+    @property
+    def avg_lag(self) -> float:
+        return self.total_lag / self.rows if self.rows else 0.0
+
+
+def is_enabled() -> bool:
+    return settings.SUBMISSION_INTAKE_MODE == "queued"
+
+
+def reserve_receipt_code() -> str:
+    """Reserve a receipt code from the allocator (no query within a block)."""
+    return receipt_allocator().next_code()
+
+
+def _replacement_code(taken) -> str:
+    """A fresh receipt code for an entry whose code a legacy submission already has."""
+    from .models import IntakeEntry, Submission
+
+    for _ in range(10):
+        code = reserve_receipt_code()
+        if (
+            code not in taken
+            and not Submission.objects.filter(receipt_code=code).exists()
+            and not IntakeEntry.objects.filter(receipt_code=code).exists()
+        ):
+            return code
+    raise RuntimeError("Failed to generate unique receipt code after multiple attempts.")
+
+
+def enqueue(*, site_url: str, notify: Iterable[str] = (), **fields):
+    """
+    Stage a validated submission for flush_intake and return an unsaved
+    Submission carrying its reserved receipt code.
+    """
+    from .models import IntakeEntry, Submission
+
+    hr_access_code = fields.pop("hr_access_code", None)
+    if hr_access_code is not None:
+        fields["hr_access_code_id"] = hr_access_code.pk
+    receipt_code = reserve_receipt_code()
+    IntakeEntry.objects.create(
+        receipt_code=receipt_code,
+        record={"site_url": site_url, "notify": list(notify), "fields": fields},
+    )
+    return Submission(receipt_code=receipt_code, **fields)
+
+
+def find_pending(receipt_code: str):
+    """Return an unsaved Submission for a staged, not yet flushed receipt code."""
+    from .models import IntakeEntry, Submission
+
+    entry = IntakeEntry.objects.filter(receipt_code=receipt_code).first()
+    if entry is None:
+        return None
+    return Submission(receipt_code=entry.receipt_code, **entry.record["fields"])
+
+
+def pending_count() -> int:
+    from .models import IntakeEntry
+
+    return IntakeEntry.objects.count()
+
+
+def flush(batch_size: Optional[int] = None) -> FlushResult:
+    """Create the staged submissions in batches and queue the deferred notifications."""
+    from .models import HrAccessCode, IntakeEntry, Submission
+    from .notifications import initial_notified_at, notify_new_submission
+
+    batch_size = batch_size or settings.SUBMISSION_INTAKE_BATCH_SIZE
+    result = FlushResult()
+
+    while True:
+        with transaction.atomic():
+            entries = list(
+                IntakeEntry.objects.select_for_update(skip_locked=True).order_by("id")[:batch_size]
+            )
+            if not entries:
+                break
+            codes = {e.id: e.receipt_code for e in entries}
+            # Legacy random receipt codes are not known to the allocator
+            existing = set(
+                Submission.objects.filter(receipt_code__in=codes.values()).values_list("receipt_code", flat=True)
+            )
+            for e in entries:
+                if e.receipt_code in existing:
+                    codes[e.id] = _replacement_code(set(codes.values()))
+                    logger.error(
+                        "Receipt code %s of staged submission %s already exists; created it as %s instead",
+                        e.receipt_code, e.id, codes[e.id],
+                    )
+            # Notification modes decide notified_at in the INSERT itself
+            hr_codes = HrAccessCode.objects.only("notification_mode").in_bulk(
+                {e.record["fields"].get("hr_access_code_id") for e in entries} - {None}
+            )
+            # No ignore_conflicts: a conflict rolls the batch back to be retried,
+            # it never drops an accepted submission
+            Submission.objects.bulk_create([
+                Submission(
+                    receipt_code=codes[e.id],
+                    notified_at=initial_notified_at(hr_codes.get(e.record["fields"].get("hr_access_code_id"))),
+                    **e.record["fields"],
+                )
+                for e in entries
+            ])
+            # bulk_create skips post_save; drop "not found" entries from status lookups
+            status_cache.invalidate_on_commit(*codes.values())
+
+            # Outbox messages and webhook events commit together with the rows
+            saved = Submission.objects.select_related("hr_access_code").in_bulk(
+                list(codes.values()), field_name="receipt_code"
+            )
+            for e in entries:
+                s = saved.get(codes[e.id])
+                if s is not None:
+                    notify_new_submission(
+                        s,
+                        e.record["notify"],
+                        admin_url=f"{e.record['site_url'].rstrip('/')}/admin/submissions/submission/{s.id}/change/",
+                    )
+            webhooks.submissions_created(saved.values())
+            metrics.submissions_created(len(saved))
+            IntakeEntry.objects.filter(id__in=[e.id for e in entries]).delete()
+
+        now = timezone.now()
+        for e in entries:
+            lag = (now - e.enqueued_at).total_seconds()
+            result.total_lag += lag
+            result.max_lag = max(result.max_lag, lag)
+        result.rows += len(entries)
+        result.batches.append(len(entries))
+
+    if result.rows:
+        logger.info(
+            "Flushed %d staged submissions in %d batch(es), max lag %.2fs",
+            result.rows, len(result.batches), result.max_lag,
+        )
+    return result
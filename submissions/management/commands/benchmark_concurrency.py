@@ -0,0 +1,168 @@
+"""
+Management command to load-test a page with many concurrent connections.
+
+Starts the app under gunicorn, either as WSGI with sync workers (the current
+Procfile) or as ASGI with uvicorn workers and the async intake views, unless
+--url points at a server that is already running. Each concurrency level keeps
+that many connections busy for --duration seconds and reports throughput,
+latency percentiles and failures. The started server runs with
+RATE_LIMIT_ENABLED=0, since one client IP would otherwise be answered 429
+within the first second; against --url, a 429 in the status column means the
+rate limiter, not the server, set the pace. Run once per server kind to compare:
+
+    python manage.py benchmark_concurrency --server wsgi
+    python manage.py benchmark_concurrency --server asgi
+"""
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def _send(host, port, raw, timeout):
+    """Send one raw HTTP/1.1 request; return (status line, headers+body bytes)."""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(raw)
+        await writer.drain()
+        # Requests use "Connection: close", so the response ends at EOF
+        response = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent-connection capacity of the WSGI and ASGI deployments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='How to start the app under test (ignored with --url)')
+        parser.add_argument('--url', default='', help='Benchmark an already running server instead')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for the started server')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--path', default='/status/', help='Page to request')
+        parser.add_argument('--method', choices=['GET', 'POST'], default='POST')
+        parser.add_argument('--form', action='append', default=[],
+                            help='Form field for POST as key=value (repeatable); default receipt_code=00000-00000')
+        parser.add_argument('--concurrency', default='1,10,50,100,200',
+                            help='Comma-separated numbers of concurrent connections')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per concurrency level')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        levels = [int(c) for c in options['concurrency'].split(',') if c.strip()]
+        server = None
+        if options['url']:
+            parts = urlsplit(options['url'])
+            host, port = parts.hostname, parts.port or 80
+        else:
+            host, port = '127.0.0.1', options['port']
+            server = self._start_server(options['server'], options['workers'], port)
+        try:
+            fields = dict(f.split('=', 1) for f in options['form']) or {'receipt_code': '00000-00000'}
+            raw = asyncio.run(self._build_request(host, port, options['method'], options['path'], fields))
+            self.stdout.write(f"{options['method']} {options['path']} against "
+                              f"{options['url'] or options['server'] + ' x' + str(options['workers'])}")
+            self.stdout.write(f"{'conns':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'failed':>7}  statuses")
+            for level in levels:
+                result = asyncio.run(self._run_level(host, port, raw, level, options['duration'], options['timeout']))
+                self.stdout.write(
+                    f"{level:>6} {result['rate']:>9,.1f} {result['p50'] * 1000:>9,.1f} {result['p99'] * 1000:>9,.1f} "
+                    f"{result['failed']:>7}  {dict(sorted(result['statuses'].items()))}"
+                )
+                if result['statuses'].get(429):
+                    self.stderr.write("Rate limited (429): start the server with RATE_LIMIT_ENABLED=0 to measure it")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    def _start_server(self, kind, workers, port):
+        if kind == 'asgi':
+            target, extra = 'anonplatform.asgi:application', ['-k', 'uvicorn.workers.UvicornWorker']
+        else:
+            target, extra = 'anonplatform.wsgi:application', []
+        # Every request comes from one IP; measure the server, not the rate limiter
+        env = {**os.environ, 'SUBMISSION_ASYNC_VIEWS': '1' if kind == 'asgi' else '0', 'RATE_LIMIT_ENABLED': '0'}
+        cmd = [sys.executable, '-m', 'gunicorn', target, *extra, '--workers', str(workers),
+               '--bind', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning']
+        server = subprocess.Popen(cmd, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode}: {' '.join(cmd)}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"Server did not start listening on port {port}")
+
+    async def _build_request(self, host, port, method, path, fields):
+        # Look like a request forwarded by the HTTPS proxy, so production
+        # settings (SECURE_SSL_REDIRECT) serve the page instead of redirecting
+        base = (
+            f"Host: {host}:{port}\r\nConnection: close\r\n"
+            f"X-Forwarded-Proto: https\r\nReferer: https://{host}:{port}{path}\r\n"
+        )
+        head = f"{method} {path} HTTP/1.1\r\n{base}"
+        if method == 'GET':
+            return (head + "\r\n").encode()
+        # Pick up a CSRF cookie from the page's form first
+        _, response = await _send(host, port, f"GET {path} HTTP/1.1\r\n{base}\r\n".encode(), 30)
+        match = re.search(rb'csrftoken=([A-Za-z0-9]+)', response)
+        if not match:
+            raise CommandError(f"No CSRF cookie returned by GET {path}")
+        token = match.group(1).decode()
+        body = urlencode(fields)
+        head += (
+            f"Cookie: csrftoken={token}\r\nX-CSRFToken: {token}\r\n"
+            f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n\r\n"
+        )
+        return (head + body).encode()
+
+    async def _run_level(self, host, port, raw, connections, duration, timeout):
+        latencies = []
+        statuses = Counter()
+        failed = 0
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            nonlocal failed
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await _send(host, port, raw, timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    failed += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses[status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(connections)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'rate': len(latencies) / elapsed,
+            'p50': _percentile(latencies, 0.50),
+            'p99': _percentile(latencies, 0.99),
+            'failed': failed,
+            'statuses': statuses,
+        }
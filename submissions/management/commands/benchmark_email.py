@@ -0,0 +1,131 @@
+"""
+Management command to benchmark the email backends against a local mock provider.
+
+Starts anonplatform.mock_email_provider in-process (or uses --url), points the
+Resend / SendGrid / Mailgun backends at it and sends the same message set in
+each dispatch mode, chunked the way the outbox worker claims messages:
+
+    serial      one request per message, one at a time (the old behaviour)
+    concurrent  one request per message, EMAIL_MAX_WORKERS at a time
+    batched     provider batch APIs, requests sent concurrently
+
+No real email is sent.
+"""
+import logging
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from anonplatform.email_backends import EmailProviderError, send_each
+from anonplatform.mock_email_provider import MockEmailProvider
+
+BACKENDS = {
+    'resend': 'anonplatform.email_backends.ResendEmailBackend',
+    'sendgrid': 'anonplatform.email_backends.SendGridEmailBackend',
+    'mailgun': 'anonplatform.email_backends.MailgunEmailBackend',
+    # Resend, then SendGrid, then Mailgun; all served by the mock provider
+    'failover': 'anonplatform.email_backends.FailoverEmailBackend',
+}
+MODES = ('serial', 'concurrent', 'batched')
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measure email backend throughput, latency and failures against a local mock provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default='resend,sendgrid,mailgun', help='Comma-separated: resend,sendgrid,mailgun,failover')
+        parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated: serial,concurrent,batched')
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent per backend and mode')
+        parser.add_argument('--chunk', type=int, default=50, help='Messages per send call (like OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, default=4, help='EMAIL_MAX_WORKERS for concurrent and batched modes')
+        parser.add_argument('--latency', type=float, default=0.05, help='Mock provider seconds per request')
+        parser.add_argument('--jitter', type=float, default=0.02, help='Mock provider extra random seconds per request')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered 500')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered 429')
+        parser.add_argument('--url', default='', help='Use an already running mock provider instead of starting one')
+
+    def handle(self, *args, **options):
+        backends = [b.strip() for b in options['backends'].split(',') if b.strip()]
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        server = None
+        url = options['url'].rstrip('/')
+        if not url:
+            server = MockEmailProvider(
+                latency=options['latency'], jitter=options['jitter'],
+                error_rate=options['error_rate'], throttle_rate=options['throttle_rate'],
+            ).start()
+            url = server.url
+        self.stdout.write(f'Mock provider at {url}; {options["messages"]} messages per run, chunks of {options["chunk"]}')
+
+        self.stdout.write(
+            f"{'backend':>9} {'mode':>11} {'msgs/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'requests':>9} {'conns':>6} {'failed':>7}  errors"
+        )
+        # Per-message send logging would dominate the output
+        backend_logger = logging.getLogger('anonplatform.email_backends')
+        previous_level = backend_logger.level
+        backend_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(
+                RESEND_API_URL=url, SENDGRID_API_URL=url, MAILGUN_API_URL=url,
+                RESEND_API_KEY='benchmark', SENDGRID_API_KEY='benchmark',
+                MAILGUN_API_KEY='benchmark', MAILGUN_DOMAIN='benchmark.test',
+                EMAIL_FAILOVER_BACKENDS=[BACKENDS['resend'], BACKENDS['sendgrid'], BACKENDS['mailgun']],
+            ):
+                for backend in backends:
+                    for mode in modes:
+                        self._run(BACKENDS[backend], backend, mode, options, server)
+        finally:
+            backend_logger.setLevel(previous_level)
+            if server is not None:
+                server.stop()
+
+    def _messages(self, count):
+        # Digest-style traffic: same body, one recipient each
+        return [
+            EmailMessage(
+                subject='Benchmark digest',
+                body='3 new anonymous submissions\n\n- Issue: benchmark (receipt 00000-00000)\n',
+                from_email='benchmark@example.com',
+                to=[f'hr{n}@example.com'],
+            )
+            for n in range(count)
+        ]
+
+    def _run(self, backend_path, name, mode, options, server):
+        workers = 1 if mode == 'serial' else options['workers']
+        messages = self._messages(options['messages'])
+        if server is not None:
+            server.reset()
+
+        started = time.perf_counter()
+        errors = []
+        with get_connection(backend_path, max_workers=workers) as connection:
+            for backend in getattr(connection, 'backends', [connection]):
+                if mode != 'batched':
+                    backend.batch_limit = 1
+            for start in range(0, len(messages), options['chunk']):
+                errors += send_each(connection, messages[start:start + options['chunk']])
+        elapsed = time.perf_counter() - started
+
+        latencies = [m.send_latency * 1000 for m in messages]
+        failed = [e for e in errors if e is not None]
+        kinds = {}
+        for error in failed:
+            kind = str(error.status) if isinstance(error, EmailProviderError) and error.status else type(error).__name__
+            kinds[kind] = kinds.get(kind, 0) + 1
+        stats = server.stats() if server is not None else {'requests': '-', 'connections': '-'}
+        self.stdout.write(
+            f"{name:>9} {mode:>11} {len(messages) / elapsed:>9,.0f} {_percentile(latencies, 0.5):>8.0f} "
+            f"{_percentile(latencies, 0.99):>8.0f} {stats['requests']:>9} {stats['connections']:>6} "
+            f"{len(failed):>7}  {', '.join(f'{k}: {v}' for k, v in sorted(kinds.items())) or '-'}"
+        )
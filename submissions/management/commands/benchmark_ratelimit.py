@@ -0,0 +1,115 @@
+"""
+Management command to benchmark the rate limiter.
+
+Measures the per-request overhead, in microseconds, of:
+
+    cache    the previous cache.get + cache.set counter (default cache)
+    local    GCRA in process memory (RATE_LIMIT_STORE=local)
+    database GCRA in the RateLimitBucket table (RATE_LIMIT_STORE=database)
+
+then hammers a single key from several threads to show how many requests each
+one lets through against the configured limit. Buckets created here use a
+"benchmark:" key prefix and are deleted afterwards.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from submissions.models import RateLimitBucket
+from submissions.ratelimit import DatabaseStore, LocalStore, RateLimiter
+
+PREFIX = "benchmark:"
+
+
+class _CacheCounter:
+    """The counter RateLimitMiddleware used before ratelimit.py (not atomic)."""
+
+    def hit(self, key, limit, period):
+        count = cache.get(key, 0)
+        if count >= limit:
+            return False
+        cache.set(key, count + 1, period)
+        return True
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measure rate limiter overhead per request and accuracy under concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', default='cache,local,database', help='Comma-separated: cache,local,database')
+        parser.add_argument('--requests', type=int, default=5000, help='Timed hits per store')
+        parser.add_argument('--keys', type=int, default=1000, help='Distinct keys (client IPs) the hits are spread over')
+        parser.add_argument('--threads', type=int, default=8, help='Threads in the concurrency check')
+        parser.add_argument('--limit', type=int, default=50, help='Limit in the concurrency check')
+
+    def handle(self, *args, **options):
+        stores = [s.strip() for s in options['stores'].split(',') if s.strip()]
+        try:
+            self.stdout.write(f"{'store':>9} {'mean µs':>9} {'p50 µs':>8} {'p99 µs':>8}")
+            for name in stores:
+                self._measure(name, options['requests'], options['keys'])
+            self.stdout.write(f"\n{options['threads']} threads, {options['limit'] * 4} hits on one key, limit {options['limit']}:")
+            for name in stores:
+                self._concurrency(name, options['threads'], options['limit'])
+        finally:
+            RateLimitBucket.objects.filter(key__startswith=PREFIX).delete()
+            cache.delete_many([f'{PREFIX}cache:{n}' for n in range(options['keys'])] + [f'{PREFIX}race'])
+
+    def _limiter(self, name):
+        if name == 'cache':
+            return _CacheCounter()
+        return RateLimiter(LocalStore() if name == 'local' else DatabaseStore())
+
+    def _measure(self, name, requests, keys):
+        limiter = self._limiter(name)
+        timings = []
+        for n in range(requests):
+            key = f'{PREFIX}{name}:{n % keys}'
+            started = time.perf_counter()
+            limiter.hit(key, 10, 3600)
+            timings.append((time.perf_counter() - started) * 1e6)
+        self.stdout.write(
+            f"{name:>9} {sum(timings) / len(timings):>9.1f} {_percentile(timings, 0.5):>8.1f} "
+            f"{_percentile(timings, 0.99):>8.1f}"
+        )
+
+    def _concurrency(self, name, threads, limit):
+        limiter = self._limiter(name)
+        key = f'{PREFIX}race'
+        if name == 'cache':
+            cache.delete(key)
+        allowed = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+        per_thread = limit * 4 // threads
+
+        def run():
+            barrier.wait()
+            mine = 0
+            try:
+                for _ in range(per_thread):
+                    result = limiter.hit(key, limit, 3600)
+                    mine += result if isinstance(result, bool) else result.allowed
+            finally:
+                connection.close()
+            with lock:
+                allowed.append(mine)
+
+        workers = [threading.Thread(target=run) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        total = sum(allowed)
+        verdict = 'exact' if total == limit else f'{total - limit:+d} over the limit'
+        if name == 'cache':
+            verdict += '; LocMemCache is per process, so every worker allows this much again'
+        self.stdout.write(f"{name:>9}: {total} allowed ({verdict})")
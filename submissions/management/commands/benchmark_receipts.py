@@ -0,0 +1,78 @@
+"""
+Management command to benchmark receipt code allocation as the table grows.
+
+Runs inside a transaction that is rolled back at the end (unless --keep), so
+point it at a scratch database when using large sizes.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+
+from submissions.allocators import receipt_allocator
+from submissions.models import Submission
+from submissions.utils import generate_receipt_code
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure Submission insert throughput at increasing table sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help='Comma-separated table sizes to measure at (e.g. 1000,...,10000000)')
+        parser.add_argument('--inserts', type=int, default=1000, help='Timed inserts per size')
+        parser.add_argument('--mode', choices=['allocator', 'random', 'both'], default='both',
+                            help='allocator = create_with_unique_receipt, random = the old retry loop')
+        parser.add_argument('--fill-batch', type=int, default=10000, help='Rows per bulk_create while filling')
+        parser.add_argument('--keep', action='store_true', help='Commit the generated rows instead of rolling back')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(s) for s in options['sizes'].split(',') if s.strip())
+        modes = ['allocator', 'random'] if options['mode'] == 'both' else [options['mode']]
+
+        self.stdout.write(f"{'rows':>12} {'mode':>10} {'inserts/s':>12} {'retries':>8}")
+        try:
+            with transaction.atomic():
+                for size in sizes:
+                    self._fill_to(size, options['fill_batch'])
+                    for mode in modes:
+                        rate, retries = self._measure(mode, options['inserts'])
+                        self.stdout.write(f"{size:>12,} {mode:>10} {rate:>12,.0f} {retries:>8}")
+                if not options['keep']:
+                    raise _Rollback
+        except _Rollback:
+            self.stdout.write(self.style.SUCCESS('Rolled back benchmark rows.'))
+
+    def _fill_to(self, size, batch):
+        missing = size - Submission.objects.count()
+        while missing > 0:
+            n = min(batch, missing)
+            Submission.objects.bulk_create(
+                Submission(type=Submission.SubmissionType.ISSUE, title='benchmark', body='benchmark', receipt_code=code)
+                for code in receipt_allocator().codes(n)
+            )
+            missing -= n
+
+    def _measure(self, mode, inserts):
+        retries = 0
+        started = time.perf_counter()
+        for _ in range(inserts):
+            if mode == 'allocator':
+                Submission.create_with_unique_receipt(type=Submission.SubmissionType.ISSUE, title='benchmark', body='benchmark')
+                continue
+            for _ in range(10):
+                try:
+                    with transaction.atomic():
+                        Submission.objects.create(
+                            type=Submission.SubmissionType.ISSUE, title='benchmark', body='benchmark',
+                            receipt_code=generate_receipt_code(),
+                        )
+                    break
+                except IntegrityError:
+                    retries += 1
+        elapsed = time.perf_counter() - started
+        return inserts / elapsed, retries
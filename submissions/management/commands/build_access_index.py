@@ -0,0 +1,24 @@
+"""
+Management command to write the shared access code index (see access_index.py).
+
+Run it on each web host before the workers start, so their first lookups are
+answered from the file instead of the database.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from submissions import access_index
+
+
+class Command(BaseCommand):
+    help = 'Write the index of active HR access codes to ACCESS_CODE_INDEX_PATH'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = access_index.get_index().rebuild()
+        self.stdout.write(
+            f'Wrote {count} active access code(s) to {settings.ACCESS_CODE_INDEX_PATH} '
+            f'in {time.perf_counter() - started:.2f}s'
+        )
@@ -0,0 +1,25 @@
+"""
+Management command to write the legacy receipt code filter (see code_filter.py).
+
+Run it on each web host before the workers start; they pick the file up
+without scanning the submissions table themselves.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from submissions import code_filter
+
+
+class Command(BaseCommand):
+    help = 'Write the Bloom filter of legacy receipt codes to CODE_FILTER_PATH'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help='Output file (default: CODE_FILTER_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.CODE_FILTER_PATH
+        started = time.perf_counter()
+        count = code_filter.build(path)
+        self.stdout.write(f'Wrote {count} legacy receipt code(s) to {path} in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,36 @@
+"""
+Management command to persist staged submissions (SUBMISSION_INTAKE_MODE=queued).
+
+Several flushers may run side by side; each claims its own batches.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from submissions import intake
+
+
+class Command(BaseCommand):
+    help = 'Persist staged submissions in batches with bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between flushes with --loop')
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per bulk_create (default: SUBMISSION_INTAKE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        while True:
+            result = intake.flush(batch_size=options['batch_size'])
+            if result.rows or not options['loop']:
+                self.stdout.write(
+                    f'Flushed {result.rows} submission(s) '
+                    f'in {len(result.batches)} batch(es) {result.batches}; '
+                    f'lag avg {result.avg_lag:.2f}s, max {result.max_lag:.2f}s; '
+                    f'{intake.pending_count()} still pending'
+                )
+            if not options['loop']:
+                return
+            if not result.rows:
+                close_old_connections()
+            time.sleep(options['interval'])
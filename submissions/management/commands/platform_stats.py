@@ -0,0 +1,63 @@
+"""
+Management command to print operational statistics for the platform.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from anonplatform import email_backends
+from submissions import code_filter, outbox, status_cache, webhooks
+from submissions.allocators import access_code_allocator
+
+
+class Command(BaseCommand):
+    help = 'Print occupancy and queue statistics'
+
+    def handle(self, *args, **options):
+        stats = access_code_allocator().stats()
+        self.stdout.write(self.style.SUCCESS('HR access codes'))
+        self.stdout.write(f"  assigned:        {stats['assigned']:,} / {stats['capacity']:,} ({stats['occupancy']:.2%})")
+        self.stdout.write(f"  active:          {stats['active']:,}")
+        self.stdout.write(f"  fresh issued:    {stats['fresh_issued']:,} ({stats['fresh_remaining']:,} remaining)")
+        self.stdout.write(f"  released pool:   {stats['released']:,} ({stats['reusable_now']:,} past cooldown)")
+
+        cache_stats = status_cache.stats()
+        self.stdout.write(self.style.SUCCESS('Status lookup cache'))
+        self.stdout.write(f"  enabled:         {cache_stats['enabled']}")
+        self.stdout.write(f"  lookups:         {cache_stats['lookups']:,}")
+        self.stdout.write(f"  hit rate:        {cache_stats['hit_rate']:.1%} ({cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses)")
+
+        filter_stats = code_filter.stats()
+        self.stdout.write(self.style.SUCCESS('Invalid code filtering'))
+        self.stdout.write(f"  enabled:         {filter_stats['enabled']}")
+        for kind, label in (('access', 'access codes'), ('receipt', 'receipt codes')):
+            self.stdout.write(
+                f"  {label + ':':<16} {filter_stats[f'{kind}_filtered']:,} filtered, "
+                f"{filter_stats[f'{kind}_negative_cached']:,} negative-cached, "
+                f"{filter_stats[f'{kind}_db_checked']:,} checked in DB "
+                f"({filter_stats[f'{kind}_avoided_rate']:.1%} without a query)"
+            )
+
+        outbox_stats = outbox.stats()
+        self.stdout.write(self.style.SUCCESS('Email outbox'))
+        self.stdout.write(f"  pending:         {outbox_stats['pending']:,} ({outbox_stats['retrying']:,} retrying)")
+        self.stdout.write(f"  oldest pending:  {outbox_stats['oldest_pending_age']:.0f}s")
+        self.stdout.write(f"  sent last hour:  {outbox_stats['sent_last_hour']:,}")
+        self.stdout.write(f"  failed:          {outbox_stats['failed']:,}")
+
+        webhook_stats = webhooks.stats()
+        self.stdout.write(self.style.SUCCESS('Webhook deliveries'))
+        self.stdout.write(f"  pending:         {webhook_stats['pending']:,} ({webhook_stats['retrying']:,} retrying)")
+        self.stdout.write(f"  oldest pending:  {webhook_stats['oldest_pending_age']:.0f}s")
+        self.stdout.write(f"  sent last hour:  {webhook_stats['sent_last_hour']:,}")
+        self.stdout.write(f"  failed:          {webhook_stats['failed']:,}")
+
+        providers = email_backends.failover_provider_names()
+        if len(providers) > 1:
+            self.stdout.write(self.style.SUCCESS('Email providers (failover order)'))
+            for name, state in email_backends.shared_breaker_states(providers).items():
+                if state is None:
+                    self.stdout.write(f"  {name + ':':<16} closed")
+                    continue
+                changed = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(state['changed_at']))
+                self.stdout.write(f"  {name + ':':<16} {state['state']} since {changed} UTC")
@@ -0,0 +1,74 @@
+"""
+Management command to provision HR tenants in bulk from a CSV or JSON-lines file.
+
+Expected columns/keys: email (required), company_name, website, notification_email.
+"""
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from submissions.models import HrAccessCode
+from submissions.provisioning import provision, read_rows, rotate_access_codes
+
+
+class Command(BaseCommand):
+    help = 'Create HR users and access codes in bulk, or rotate access codes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='CSV (with header) or .jsonl file of companies')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per transaction')
+        parser.add_argument('--checkpoint', help='Progress file used to resume (default: <file>.checkpoint.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--rotate', action='store_true', help='Also issue new codes to tenants that already have one')
+        parser.add_argument('--rotate-all', action='store_true', help='Rotate the access code of every tenant (no file needed)')
+        parser.add_argument('--passwords-out',
+                            help='Give new users temporary passwords and write them to this CSV '
+                                 '(slow: one bcrypt hash per user). Default: unusable passwords.')
+
+    def handle(self, *args, **options):
+        if options['rotate_all']:
+            ids = list(HrAccessCode.objects.values_list('id', flat=True))
+            result = rotate_access_codes(ids, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Rotated {result.codes_rotated} access code(s) in {result.elapsed:.1f}s ({result.rate:,.0f}/s)'
+            ))
+            return
+
+        path = options['file']
+        if not path:
+            raise CommandError('Provide a file to provision from, or --rotate-all.')
+        if not os.path.exists(path):
+            raise CommandError(f'File not found: {path}')
+
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint.json'
+        if options['restart'] and os.path.exists(checkpoint):
+            os.unlink(checkpoint)
+        elif os.path.exists(checkpoint):
+            self.stdout.write(self.style.WARNING(f'Resuming from checkpoint {checkpoint}'))
+
+        passwords = [] if options['passwords_out'] else None
+
+        def progress(result):
+            self.stdout.write(f'  {result.rows:,} rows processed ({result.rate:,.0f} rows/s)')
+
+        try:
+            result = provision(
+                read_rows(path),
+                chunk_size=options['chunk_size'],
+                checkpoint=checkpoint,
+                rotate=options['rotate'],
+                passwords=passwords,
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+        finally:
+            # Write whatever was committed, even if a later chunk failed
+            if passwords:
+                with open(options['passwords_out'], 'a', newline='') as f:
+                    csv.writer(f).writerows(passwords)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {result.rows:,} row(s) in {result.elapsed:.1f}s ({result.rate:,.0f} rows/s): '
+            f'{result.users_created} user(s) created, {result.codes_created} code(s) created, '
+            f'{result.codes_rotated} rotated, {result.skipped} skipped'
+        ))
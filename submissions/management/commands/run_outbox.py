@@ -0,0 +1,69 @@
+"""
+Management command to deliver queued emails from the outbox.
+
+Provider send latency and failures are recorded here, not in the web workers;
+pass --metrics-port to let Prometheus scrape them (see anonplatform/metrics.py).
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from anonplatform import metrics
+from submissions import idempotency, outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send pending outbox emails (safe to run several workers side by side)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages claimed per transaction (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and age and exit')
+        parser.add_argument('--metrics-port', type=int, default=None, help='Serve Prometheus metrics on this port')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = outbox.stats()
+            self.stdout.write(
+                f"pending {stats['pending']} ({stats['retrying']} retrying), failed {stats['failed']}, "
+                f"sent last hour {stats['sent_last_hour']}, oldest pending {stats['oldest_pending_age']:.0f}s"
+            )
+            return
+
+        if options['metrics_port']:
+            metrics.start_server(options['metrics_port'])
+        last_purge = 0.0
+        while True:
+            try:
+                result = outbox.drain(batch_size=options['batch_size'])
+            except Exception:
+                # e.g. the database went away; claimed messages become due again
+                # when their lease runs out
+                if not options['loop']:
+                    raise
+                logger.exception("Outbox drain failed")
+                result = outbox.DrainResult()
+            if result.claimed or not options['loop']:
+                latencies = sorted(result.latencies)
+                timing = (
+                    f'; send latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, '
+                    f'max {latencies[-1] * 1000:.0f} ms' if latencies else ''
+                )
+                self.stdout.write(
+                    f'Outbox: {result.sent} sent, {result.retried} to retry, {result.failed} failed '
+                    f'of {result.claimed} claimed{timing}'
+                )
+            if not options['loop']:
+                return
+            if time.monotonic() - last_purge > 3600:
+                outbox.purge_sent()
+                idempotency.purge_expired()
+                last_purge = time.monotonic()
+            if not result.claimed:
+                close_old_connections()
+                time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+"""
+Management command to run bulk provisioning and code rotation jobs queued from
+the admin (see submissions/provisioning.py).
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from submissions import provisioning
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run queued provisioning jobs (safe to run several workers side by side)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep waiting for new jobs until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to wait when no job is queued')
+
+    def handle(self, *args, **options):
+        while True:
+            job = provisioning.claim_job()
+            if job is not None:
+                result = provisioning.run_job(job)
+                self.stdout.write(
+                    f'Job {job.id} ({job.get_kind_display()}) {job.get_status_display().lower()}: '
+                    f'{result.rows} row(s), {result.users_created} user(s), {result.codes_created} code(s) created, '
+                    f'{result.codes_rotated} rotated'
+                )
+                continue
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+"""
+Management command to deliver queued webhook events.
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from submissions import webhooks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending webhook events (safe to run several workers side by side)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep delivering until interrupted')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=None, help='Events claimed per transaction (default: WEBHOOK_BATCH_SIZE)')
+        parser.add_argument('--stats', action='store_true', help='Print queue depth and age and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            stats = webhooks.stats()
+            self.stdout.write(
+                f"pending {stats['pending']} ({stats['retrying']} retrying), failed {stats['failed']}, "
+                f"sent last hour {stats['sent_last_hour']}, oldest pending {stats['oldest_pending_age']:.0f}s"
+            )
+            return
+
+        last_purge = 0.0
+        while True:
+            try:
+                result = webhooks.deliver(batch_size=options['batch_size'])
+            except Exception:
+                if not options['loop']:
+                    raise
+                logger.exception("Webhook delivery failed")
+                result = webhooks.DeliverResult()
+            if result.claimed or not options['loop']:
+                self.stdout.write(
+                    f'Webhooks: {result.sent} sent, {result.retried} to retry, {result.failed} failed '
+                    f'of {result.claimed} claimed in {result.requests} request(s)'
+                )
+            if not options['loop']:
+                return
+            if time.monotonic() - last_purge > 3600:
+                webhooks.purge_sent()
+                last_purge = time.monotonic()
+            if not result.claimed:
+                close_old_connections()
+                time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+"""
+Management command to send HR notification digests (BATCHED / DAILY accounts,
+and submissions left waiting when an account switched to IMMEDIATE).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from submissions.notifications import send_due_digests
+
+
+class Command(BaseCommand):
+    help = 'Queue one summary email per HR account whose notification digest is due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep checking until interrupted')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between checks with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_due_digests()
+            if result.tenants or not options['loop']:
+                self.stdout.write(
+                    f'Queued {result.tenants} digest(s) covering {result.submissions} submission(s)'
+                )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+"""
+Management command to remind HR accounts of submissions left NEW or IN_REVIEW too long.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from submissions.notifications import send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Queue one reminder email per HR account with overdue submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep checking until interrupted')
+        parser.add_argument('--interval', type=float, default=300.0, help='Seconds between checks with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_due_reminders()
+            if result.tenants or not options['loop']:
+                self.stdout.write(
+                    f'Queued {result.tenants} reminder(s) covering {result.submissions} overdue submission(s)'
+                )
+            if not options['loop']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,122 @@
+"""
+Management command to run a local webhook receiver for testing endpoints.
+
+Add a Webhook Endpoint pointing at http://127.0.0.1:8030/ in the admin, start
+this with its secret and run `manage.py run_webhooks`:
+
+    python manage.py webhook_receiver --secret whsec_... --port 8030
+
+Every request is checked with webhooks.verify_signature() and its events are
+printed. --fail-rate answers a fraction of requests with 503 to exercise retries.
+"""
+import json
+import random
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from submissions.webhooks import SIGNATURE_HEADER, verify_signature
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: "WebhookReceiver"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        server.record_connection(self.client_address)
+        if server.secret and not verify_signature(server.secret, self.headers.get(SIGNATURE_HEADER, ""), body):
+            server.record(401, [])
+            return self._reply(401)
+        if random.random() < server.fail_rate:
+            server.record(503, [])
+            return self._reply(503)
+        events = json.loads(body or b"{}").get("events") or []
+        server.record(200, events)
+        return self._reply(200)
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, secret="", fail_rate=0.0, on_events=None):
+        super().__init__((host, port), _Handler)
+        self.secret = secret
+        self.fail_rate = fail_rate
+        self.on_events = on_events
+        self._lock = threading.Lock()
+        self.statuses = Counter()
+        self.events = []
+        self.connections = set()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def record(self, status: int, events) -> None:
+        with self._lock:
+            self.statuses[status] += 1
+            self.events.extend(events)
+        if events and self.on_events:
+            self.on_events(events)
+
+    def record_connection(self, client_address) -> None:
+        with self._lock:
+            self.connections.add(client_address)
+
+    def start(self) -> "WebhookReceiver":
+        threading.Thread(target=self.serve_forever, name="webhook-receiver", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class Command(BaseCommand):
+    help = 'Run a local HTTP receiver that verifies and prints webhook deliveries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8030)
+        parser.add_argument('--secret', default='', help='Endpoint secret; requests with a bad signature get 401')
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered 503')
+
+    def handle(self, *args, **options):
+        def show(events):
+            for event in events:
+                data = event.get('data') or {}
+                self.stdout.write(
+                    f"{event.get('type')} {event.get('id')}: submission {data.get('id')} "
+                    f"{data.get('previous_status', '') + ' -> ' if data.get('previous_status') else ''}{data.get('status')}"
+                )
+
+        server = WebhookReceiver(
+            options['host'], options['port'], secret=options['secret'],
+            fail_rate=options['fail_rate'], on_events=show,
+        )
+        if not options['secret']:
+            self.stdout.write(self.style.WARNING('No --secret given: signatures are not checked'))
+        self.stdout.write(f'Webhook receiver listening on {server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,19 +1,69 @@
 """
-Rate limiting middleware for anonymous submissions.
+Rate limiting middleware for anonymous submissions, admission control under
+load, request ids for logging, Server-Timing breakdowns and request metrics.
 """
-import os
-from django.core.cache import cache
-from django.http import HttpResponse
-from django.utils import timezone
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+
+from anonplatform import metrics
+from anonplatform.log import request_id_var, request_sampled_var
+from anonplatform.timing import RequestTimings, timings_var
+
+from .ratelimit import compile_policies, limiter
+
+logger = logging.getLogger(__name__)
+
+# Accepted from an upstream proxy's X-Request-ID header; anything else is replaced
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    """
+    Tag every log record of a request with one id (the proxy's X-Request-ID or a
+    new one, echoed in the response) and decide once whether the request's
+    DEBUG diagnostics are logged (LOG_SAMPLE_RATE).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.META.get("HTTP_X_REQUEST_ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        id_token = request_id_var.set(request_id)
+        sampled_token = request_sampled_var.set(random.random() < settings.LOG_SAMPLE_RATE)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(id_token)
+            request_sampled_var.reset(sampled_token)
+        response["X-Request-ID"] = request_id
+        return response
 
 
 class RateLimitMiddleware:
     """
-    Rate limit anonymous submissions to prevent abuse.
-    Limits: 5 submissions per IP per hour.
+    Rate limit anonymous endpoints to prevent abuse, per settings.RATE_LIMIT_POLICIES.
+    Policies are compiled once here; unmatched paths cost one dict lookup.
     """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.policies = compile_policies(settings.RATE_LIMIT_POLICIES) if settings.RATE_LIMIT_ENABLED else {}
 
     def __call__(self, request):
         # Block password change for HR staff (non-superuser)
@@ -21,47 +71,86 @@ class RateLimitMiddleware:
             user = getattr(request, "user", None)
             if user and user.is_authenticated and user.is_staff and not user.is_superuser:
                 return HttpResponse("Password changes are disabled for this account.", status=403)
-        # Only rate limit POST requests to submit endpoint
-        if request.method == "POST" and request.path in ("/submit/", "/hr/register/"):
-            ip_address = self.get_client_ip(request)
-            # Separate buckets per endpoint
-            bucket = "submit" if request.path == "/submit/" else "hr_register"
-            cache_key = f"rate_limit_{bucket}_{ip_address}"
-            
-            # Get current count
-            count = cache.get(cache_key, 0)
-            
-            # Rate limit: 10 submissions per hour (configurable via environment variable)
-            if request.path == "/hr/register/":
-                max_submissions = int(os.environ.get("RATE_LIMIT_HR_REGISTER_MAX", "10"))  # Increased to 10 per hour
-                rate_limit_window = int(os.environ.get("RATE_LIMIT_HR_REGISTER_WINDOW_SECONDS", "3600"))
-            else:
-                max_submissions = int(os.environ.get("RATE_LIMIT_MAX_SUBMISSIONS", "10"))
-                rate_limit_window = int(os.environ.get("RATE_LIMIT_WINDOW_SECONDS", "3600"))  # 1 hour default
-            
-            if count >= max_submissions:
-                # Return a more helpful error page for HR registration
-                if request.path == "/hr/register/":
-                    from django.shortcuts import render
-                    return render(
-                        request,
-                        "submissions/hr_register.html",
-                        {
-                            "error": "Too many registration attempts. Please wait an hour and try again, or contact support if you need immediate assistance.",
-                        },
-                        status=429,
-                    )
-                return HttpResponse(
-                    "Too many requests. Please try again later.",
-                    status=429,
-                )
-            
-            # Increment counter (expires in rate_limit_window seconds)
-            cache.set(cache_key, count + 1, rate_limit_window)
+        policies = self.policies.get(request.path)
+        if policies:
+            for policy in policies:
+                if request.method not in policy.methods:
+                    continue
+                client = self.client_key(request, policy.key)
+                if not client:
+                    continue
+                cost = self.request_cost(request, policy.cost)
+                # Atomic and shared by every worker (see ratelimit.py). Never
+                # waits for capacity: a sleeping request would hold a worker thread
+                result = limiter().hit(f"{policy.name}:{client}", policy.limit, policy.period, cost=cost)
+                if not result.allowed:
+                    metrics.rate_limit_rejected(policy.name)
+                    if policy.action == "delay" and result.retry_after <= policy.max_delay:
+                        return self.delayed(request, result)
+                    return self.rejected(request, result)
         
         response = self.get_response(request)
         return response
 
+    @staticmethod
+    def rejected(request, result):
+        # Return a more helpful error page for HR registration
+        if request.path == "/hr/register/":
+            from django.shortcuts import render
+            response = render(
+                request,
+                "submissions/hr_register.html",
+                {
+                    "error": "Too many registration attempts. Please wait an hour and try again, or contact support if you need immediate assistance.",
+                },
+                status=429,
+            )
+        elif request.path.startswith("/api/"):
+            response = JsonResponse({"error": "Too many requests. Please try again later."}, status=429)
+        else:
+            response = HttpResponse(
+                "Too many requests. Please try again later.",
+                status=429,
+            )
+        response["Retry-After"] = str(math.ceil(result.retry_after))
+        return response
+
+    @staticmethod
+    def delayed(request, result):
+        # The client is only slightly early: say exactly how long to wait
+        # rather than "try again later"
+        wait = math.ceil(result.retry_after)
+        message = f"Too many requests. Please wait {wait} second{'s' if wait != 1 else ''} and try again."
+        if request.path.startswith("/api/"):
+            response = JsonResponse({"error": message, "retry_after": wait}, status=429)
+        else:
+            response = HttpResponse(message, status=429)
+        response["Retry-After"] = str(wait)
+        return response
+
+    @classmethod
+    def client_key(cls, request, key_type):
+        if key_type == "ip":
+            return cls.get_client_ip(request)
+        if key_type == "access_code":
+            return (request.POST.get("access_code") or "").strip()[:20]
+        # ip_receipt_prefix: per IP, so one client guessing codes cannot use up
+        # the budget of everyone else whose receipt shares the prefix
+        digits = re.sub(r"\D", "", request.POST.get("receipt_code") or "")
+        return f"{cls.get_client_ip(request)}:{digits[:5]}" if len(digits) >= 5 else ""
+
+    @staticmethod
+    def request_cost(request, cost_type):
+        if cost_type == "request":
+            return 1
+        # receipt_codes: the view answers 400/413 for bodies it cannot use, but
+        # they are still charged, at least 1 and at most STATUS_API_MAX_CODES
+        try:
+            codes = json.loads(request.body).get("receipt_codes")
+        except (ValueError, AttributeError):
+            return 1
+        return min(max(len(codes), 1), settings.STATUS_API_MAX_CODES) if isinstance(codes, list) else 1
+
     @staticmethod
     def get_client_ip(request):
         """Extract client IP address from request."""
@@ -71,3 +160,189 @@ class RateLimitMiddleware:
         else:
             ip = request.META.get("REMOTE_ADDR", "unknown")
         return ip
+
+
+# Longest queue wait a single X-Request-Start sample can report, in seconds
+MAX_QUEUE_WAIT_SAMPLE = 60.0
+# The average queue wait decays by 1/e over this many seconds without samples
+QUEUE_WAIT_DECAY_SECONDS = 10.0
+
+
+class AdmissionState:
+    """In-flight requests and recent queue wait of this worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        # Exponentially weighted average of the time requests waited before a
+        # worker thread picked them up (from X-Request-Start), in seconds,
+        # as of queue_wait_at (time.monotonic())
+        self.queue_wait = 0.0
+        self.queue_wait_at = time.monotonic()
+        self.shed = {"low": 0, "normal": 0}
+
+    def enter(self, priority: str, queue_wait: Optional[float], now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # A backlog that cleared while no samples came in must not shed
+            # requests indefinitely
+            self.queue_wait *= math.exp(-max(now - self.queue_wait_at, 0.0) / QUEUE_WAIT_DECAY_SECONDS)
+            self.queue_wait_at = now
+            if queue_wait is not None:
+                self.queue_wait += (queue_wait - self.queue_wait) * 0.2
+            if priority != "critical" and not self._admits(priority, queue_wait):
+                self.shed[priority] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _admits(self, priority: str, queue_wait: Optional[float]) -> bool:
+        # Critical routes may always use the reserved slots; the rest may not
+        if self.in_flight >= settings.ADMISSION_MAX_IN_FLIGHT - settings.ADMISSION_RESERVED_SLOTS:
+            return False
+        if priority == "low":
+            budget = settings.ADMISSION_LOW_PRIORITY_MAX_QUEUE_WAIT
+            if self.queue_wait > budget or (queue_wait or 0.0) > budget:
+                return False
+        return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+admission_state = AdmissionState()
+
+
+def _queue_wait(request) -> Optional[float]:
+    """
+    Seconds since the proxy received the request, from X-Request-Start
+    ("t=<epoch>" in s, ms or µs), at most MAX_QUEUE_WAIT_SAMPLE. None when
+    the header is missing, not trusted or not a plausible timestamp.
+    """
+    if not settings.ADMISSION_TRUST_REQUEST_START:
+        return None
+    header = request.META.get("HTTP_X_REQUEST_START", "")
+    try:
+        started = float(header[2:] if header.startswith("t=") else header)
+    except ValueError:
+        return None
+    if not math.isfinite(started) or started <= 0:
+        return None
+    for _ in range(2):  # milliseconds or microseconds
+        if started > 1e11:
+            started /= 1000
+    wait = time.time() - started
+    if started > 1e11 or wait > 3600:
+        # Not an epoch timestamp (or a clock far off): ignore rather than shed
+        return None
+    return min(max(wait, 0.0), MAX_QUEUE_WAIT_SAMPLE)
+
+
+class AdmissionControlMiddleware:
+    """
+    Shed load before it reaches the views so employees can still submit.
+
+    Each worker counts its in-flight requests. Low- and normal-priority routes are
+    answered 503 with Retry-After once only ADMISSION_RESERVED_SLOTS are left,
+    which keeps those slots for critical routes (submit, status). Low-priority
+    routes (marketing pages, the admin dashboard) are also shed when requests
+    have been queueing longer than ADMISSION_LOW_PRIORITY_MAX_QUEUE_WAIT, as
+    measured from X-Request-Start when ADMISSION_TRUST_REQUEST_START is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.priorities = {path: "critical" for path in settings.ADMISSION_CRITICAL_PATHS}
+        self.priorities.update({path: "low" for path in settings.ADMISSION_LOW_PRIORITY_PATHS})
+
+    def __call__(self, request):
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return self.get_response(request)
+        priority = self.priorities.get(request.path, "normal")
+        if not admission_state.enter(priority, _queue_wait(request)):
+            response = HttpResponse("The service is busy. Please try again shortly.", status=503, content_type="text/plain")
+            response["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            admission_state.leave()
+
+
+class ServerTimingMiddleware:
+    """
+    Break down where a request's time went: database time and query count,
+    template rendering, cache hits and misses, email dispatch (see
+    anonplatform/timing.py).
+
+    Staff users (SERVER_TIMING_STAFF) get it as a Server-Timing header, shown in
+    the browser's network panel, and a log record. A SERVER_TIMING_SAMPLE_RATE
+    fraction of other requests is logged only: per-request query timings could
+    tell an anonymous client whether a code exists. Other requests pay for one
+    random() call and a cookie lookup: the user (a session read and a query)
+    is only loaded for requests that carry a session cookie. Sits after
+    AuthenticationMiddleware to know the user, so the rate limit query before
+    it is not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.SERVER_TIMING_SAMPLE_RATE
+        staff = (
+            settings.SERVER_TIMING_STAFF
+            and settings.SESSION_COOKIE_NAME in request.COOKIES
+            and getattr(request, "user", None) is not None
+            and request.user.is_staff
+        )
+        if not staff and not sampled:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = timings_var.set(timings)
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            timings_var.reset(token)
+        if staff:
+            response["Server-Timing"] = timings.header()
+        match = request.resolver_match
+        fields = timings.log_fields()
+        logger.info(
+            "%s %s %s in %.1f ms (db %.1f ms / %d queries, templates %.1f ms)",
+            request.method, request.path, response.status_code, fields["duration_ms"],
+            fields["db_ms"], fields["db_queries"], fields["template_ms"],
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                **fields,
+            },
+        )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Per-view request latency for /metrics (anonplatform/metrics.py), including
+    requests shed by AdmissionControlMiddleware. Removes itself when
+    prometheus_client is not installed.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        metrics.observe_request(
+            match.view_name if match else "", request.method, response.status_code, time.perf_counter() - started
+        )
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    AllocatorCounter = apps.get_model("submissions", "AllocatorCounter")
+    AllocatorCounter.objects.get_or_create(name="receipt_code", defaults={"value": 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0004_alter_submission_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocatorCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+def seed_counter(apps, schema_editor):
+    AllocatorCounter = apps.get_model("submissions", "AllocatorCounter")
+    AllocatorCounter.objects.get_or_create(name="access_code", defaults={"value": 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0005_allocatorcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReleasedAccessCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True)),
+                ('released_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
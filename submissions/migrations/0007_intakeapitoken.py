@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0006_releasedaccesscode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntakeApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('token_prefix', models.CharField(max_length=12)),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+                ('hr_access_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to='submissions.hraccesscode')),
+            ],
+            options={
+                'verbose_name': 'Intake API Token',
+                'verbose_name_plural': 'Intake API Tokens',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 08:56
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    # Everything created so far was emailed immediately; keep it out of digests
+    Submission = apps.get_model("submissions", "Submission")
+    Submission.objects.filter(notified_at__isnull=True).update(notified_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0008_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hraccesscode',
+            name='digest_interval_minutes',
+            field=models.PositiveIntegerField(default=15, help_text='How often a batched digest is sent, if there is anything new.'),
+        ),
+        migrations.AddField(
+            model_name='hraccesscode',
+            name='last_digest_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='hraccesscode',
+            name='notification_mode',
+            field=models.CharField(choices=[('IMMEDIATE', 'One email per submission'), ('BATCHED', 'Digest every N minutes'), ('DAILY', 'Daily digest')], default='IMMEDIATE', help_text='Digests summarise all new submissions in one email (sent by `manage.py send_digests`).', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['hr_access_code'], name='submission_unnotified_idx'),
+        ),
+    ]
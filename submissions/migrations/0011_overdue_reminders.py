@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0010_webhooks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('new_count', models.PositiveIntegerField(default=0)),
+                ('in_review_count', models.PositiveIntegerField(default=0)),
+                ('oldest_updated_at', models.DateTimeField(blank=True, null=True)),
+                ('submission_ids', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Reminder Log',
+                'verbose_name_plural': 'Reminder Logs',
+            },
+        ),
+        migrations.AddField(
+            model_name='hraccesscode',
+            name='last_reminder_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['hr_access_code', 'status', 'updated_at'], name='submission_status_age_idx'),
+        ),
+        migrations.AddField(
+            model_name='reminderlog',
+            name='hr_access_code',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_logs', to='submissions.hraccesscode'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:27
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0012_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntakeEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receipt_code', models.CharField(max_length=20, unique=True)),
+                ('record', models.JSONField()),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Intake Entry',
+                'verbose_name_plural': 'Intake Entries',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submissions', '0013_intakeentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProvisioningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PROVISION', 'Provision'), ('ROTATE', 'Rotate codes')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('FINISHED', 'Finished'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('data', models.TextField(blank=True, default='')),
+                ('data_format', models.CharField(blank=True, default='csv', max_length=10)),
+                ('rotate', models.BooleanField(default=False)),
+                ('ids', models.JSONField(blank=True, default=list)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Provisioning Job',
+                'verbose_name_plural': 'Provisioning Jobs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='submissions_status_2dc38b_idx')],
+            },
+        ),
+    ]
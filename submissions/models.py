@@ -1,9 +1,19 @@
+import hashlib
+import secrets
+import uuid
+
 from django.db import models
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.contrib.auth.models import User
-import secrets
+from django.utils import timezone
+
+from anonplatform import metrics
 
-from .utils import generate_receipt_code
+from .allocators import access_code_allocator, receipt_allocator
+
+
+def generate_webhook_secret() -> str:
+    return f"whsec_{secrets.token_urlsafe(32)}"
 
 
 class HrAccessCode(models.Model):
@@ -28,6 +38,25 @@ class HrAccessCode(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+
+    class NotificationMode(models.TextChoices):
+        IMMEDIATE = "IMMEDIATE", "One email per submission"
+        BATCHED = "BATCHED", "Digest every N minutes"
+        DAILY = "DAILY", "Daily digest"
+
+    notification_mode = models.CharField(
+        max_length=10,
+        choices=NotificationMode.choices,
+        default=NotificationMode.IMMEDIATE,
+        help_text="Digests summarise all new submissions in one email (sent by `manage.py send_digests`).",
+    )
+    digest_interval_minutes = models.PositiveIntegerField(
+        default=15,
+        help_text="How often a batched digest is sent, if there is anything new.",
+    )
+    last_digest_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Set by `manage.py send_reminders` when HR was last reminded of overdue submissions
+    last_reminder_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     def get_notification_email(self):
         """Get the email address for notifications."""
@@ -43,12 +72,16 @@ class HrAccessCode(models.Model):
     @classmethod
     def generate_unique_code(cls) -> str:
         """Generate a unique 6-digit access code."""
-        max_attempts = 100
-        for _ in range(max_attempts):
-            code = ''.join(secrets.choice('0123456789') for _ in range(6))
-            if not cls.objects.filter(access_code=code).exists():
-                return code
-        raise RuntimeError("Failed to generate unique access code after multiple attempts.")
+        return access_code_allocator().allocate()
+
+    def rotate_code(self) -> str:
+        """Assign a fresh access code and return the old one to the pool."""
+        old_code = self.access_code
+        with transaction.atomic():
+            self.access_code = self.generate_unique_code()
+            self.save(update_fields=["access_code", "updated_at"])
+            access_code_allocator().release(old_code)
+        return self.access_code
 
     @classmethod
     def get_or_create_for_user(cls, user: User) -> "HrAccessCode":
@@ -116,6 +149,10 @@ class HrAccessCode(models.Model):
                     else:
                         raise
             
+            # Raw INSERT bypasses post_save, so refresh the shared index explicitly
+            from . import access_index
+            access_index.invalidate_on_commit()
+            
             # Reconstruct object from database
             with connection.cursor() as cursor:
                 cursor.execute(
@@ -177,24 +214,89 @@ class Submission(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set once HR has been emailed about this submission (immediately or in a digest)
+    notified_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Small: only submissions still waiting for a digest
+            models.Index(
+                fields=["hr_access_code"],
+                name="submission_unnotified_idx",
+                condition=models.Q(notified_at__isnull=True),
+            ),
+            # Overdue scan for reminders: grouped per HR account and status,
+            # answered from the index alone
+            models.Index(
+                fields=["hr_access_code", "status", "updated_at"],
+                name="submission_status_age_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.receipt_code} ({self.type})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the post_save webhook signal tell a status change from any other save
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
     @classmethod
     def create_with_unique_receipt(cls, **kwargs) -> "Submission":
         """
-        Create a submission with a digits-only receipt code, retrying on collision.
+        Create a submission with a digits-only receipt code from the allocator.
+
+        Allocated codes never repeat, so the retry only covers codes issued
+        randomly before the allocator existed. The code is drawn outside the
+        savepoint so a failed attempt cannot roll its reservation back.
         """
         max_attempts = 10
         for _ in range(max_attempts):
+            receipt_code = receipt_allocator().next_code()
             try:
-                return cls.objects.create(receipt_code=generate_receipt_code(), **kwargs)
+                with transaction.atomic():
+                    return cls.objects.create(receipt_code=receipt_code, **kwargs)
             except IntegrityError:
+                metrics.receipt_collision()
                 continue
         raise RuntimeError("Failed to generate unique receipt code after multiple attempts.")
 
 
+class AllocatorCounter(models.Model):
+    """Monotonic counter behind a code allocator (see allocators.py)."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.name} = {self.value}"
+
+
+class RateLimitBucket(models.Model):
+    """GCRA state for one rate-limit key (see ratelimit.py), shared by every worker."""
+    key = models.CharField(max_length=200, primary_key=True)
+    # Theoretical arrival time, Unix seconds
+    tat = models.FloatField()
+    # Outcome of the last hit, returned by the same UPSERT that updates ``tat``
+    allowed = models.BooleanField(default=True)
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class IdempotencyKey(models.Model):
+    """A claimed form idempotency key and, once handled, its result (see idempotency.py)."""
+    # "<scope>:<key>"; the primary key is what makes a claim atomic
+    key = models.CharField(max_length=100, primary_key=True)
+    # None while the first request is still running
+    result = models.JSONField(null=True, blank=True)
+    claimed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self) -> str:
+        return self.key
+
+
 class HrResponse(models.Model):
     submission = models.OneToOneField(
         Submission,
@@ -207,3 +309,230 @@ class HrResponse(models.Model):
 
     def __str__(self) -> str:
         return f"Response for {self.submission.receipt_code}"
+
+
+class ReleasedAccessCode(models.Model):
+    """An access code freed by deletion or rotation, waiting to be reused."""
+    code = models.CharField(max_length=20, unique=True)
+    released_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return self.code
+
+
+class IntakeApiToken(models.Model):
+    """
+    Bearer token for the JSON batch submission API, scoped to one HR access code.
+    Only a SHA-256 hash of the token is stored.
+    """
+    hr_access_code = models.ForeignKey(
+        HrAccessCode,
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+    )
+    name = models.CharField(max_length=100, blank=True, default="")
+    token_prefix = models.CharField(max_length=12)
+    token_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Intake API Token"
+        verbose_name_plural = "Intake API Tokens"
+
+    def __str__(self) -> str:
+        return f"{self.token_prefix}… ({self.name or self.hr_access_code.access_code})"
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def issue(cls, hr_access_code: HrAccessCode, name: str = "") -> tuple:
+        """Create a token and return (instance, plaintext token). The plaintext is not stored."""
+        token = f"kx_{secrets.token_urlsafe(32)}"
+        instance = cls.objects.create(
+            hr_access_code=hr_access_code,
+            name=name,
+            token_prefix=token[:12],
+            token_hash=cls.hash_token(token),
+        )
+        return instance, token
+
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be sent by `manage.py run_outbox` (see outbox.py).
+    Written in the same transaction as the change it reports on.
+    """
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    kind = models.CharField(max_length=50)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, default="")
+    recipients = models.JSONField(default=list)
+    redact_after_send = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox Message"
+        verbose_name_plural = "Outbox Messages"
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} to {', '.join(self.recipients)} ({self.status})"
+
+
+class ProvisioningJob(models.Model):
+    """
+    A bulk provisioning upload or access code rotation started from the admin
+    and run by `manage.py run_provisioning` (see provisioning.py).
+    """
+    class Kind(models.TextChoices):
+        PROVISION = "PROVISION", "Provision"
+        ROTATE = "ROTATE", "Rotate codes"
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        RUNNING = "RUNNING", "Running"
+        FINISHED = "FINISHED", "Finished"
+        FAILED = "FAILED", "Failed"
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    name = models.CharField(max_length=255, blank=True, default="")
+    # PROVISION: the uploaded file's text and format ("csv" or "jsonl")
+    data = models.TextField(blank=True, default="")
+    data_format = models.CharField(max_length=10, blank=True, default="csv")
+    rotate = models.BooleanField(default=False)
+    # ROTATE: HrAccessCode ids
+    ids = models.JSONField(default=list, blank=True)
+    # Rows (or ids) done; saved in the same transaction as each chunk
+    position = models.PositiveIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Renewed after every chunk; a RUNNING job whose lease expired is resumed
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Provisioning Job"
+        verbose_name_plural = "Provisioning Jobs"
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} {self.name or self.id} ({self.status})"
+
+
+class IntakeEntry(models.Model):
+    """
+    A submission accepted with SUBMISSION_INTAKE_MODE=queued, waiting for
+    `manage.py flush_intake` to create it (see intake.py).
+    """
+    receipt_code = models.CharField(max_length=20, unique=True)
+    # {"site_url", "notify", "fields"}: what the flusher needs to create and notify
+    record = models.JSONField()
+    enqueued_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Intake Entry"
+        verbose_name_plural = "Intake Entries"
+
+    def __str__(self) -> str:
+        return self.receipt_code
+
+
+class ReminderLog(models.Model):
+    """One reminder email about overdue submissions sent to an HR account."""
+    hr_access_code = models.ForeignKey(
+        HrAccessCode,
+        on_delete=models.CASCADE,
+        related_name="reminder_logs",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    new_count = models.PositiveIntegerField(default=0)
+    in_review_count = models.PositiveIntegerField(default=0)
+    oldest_updated_at = models.DateTimeField(null=True, blank=True)
+    # Ids of the submissions listed in the email (the oldest ones)
+    submission_ids = models.JSONField(default=list)
+
+    class Meta:
+        verbose_name = "Reminder Log"
+        verbose_name_plural = "Reminder Logs"
+
+    def __str__(self) -> str:
+        return f"Reminder to {self.hr_access_code.access_code} ({self.new_count + self.in_review_count} overdue)"
+
+
+class WebhookEndpoint(models.Model):
+    """
+    A URL that receives signed JSON events about one HR access code's submissions.
+    Delivered by `manage.py run_webhooks` (see webhooks.py).
+    """
+    hr_access_code = models.ForeignKey(
+        HrAccessCode,
+        on_delete=models.CASCADE,
+        related_name="webhook_endpoints",
+    )
+    url = models.URLField(max_length=500)
+    secret = models.CharField(
+        max_length=100,
+        default=generate_webhook_secret,
+        help_text="Shared secret for the X-Webhook-Signature header. Give it to the receiver.",
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_success_at = models.DateTimeField(null=True, blank=True, editable=False)
+    last_failure_at = models.DateTimeField(null=True, blank=True, editable=False)
+    consecutive_failures = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        verbose_name = "Webhook Endpoint"
+        verbose_name_plural = "Webhook Endpoints"
+
+    def __str__(self) -> str:
+        return f"{self.url} ({self.hr_access_code.access_code})"
+
+
+class WebhookDelivery(models.Model):
+    """One event queued for one endpoint. Events for the same endpoint are POSTed together."""
+    class Status(models.TextChoices):
+        PENDING = "PENDING", "Pending"
+        SENT = "SENT", "Sent"
+        FAILED = "FAILED", "Failed"
+
+    endpoint = models.ForeignKey(WebhookEndpoint, on_delete=models.CASCADE, related_name="deliveries")
+    event_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    event = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Webhook Delivery"
+        verbose_name_plural = "Webhook Deliveries"
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.event} to {self.endpoint.url} ({self.status})"
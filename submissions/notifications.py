@@ -0,0 +1,314 @@
+"""
+HR notification emails for new submissions.
+
+Messages go through the outbox (outbox.py); call these inside the transaction
+that creates the submissions. Create them with
+``notified_at=initial_notified_at(hr_code)`` so the INSERT already records the
+immediate email and notifying costs no UPDATE.
+
+HR accounts whose ``notification_mode`` is BATCHED or DAILY get no email per
+submission. Their submissions keep ``notified_at`` empty until
+``send_due_digests()`` (``manage.py send_digests``) sends one summary per HR
+account, so a burst of thousands of submissions costs one provider call.
+Digests cover every submission with ``notified_at`` empty, whatever the mode
+is now: changing the mode in the admin sends what was waiting at once
+(``flush_pending_digest()``), and anything still left for an IMMEDIATE
+account goes out with the next ``send_digests`` run.
+
+``send_due_reminders()`` (``manage.py send_reminders``) reminds HR accounts of
+submissions left NEW or IN_REVIEW for too long, at most once per
+``SUBMISSION_REMINDER_INTERVAL_HOURS``.
+"""
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import groupby
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, Min, OuterRef, Q
+from django.utils import timezone
+
+from . import outbox
+
+# Lines listed in one summary email; the rest are counted
+SUMMARY_LINES = 50
+
+
+@dataclass
+class DigestResult:
+    tenants: int = 0
+    submissions: int = 0
+
+
+@dataclass
+class ReminderResult:
+    tenants: int = 0
+    submissions: int = 0
+
+
+def _notifies_immediately(hr_code) -> bool:
+    from .models import HrAccessCode
+
+    return hr_code is None or hr_code.notification_mode == HrAccessCode.NotificationMode.IMMEDIATE
+
+
+def initial_notified_at(hr_code) -> Optional[datetime]:
+    """``notified_at`` for a submission about to be created and notified in the same transaction."""
+    return timezone.now() if _notifies_immediately(hr_code) else None
+
+
+def _mark_notified(submissions) -> None:
+    from .models import Submission
+
+    # Only for submissions created without initial_notified_at()
+    unmarked = [s.pk for s in submissions if s.notified_at is None]
+    if unmarked:
+        Submission.objects.filter(pk__in=unmarked).update(notified_at=timezone.now())
+
+
+def _summary_lines(submissions, total: int):
+    lines = [f"- {s.get_type_display()}: {s.title} (receipt {s.receipt_code})" for s in submissions[:SUMMARY_LINES]]
+    if total > SUMMARY_LINES:
+        lines.append(f"... and {total - SUMMARY_LINES} more")
+    return lines
+
+
+def notify_new_submission(submission, recipient_emails, admin_url: str) -> None:
+    """Queue an email to the HR tied to the access code about a new submission."""
+    if not _notifies_immediately(submission.hr_access_code):
+        return
+    outbox.enqueue(
+        kind="new_submission",
+        subject=f"New anonymous submission: {submission.get_type_display()}",
+        body=(
+            f"Type: {submission.get_type_display()}\n"
+            f"Title: {submission.title}\n"
+            f"Receipt: {submission.receipt_code}\n"
+            f"Submitted: {submission.created_at.strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
+            f"View in admin: {admin_url}\n"
+        ),
+        recipients=recipient_emails,
+    )
+    _mark_notified([submission])
+
+
+def notify_new_submissions_batch(submissions, recipient_emails, admin_url: str) -> None:
+    """Queue one summary email for submissions created together through the API."""
+    if not submissions:
+        return
+    if len(submissions) == 1:
+        notify_new_submission(submissions[0], recipient_emails, admin_url)
+        return
+    if not _notifies_immediately(submissions[0].hr_access_code):
+        return
+    outbox.enqueue(
+        kind="new_submission_batch",
+        subject=f"{len(submissions)} new anonymous submissions",
+        body="\n".join(_summary_lines(submissions, len(submissions))) + f"\n\nView in admin: {admin_url}\n",
+        recipients=recipient_emails,
+    )
+    _mark_notified(submissions)
+
+
+def _digest_due(hr_code, now: datetime) -> bool:
+    from .models import HrAccessCode
+
+    last = hr_code.last_digest_at
+    if hr_code.notification_mode == HrAccessCode.NotificationMode.IMMEDIATE:
+        # Left waiting from before a switch to IMMEDIATE
+        return True
+    if hr_code.notification_mode == HrAccessCode.NotificationMode.BATCHED:
+        return last is None or now - last >= timedelta(minutes=hr_code.digest_interval_minutes)
+    # DAILY: once per day, after NOTIFICATION_DIGEST_DAILY_HOUR (UTC)
+    send_at = datetime.combine(now.date(), time(settings.NOTIFICATION_DIGEST_DAILY_HOUR), tzinfo=dt_timezone.utc)
+    return now >= send_at and (last is None or last < send_at)
+
+
+def _pending_submissions(**filters):
+    """Submissions waiting for a digest, locked so concurrent runs cannot send them twice."""
+    from .models import Submission
+
+    return (
+        Submission.objects.select_for_update(skip_locked=True, of=("self",))
+        .filter(notified_at__isnull=True, **filters)
+        .select_related("hr_access_code__user")
+        .only(
+            "id", "type", "title", "receipt_code", "hr_access_code",
+            "hr_access_code__notification_mode", "hr_access_code__digest_interval_minutes",
+            "hr_access_code__last_digest_at", "hr_access_code__notification_email",
+            "hr_access_code__user__email",
+        )
+        .order_by("hr_access_code_id", "id")
+    )
+
+
+def _queue_digest(hr_code, submissions) -> None:
+    outbox.enqueue(
+        kind="digest",
+        subject=f"{len(submissions)} new anonymous submission{'s' if len(submissions) != 1 else ''}",
+        body=(
+            "New since your last digest:\n\n"
+            + "\n".join(_summary_lines(submissions, len(submissions)))
+            + f"\n\nView in admin: {settings.SITE_URL}/admin/submissions/submission/\n"
+        ),
+        recipients=[hr_code.get_notification_email()],
+    )
+
+
+def _record_digests(hr_code_ids, submission_ids, now: datetime) -> None:
+    from .models import HrAccessCode, Submission
+
+    # Rows created after the pending query are left for the next digest
+    for start in range(0, len(submission_ids), 1000):
+        Submission.objects.filter(id__in=submission_ids[start:start + 1000]).update(notified_at=now)
+    if hr_code_ids:
+        HrAccessCode.objects.filter(id__in=hr_code_ids).update(last_digest_at=now)
+
+
+def _due_hr_code_ids(now: datetime) -> list:
+    """Active HR accounts with submissions waiting whose digest is due now."""
+    from .models import HrAccessCode, Submission
+
+    waiting = (
+        HrAccessCode.objects.filter(is_active=True)
+        .filter(Exists(Submission.objects.filter(hr_access_code=OuterRef("pk"), notified_at__isnull=True)))
+        .only("id", "notification_mode", "digest_interval_minutes", "last_digest_at")
+    )
+    return [hr_code.id for hr_code in waiting if _digest_due(hr_code, now)]
+
+
+def send_due_digests(now: Optional[datetime] = None) -> DigestResult:
+    """Queue one summary email per HR account whose digest is due."""
+    now = now or timezone.now()
+    result = DigestResult()
+    # Decided per account before anything is locked: accounts that are not due
+    # cost one row in this query rather than a lock on each waiting submission
+    due_ids = _due_hr_code_ids(now)
+    if not due_ids:
+        return result
+    with transaction.atomic():
+        # One query for the waiting submissions of every due account, whatever
+        # its mode is now, grouped per HR account below
+        pending = _pending_submissions(hr_access_code_id__in=due_ids, hr_access_code__is_active=True)
+
+        sent_ids = []
+        notified_ids = []
+        for _, group in groupby(pending, key=lambda s: s.hr_access_code_id):
+            submissions = list(group)
+            hr_code = submissions[0].hr_access_code
+            if not _digest_due(hr_code, now):
+                continue
+            _queue_digest(hr_code, submissions)
+            sent_ids.append(hr_code.id)
+            notified_ids.extend(s.id for s in submissions)
+            result.tenants += 1
+            result.submissions += len(submissions)
+
+        _record_digests(sent_ids, notified_ids, now)
+    return result
+
+
+def flush_pending_digest(hr_code, now: Optional[datetime] = None) -> int:
+    """
+    Send one account's waiting submissions now, whatever its mode, e.g. when
+    the mode changes. Returns how many submissions the digest covered.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        submissions = list(_pending_submissions(hr_access_code=hr_code))
+        if not submissions:
+            return 0
+        _queue_digest(hr_code, submissions)
+        _record_digests([hr_code.id], [s.id for s in submissions], now)
+    return len(submissions)
+
+
+def _overdue(now: datetime) -> Q:
+    from .models import Submission
+
+    return Q(
+        status=Submission.Status.NEW,
+        updated_at__lt=now - timedelta(hours=settings.SUBMISSION_REMINDER_NEW_HOURS),
+    ) | Q(
+        status=Submission.Status.IN_REVIEW,
+        updated_at__lt=now - timedelta(hours=settings.SUBMISSION_REMINDER_IN_REVIEW_HOURS),
+    )
+
+
+def send_due_reminders(now: Optional[datetime] = None) -> ReminderResult:
+    """Queue one reminder per HR account with overdue submissions, and log what it covered."""
+    from .models import HrAccessCode, ReminderLog, Submission
+
+    now = now or timezone.now()
+    result = ReminderResult()
+    overdue = _overdue(now)
+
+    # One grouped query, answered from the (hr_access_code, status, updated_at)
+    # index; no join, so the table itself is not read
+    totals = {}
+    for hr_code_id, status, count, oldest in (
+        Submission.objects.filter(overdue, hr_access_code__isnull=False)
+        .values_list("hr_access_code_id", "status")
+        .annotate(count=Count("*"), oldest=Min("updated_at"))
+        .order_by()
+    ):
+        entry = totals.setdefault(hr_code_id, {"counts": {}, "oldest": oldest})
+        entry["counts"][status] = count
+        entry["oldest"] = min(entry["oldest"], oldest)
+    if not totals:
+        return result
+
+    interval = timedelta(hours=settings.SUBMISSION_REMINDER_INTERVAL_HOURS)
+    admin_url = f"{settings.SITE_URL}/admin/submissions/submission/"
+    with transaction.atomic():
+        # Locked so concurrent runs cannot remind the same account twice
+        due = (
+            HrAccessCode.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(last_reminder_at__isnull=True) | Q(last_reminder_at__lte=now - interval), id__in=totals, is_active=True)
+            .select_related("user")
+        )
+        logs = []
+        for hr_code in due:
+            counts = totals[hr_code.id]["counts"]
+            new_count = counts.get(Submission.Status.NEW, 0)
+            in_review_count = counts.get(Submission.Status.IN_REVIEW, 0)
+            total = new_count + in_review_count
+            listed = list(
+                Submission.objects.filter(overdue, hr_access_code=hr_code)
+                .only("id", "type", "title", "receipt_code", "status", "updated_at")
+                .order_by("updated_at")[:SUMMARY_LINES]
+            )
+            lines = [
+                f"- {s.get_type_display()}: {s.title} ({s.get_status_display()} since "
+                f"{s.updated_at.strftime('%Y-%m-%d')}, receipt {s.receipt_code})"
+                for s in listed
+            ]
+            if total > len(listed):
+                lines.append(f"... and {total - len(listed)} more")
+            queued = outbox.enqueue(
+                kind="reminder",
+                subject=f"{total} anonymous submission{'s' if total != 1 else ''} waiting for a response",
+                body=(
+                    f"New for more than {settings.SUBMISSION_REMINDER_NEW_HOURS} hours: {new_count}\n"
+                    f"In review for more than {settings.SUBMISSION_REMINDER_IN_REVIEW_HOURS} hours: {in_review_count}\n\n"
+                    + "\n".join(lines)
+                    + f"\n\nView in admin: {admin_url}\n"
+                ),
+                recipients=[hr_code.get_notification_email()],
+            )
+            if queued is None:
+                continue
+            logs.append(ReminderLog(
+                hr_access_code=hr_code,
+                new_count=new_count,
+                in_review_count=in_review_count,
+                oldest_updated_at=totals[hr_code.id]["oldest"],
+                submission_ids=[s.id for s in listed],
+            ))
+            result.tenants += 1
+            result.submissions += total
+
+        ReminderLog.objects.bulk_create(logs)
+        HrAccessCode.objects.filter(id__in=[log.hr_access_code_id for log in logs]).update(last_reminder_at=now)
+    return result
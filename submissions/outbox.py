@@ -0,0 +1,182 @@
+"""
+Durable email outbox.
+
+Views never talk to the email provider. They call ``enqueue()`` inside the
+transaction that creates the submission or registration, so the email exists
+exactly when the change it reports on does, and ``manage.py run_outbox``
+delivers it later.
+
+Workers claim due messages with ``select_for_update(skip_locked=True)`` in a
+short transaction that moves their ``available_at`` to the end of a lease
+(``OUTBOX_LEASE_SECONDS``), then send with no transaction or row lock open,
+and record the outcome in a second short transaction. Several workers can
+drain the queue without sending anything twice, and the messages of a worker
+that dies mid-batch become due again when its lease runs out. Failed sends are retried with exponential backoff (or the provider's
+Retry-After) until ``OUTBOX_MAX_ATTEMPTS``, then marked FAILED; errors the
+provider reports as permanent (4xx other than 429) fail at once.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from anonplatform import timing
+from anonplatform.email_backends import EmailProviderError, send_each
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DrainResult:
+    claimed: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    # Seconds each send took, in claim order
+    latencies: List[float] = field(default_factory=list)
+
+
+def enqueue(
+    *,
+    kind: str,
+    subject: str,
+    body: str,
+    recipients: Iterable[str],
+    from_email: Optional[str] = None,
+    redact_after_send: bool = False,
+):
+    """
+    Queue an email. Call inside the transaction that makes the change it reports on.
+
+    ``redact_after_send`` blanks the body once delivered (e.g. temporary passwords).
+    """
+    from .models import OutboxMessage
+
+    recipients = [r for r in recipients if r]
+    if not recipients:
+        return None
+    with timing.span("email"):
+        return OutboxMessage.objects.create(
+            kind=kind,
+            subject=subject[:255],
+            body=body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=recipients,
+            redact_after_send=redact_after_send,
+        )
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 3600))
+
+
+def drain(batch_size: Optional[int] = None) -> DrainResult:
+    """Claim up to ``batch_size`` due messages, send them and record the outcome."""
+    from .models import OutboxMessage
+
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    result = DrainResult()
+    lease_until = timezone.now() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxMessage.Status.PENDING, available_at__lte=timezone.now())
+            .order_by("available_at", "id")[:batch_size]
+        )
+        if not messages:
+            return result
+        OutboxMessage.objects.filter(id__in=[m.id for m in messages]).update(available_at=lease_until)
+    result.claimed = len(messages)
+
+    emails = [
+        EmailMessage(
+            subject=message.subject,
+            body=message.body,
+            from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+            to=message.recipients,
+        )
+        for message in messages
+    ]
+    # One provider connection (pooled session) for the whole batch; API
+    # backends send the messages concurrently
+    try:
+        with get_connection(fail_silently=False) as connection:
+            errors = send_each(connection, emails)
+    except Exception as e:
+        # e.g. a misconfigured backend: a failed attempt for every message, so
+        # they back off and eventually fail instead of being claimed forever
+        logger.exception("Outbox batch of %d message(s) could not be sent", len(emails))
+        errors = [e] * len(emails)
+
+    with transaction.atomic():
+        # Skip messages whose lease ran out and that another worker claimed since
+        held = set(
+            OutboxMessage.objects.select_for_update()
+            .filter(id__in=[m.id for m in messages], status=OutboxMessage.Status.PENDING, available_at=lease_until)
+            .values_list("id", flat=True)
+        )
+        if len(held) < len(messages):
+            logger.warning("Outbox lease expired for %d message(s) before their results were recorded", len(messages) - len(held))
+        outcomes = [(m, e, err) for m, e, err in zip(messages, emails, errors) if m.id in held]
+        for message, email, error in outcomes:
+            message.attempts += 1
+            if hasattr(email, "send_latency"):
+                result.latencies.append(email.send_latency)
+            if error is not None:
+                message.last_error = f"{type(error).__name__}: {error}"[:2000]
+                permanent = isinstance(error, EmailProviderError) and not error.retryable
+                if permanent or message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    message.status = OutboxMessage.Status.FAILED
+                    result.failed += 1
+                    logger.error("Outbox message %s (%s) failed permanently: %s", message.id, message.kind, message.last_error)
+                else:
+                    delay = _backoff(message.attempts)
+                    if getattr(error, "retry_after", None):
+                        delay = max(delay, timedelta(seconds=error.retry_after))
+                    message.available_at = timezone.now() + delay
+                    result.retried += 1
+                    logger.warning("Outbox message %s (%s) attempt %d failed: %s", message.id, message.kind, message.attempts, message.last_error)
+                continue
+            message.status = OutboxMessage.Status.SENT
+            message.sent_at = timezone.now()
+            message.last_error = ""
+            if message.redact_after_send:
+                message.body = ""
+            result.sent += 1
+
+        OutboxMessage.objects.bulk_update(
+            [message for message, _, _ in outcomes], ["attempts", "status", "sent_at", "available_at", "last_error", "body"]
+        )
+    return result
+
+
+def purge_sent(older_than_days: Optional[int] = None) -> int:
+    from .models import OutboxMessage
+
+    days = settings.OUTBOX_KEEP_SENT_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboxMessage.objects.filter(status=OutboxMessage.Status.SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def stats() -> dict:
+    """Queue depth and age of the oldest message still waiting to be sent."""
+    from .models import OutboxMessage
+
+    Status = OutboxMessage.Status
+    totals = OutboxMessage.objects.aggregate(
+        pending=Count("id", filter=Q(status=Status.PENDING)),
+        retrying=Count("id", filter=Q(status=Status.PENDING, attempts__gt=0)),
+        failed=Count("id", filter=Q(status=Status.FAILED)),
+        sent_last_hour=Count("id", filter=Q(status=Status.SENT, sent_at__gte=timezone.now() - timedelta(hours=1))),
+        oldest_pending=Min("created_at", filter=Q(status=Status.PENDING)),
+    )
+    oldest = totals.pop("oldest_pending")
+    totals["oldest_pending_age"] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return totals
@@ -0,0 +1,398 @@
+"""
+Bulk HR tenant provisioning and access code rotation.
+
+Rows are processed in chunks; each chunk is one transaction that costs a fixed
+number of queries (bulk_create / bulk_update) no matter how many tenants it
+holds. After every committed chunk the progress is written to a checkpoint
+file, so an interrupted run resumes where it stopped. Re-processing a chunk is
+harmless: existing users and access codes are reused, not duplicated.
+
+Uploads and bulk rotations started from the admin are stored as
+ProvisioningJob rows and run by ``manage.py run_provisioning``, which saves a
+job's position in the same transaction as each chunk. A worker that is
+recycled or redeployed mid-job leaves it RUNNING with an expiring lease, and
+the next worker resumes it from that position.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import timedelta
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import access_index
+from .allocators import access_code_allocator
+from .models import HrAccessCode, ProvisioningJob
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProvisionResult:
+    rows: int = 0
+    skipped: int = 0
+    users_created: int = 0
+    codes_created: int = 0
+    codes_rotated: int = 0
+    elapsed: float = 0.0
+    finished: bool = False
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def _parse_rows(f: TextIO, data_format: str) -> Iterator[dict]:
+    if data_format == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(f)
+
+
+def file_format(name: str) -> str:
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Yield tenant rows from a CSV (with header) or JSON-lines file."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from _parse_rows(f, file_format(path))
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _clean(row: dict) -> Optional[dict]:
+    email = (row.get("email") or "").strip().lower()
+    if not email or "@" not in email:
+        return None
+    website = (row.get("website") or row.get("company_website") or "").strip()
+    if website and not website.startswith(("http://", "https://")):
+        website = ""
+    return {
+        "email": email,
+        "company_name": (row.get("company_name") or "").strip()[:150],
+        "website": website[:200],
+        "notification_email": (row.get("notification_email") or email).strip(),
+    }
+
+
+def _usernames(emails: List[str]) -> dict:
+    """Pick unique usernames for new users with one query, following hr_register's scheme."""
+    bases = {}
+    for email in emails:
+        base = re.sub(r"[^a-z0-9_]", "_", email.split("@")[0])[:20] or "hr"
+        bases[email] = base
+    taken = set(User.objects.filter(username__in=set(bases.values())).values_list("username", flat=True))
+    result = {}
+    for email, base in bases.items():
+        username = base
+        while username in taken:
+            username = f"{base}_{secrets.token_hex(3)}"
+        taken.add(username)
+        result[email] = username
+    return result
+
+
+def _users_by_email(emails: List[str]) -> dict:
+    """Existing users keyed by lowercased email; matched case-insensitively, oldest account wins."""
+    users = User.objects.annotate(email_lower=Lower("email")).filter(email_lower__in=emails).order_by("-id")
+    return {u.email_lower: u for u in users}
+
+
+def _provision_chunk(rows: List[dict], result: ProvisionResult, rotate: bool, passwords: Optional[list]) -> None:
+    by_email = {}
+    for row in rows:
+        cleaned = _clean(row)
+        if cleaned is None:
+            result.skipped += 1
+            continue
+        by_email[cleaned["email"]] = cleaned
+
+    with transaction.atomic():
+        users = _users_by_email(list(by_email))
+
+        new_emails = [e for e in by_email if e not in users]
+        usernames = _usernames(new_emails)
+        new_users = []
+        new_passwords = []
+        for email in new_emails:
+            user = User(username=usernames[email], email=email, is_staff=True, is_active=True)
+            if passwords is not None:
+                temp_password = secrets.token_urlsafe(10)
+                user.set_password(temp_password)
+                new_passwords.append((user.username, email, temp_password))
+            else:
+                user.set_unusable_password()
+            new_users.append(user)
+        User.objects.bulk_create(new_users)
+        result.users_created += len(new_users)
+        # Not every backend returns primary keys from bulk inserts
+        users = _users_by_email(list(by_email))
+
+        not_staff = [u for u in users.values() if not u.is_staff or not u.is_active]
+        for user in not_staff:
+            user.is_staff = user.is_active = True
+        User.objects.bulk_update(not_staff, ["is_staff", "is_active"])
+
+        email_by_user_id = {u.id: email for email, u in users.items()}
+        existing = {c.user_id: c for c in HrAccessCode.objects.filter(user__in=list(users.values()))}
+
+        missing = [u for u in users.values() if u.id not in existing]
+        fresh_codes = access_code_allocator().allocate_many(len(missing)) if missing else []
+        HrAccessCode.objects.bulk_create([
+            HrAccessCode(
+                user=user,
+                access_code=code,
+                company_name=by_email[email_by_user_id[user.id]]["company_name"],
+                company_website=by_email[email_by_user_id[user.id]]["website"],
+                notification_email=by_email[email_by_user_id[user.id]]["notification_email"],
+                is_active=True,
+            )
+            for user, code in zip(missing, fresh_codes)
+        ])
+        result.codes_created += len(missing)
+
+        now = timezone.now()
+        to_update = list(existing.values())
+        for hr_code in to_update:
+            data = by_email[email_by_user_id[hr_code.user_id]]
+            hr_code.updated_at = now
+            hr_code.company_name = data["company_name"] or hr_code.company_name
+            hr_code.company_website = data["website"] or hr_code.company_website
+            hr_code.notification_email = data["notification_email"] or hr_code.notification_email
+        fields = ["company_name", "company_website", "notification_email", "updated_at"]
+        if rotate and to_update:
+            _assign_new_codes(to_update)
+            fields.append("access_code")
+            result.codes_rotated += len(to_update)
+        HrAccessCode.objects.bulk_update(to_update, fields)
+
+        # Bulk writes skip post_save
+        access_index.invalidate_on_commit()
+
+    if passwords is not None:
+        passwords.extend(new_passwords)
+    result.rows += len(rows)
+
+
+def _assign_new_codes(hr_codes: List[HrAccessCode]) -> None:
+    old_codes = [c.access_code for c in hr_codes]
+    now = timezone.now()
+    for hr_code, code in zip(hr_codes, access_code_allocator().allocate_many(len(hr_codes))):
+        hr_code.access_code = code
+        hr_code.updated_at = now
+    access_code_allocator().release(*old_codes)
+
+
+def provision(
+    rows: Iterable[dict],
+    *,
+    chunk_size: int = 500,
+    checkpoint: Optional[str] = None,
+    start: int = 0,
+    result: Optional[ProvisionResult] = None,
+    rotate: bool = False,
+    passwords: Optional[list] = None,
+    progress: Optional[Callable[[ProvisionResult], None]] = None,
+    on_chunk: Optional[Callable[[int, ProvisionResult], None]] = None,
+) -> ProvisionResult:
+    """
+    Create staff users and HrAccessCode rows for ``rows`` in bulk.
+
+    ``rotate`` also issues new codes to tenants that already have one. When
+    ``passwords`` is a list, new users get temporary passwords (appended as
+    (username, email, password)); otherwise they get unusable passwords, which
+    avoids one bcrypt hash per tenant.
+
+    Rows before ``start`` (or the checkpoint's position) are skipped, and
+    ``result`` carries totals over from an earlier run. ``on_chunk(position,
+    result)`` is called inside each chunk's transaction.
+    """
+    result = result or ProvisionResult()
+    done = max(start, _read_checkpoint(checkpoint))
+    started = time.perf_counter() - result.elapsed
+    position = 0
+    for chunk in _chunks(rows, chunk_size):
+        position += len(chunk)
+        if position <= done:
+            continue
+        with transaction.atomic():
+            _provision_chunk(chunk, result, rotate, passwords)
+            result.elapsed = time.perf_counter() - started
+            if on_chunk:
+                on_chunk(position, result)
+        _write_checkpoint(checkpoint, position, result)
+        if progress:
+            progress(result)
+    result.elapsed = time.perf_counter() - started
+    result.finished = True
+    _write_checkpoint(checkpoint, position, result)
+    return result
+
+
+def rotate_access_codes(
+    ids: Iterable[int],
+    *,
+    chunk_size: int = 500,
+    start: int = 0,
+    result: Optional[ProvisionResult] = None,
+    on_chunk: Optional[Callable[[int, ProvisionResult], None]] = None,
+) -> ProvisionResult:
+    """Issue new codes to the given HrAccessCode ids, one bulk_update per chunk."""
+    result = result or ProvisionResult()
+    started = time.perf_counter() - result.elapsed
+    ids = list(ids)
+    for position in range(start, len(ids), chunk_size):
+        with transaction.atomic():
+            hr_codes = list(HrAccessCode.objects.select_for_update().filter(id__in=ids[position:position + chunk_size]))
+            _assign_new_codes(hr_codes)
+            HrAccessCode.objects.bulk_update(hr_codes, ["access_code", "updated_at"])
+            access_index.invalidate_on_commit()
+            result.rows += len(hr_codes)
+            result.codes_rotated += len(hr_codes)
+            result.elapsed = time.perf_counter() - started
+            if on_chunk:
+                on_chunk(min(position + chunk_size, len(ids)), result)
+    result.elapsed = time.perf_counter() - started
+    result.finished = True
+    return result
+
+
+def _read_checkpoint(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f).get("position", 0)
+
+
+def _write_checkpoint(path: Optional[str], position: int, result: ProvisionResult) -> None:
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"position": position, "rate": result.rate, **asdict(result)}, f)
+    os.replace(tmp_path, path)
+
+
+def create_provision_job(name: str, data: str, *, rotate: bool = False) -> ProvisioningJob:
+    """Queue an uploaded CSV or JSON-lines file for run_provisioning."""
+    return ProvisioningJob.objects.create(
+        kind=ProvisioningJob.Kind.PROVISION,
+        name=name[:255],
+        data=data,
+        data_format=file_format(name),
+        rotate=rotate,
+    )
+
+
+def create_rotation_job(ids: List[int]) -> ProvisioningJob:
+    """Queue an access code rotation for run_provisioning."""
+    return ProvisioningJob.objects.create(
+        kind=ProvisioningJob.Kind.ROTATE,
+        name=f"{len(ids)} access code(s)",
+        ids=list(ids),
+    )
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=settings.PROVISIONING_JOB_LEASE_SECONDS)
+
+
+def claim_job() -> Optional[ProvisioningJob]:
+    """Take the oldest pending job, or a running one whose worker stopped renewing its lease."""
+    now = timezone.now()
+    Status = ProvisioningJob.Status
+    with transaction.atomic():
+        job = (
+            ProvisioningJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Status.PENDING) | Q(status=Status.RUNNING, lease_expires_at__lt=now))
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == Status.RUNNING:
+            logger.warning("Resuming provisioning job %s from position %d", job.id, job.position)
+        job.status = Status.RUNNING
+        job.lease_expires_at = now + _lease()
+        job.save(update_fields=["status", "lease_expires_at"])
+    return job
+
+
+def run_job(job: ProvisioningJob) -> ProvisionResult:
+    """
+    Run a claimed job to the end, saving its position with every chunk. A job
+    that raises is marked FAILED with the error; its committed chunks stay.
+    """
+    known = {f.name for f in fields(ProvisionResult)}
+    result = ProvisionResult(**{k: v for k, v in job.result.items() if k in known})
+    result.finished = False
+
+    def on_chunk(position, result):
+        job.position = position
+        job.result = asdict(result)
+        job.lease_expires_at = timezone.now() + _lease()
+        job.save(update_fields=["position", "result", "lease_expires_at"])
+
+    try:
+        if job.kind == ProvisioningJob.Kind.ROTATE:
+            result = rotate_access_codes(job.ids, start=job.position, result=result, on_chunk=on_chunk)
+        else:
+            rows = _parse_rows(io.StringIO(job.data, newline=""), job.data_format)
+            result = provision(rows, start=job.position, result=result, rotate=job.rotate, on_chunk=on_chunk)
+    except Exception as e:
+        logger.exception("Provisioning job %s failed", job.id)
+        job.status = ProvisioningJob.Status.FAILED
+        job.error = f"{type(e).__name__}: {e}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at"])
+        return result
+    job.status = ProvisioningJob.Status.FINISHED
+    job.result = asdict(result)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "finished_at"])
+    logger.info(
+        "Provisioning job %s finished: %d rows, %d users, %d codes, %d rotated, %.1f rows/s",
+        job.id, result.rows, result.users_created, result.codes_created, result.codes_rotated, result.rate,
+    )
+    return result
+
+
+def recent_jobs(limit: int = 10) -> List[dict]:
+    """Status of recent provisioning jobs, newest first."""
+    jobs = []
+    for job in ProvisioningJob.objects.defer("data", "ids").order_by("-created_at")[:limit]:
+        rows = job.result.get("rows", 0)
+        elapsed = job.result.get("elapsed", 0.0)
+        jobs.append({
+            **job.result,
+            "name": job.name,
+            "kind": job.get_kind_display(),
+            "status": job.get_status_display(),
+            "error": job.error,
+            "rate": rows / elapsed if elapsed else 0.0,
+        })
+    return jobs
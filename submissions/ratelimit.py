@@ -0,0 +1,195 @@
+"""
+Rate limiting with GCRA (generic cell rate algorithm).
+
+A limit of ``limit`` requests per ``period`` seconds lets a request through
+every ``period / limit`` seconds on average, with bursts of up to ``limit``.
+Each key stores one number, its theoretical arrival time (TAT):
+
+    tat = max(stored tat, now)
+    allowed = tat + interval - now <= period
+    if allowed: stored tat = tat + interval
+
+A request may cost more than one (``cost``, e.g. one per receipt code in a
+batch status lookup); it then advances the TAT by ``cost * interval``.
+
+Unlike a fixed window there is no reset: capacity refills continuously, so a
+client cannot burst twice across a window boundary, and a rejected request
+does not extend its own lockout.
+
+``LocalStore`` (the default) keeps TATs in process memory: a hit costs a dict
+lookup under a lock and no I/O, but each worker process counts on its own, so
+a client spread over N processes gets up to N times the limit. That is enough
+to stop abuse of the anonymous forms. ``DatabaseStore`` (RATE_LIMIT_STORE=database)
+keeps TATs in the RateLimitBucket table and applies the update in a single
+``INSERT ... ON CONFLICT DO UPDATE ... RETURNING`` statement, so concurrent
+requests on every worker and node are counted exactly once, at the price of
+one write per policy per request (two on /submit/). See
+``manage.py benchmark_ratelimit`` for the overhead.
+
+A policy either rejects (``"action": "reject"``, 429 with Retry-After) or asks
+the client to slow down (``"action": "delay"``): when the wait is at most
+``max_delay`` seconds the 429 says how long to wait instead of refusing, and
+only longer waits are refused. Neither waits in the server, so a flood of
+over-limit requests never holds a worker thread.
+
+Which requests are limited is declared in ``settings.RATE_LIMIT_POLICIES`` and
+compiled once by ``compile_policies()`` into a path -> policies dict, so the
+middleware does one dict lookup for paths without a policy.
+"""
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+# Fraction of hits that also delete idle buckets (TAT in the past)
+PURGE_PROBABILITY = 0.001
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the next request would be allowed (0 when allowed)
+    retry_after: float
+
+
+@dataclass(frozen=True)
+class Policy:
+    name: str
+    # What identifies a client: "ip", "access_code" or "ip_receipt_prefix"
+    key: str
+    limit: int
+    period: float
+    # "reject" refuses over-limit requests; "delay" tells clients that are at
+    # most max_delay seconds early to retry after that wait (never sleeps)
+    action: str = "reject"
+    max_delay: float = 0.0
+    methods: Tuple[str, ...] = ("POST",)
+    # What one request counts as: "request" (1) or "receipt_codes" (one per code
+    # in a JSON {"receipt_codes": [...]} body)
+    cost: str = "request"
+
+
+KEY_TYPES = ("ip", "access_code", "ip_receipt_prefix")
+ACTIONS = ("reject", "delay")
+COSTS = ("request", "receipt_codes")
+
+
+def compile_policies(config) -> Dict[str, Tuple[Policy, ...]]:
+    """
+    Turn RATE_LIMIT_POLICIES entries ({"name", "paths", "key", "limit", "period",
+    optional "action", "max_delay", "methods", "cost"}) into a path -> policies lookup.
+    """
+    table = {}
+    for entry in config:
+        entry = dict(entry)
+        paths = entry.pop("paths", ())
+        try:
+            policy = Policy(**{**entry, "methods": tuple(m.upper() for m in entry.get("methods", ("POST",)))})
+        except TypeError as exc:
+            raise ImproperlyConfigured(f"Invalid rate limit policy {entry.get('name')!r}: {exc}")
+        if policy.key not in KEY_TYPES:
+            raise ImproperlyConfigured(f"Rate limit policy {policy.name!r}: key must be one of {', '.join(KEY_TYPES)}")
+        if policy.action not in ACTIONS:
+            raise ImproperlyConfigured(f"Rate limit policy {policy.name!r}: action must be one of {', '.join(ACTIONS)}")
+        if policy.action == "delay" and policy.max_delay <= 0:
+            raise ImproperlyConfigured(f"Rate limit policy {policy.name!r}: action \"delay\" needs a max_delay > 0")
+        if policy.cost not in COSTS:
+            raise ImproperlyConfigured(f"Rate limit policy {policy.name!r}: cost must be one of {', '.join(COSTS)}")
+        if policy.limit < 1 or policy.period <= 0 or not paths:
+            raise ImproperlyConfigured(f"Rate limit policy {policy.name!r} needs paths, a limit >= 1 and a period > 0")
+        for path in paths:
+            table[path] = table.get(path, ()) + (policy,)
+    return table
+
+
+class LocalStore:
+    """TATs in process memory. Limits are per worker; use for one process or tests."""
+
+    def __init__(self):
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, now: float, interval: float, period: float):
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            allowed = tat + interval - now <= period
+            if allowed:
+                tat += interval
+                self._tats[key] = tat
+            if random.random() < PURGE_PROBABILITY:
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+        return allowed, tat
+
+
+class DatabaseStore:
+    """TATs in the RateLimitBucket table; one atomic statement per hit."""
+
+    def __init__(self, using: str = "default"):
+        self.using = using
+
+    def _sql(self, vendor: str) -> str:
+        greatest = "MAX" if vendor == "sqlite" else "GREATEST"
+        tat = f"{greatest}(submissions_ratelimitbucket.tat, %s)"
+        return (
+            "INSERT INTO submissions_ratelimitbucket (key, tat, allowed) VALUES (%s, %s, %s) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            f"allowed = {tat} + %s - %s <= %s, "
+            f"tat = CASE WHEN {tat} + %s - %s <= %s THEN {tat} + %s ELSE submissions_ratelimitbucket.tat END "
+            "RETURNING allowed, tat"
+        )
+
+    def update(self, key: str, now: float, interval: float, period: float):
+        # Called from middleware, outside any transaction, so the row lock is held
+        # only for this one statement
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                self._sql(connection.vendor),
+                [key, now + interval, True, now, interval, now, period, now, interval, now, period, now, interval],
+            )
+            allowed, tat = cursor.fetchone()
+            if random.random() < PURGE_PROBABILITY:
+                cursor.execute("DELETE FROM submissions_ratelimitbucket WHERE tat < %s", [now])
+        return bool(allowed), tat
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+
+    def hit(self, key: str, limit: int, period: float, now: Optional[float] = None, cost: int = 1) -> RateLimitResult:
+        """Count ``cost`` requests for ``key`` against ``limit`` per ``period`` seconds."""
+        now = time.time() if now is None else now
+        interval = period / limit
+        increment = interval * cost
+        allowed, tat = self.store.update(key, now, increment, period)
+        if allowed:
+            return RateLimitResult(True, limit, int((period - (tat - now)) // interval), 0.0)
+        return RateLimitResult(False, limit, 0, max(tat + increment - period - now, 0.0))
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                store = DatabaseStore() if settings.RATE_LIMIT_STORE == "database" else LocalStore()
+                _limiter = RateLimiter(store)
+    return _limiter
+
+
+def forget_limiter() -> None:
+    """Re-read RATE_LIMIT_STORE, with an empty LocalStore, on the next hit."""
+    global _limiter
+    _limiter = None
@@ -0,0 +1,74 @@
+"""
+Model signal handlers for the submissions app.
+
+Connected in SubmissionsConfig.ready().
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from anonplatform import metrics
+
+from . import access_index, code_filter, status_cache, webhooks
+from .allocators import access_code_allocator
+from .models import HrAccessCode, HrResponse, Submission, WebhookEndpoint
+
+
+@receiver(post_save, sender=HrAccessCode)
+@receiver(post_delete, sender=HrAccessCode)
+def invalidate_access_code_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not access_index.INDEXED_FIELDS.isdisjoint(update_fields):
+        access_index.invalidate_on_commit()
+    code_filter.forget_invalid_access_codes(instance.access_code)
+
+
+@receiver(post_delete, sender=HrAccessCode)
+def release_deleted_access_code(sender, instance, **kwargs):
+    access_code_allocator().release(instance.access_code)
+
+
+@receiver(post_save, sender=User)
+def invalidate_access_code_index_on_email_change(sender, update_fields=None, **kwargs):
+    # The index stores the user's email as the notification fallback
+    if update_fields is None or "email" in update_fields:
+        access_index.invalidate_on_commit()
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def invalidate_cached_status(sender, instance, **kwargs):
+    # On creation this clears a "not found" entry left by an earlier lookup
+    status_cache.invalidate_on_commit(instance.receipt_code)
+
+
+@receiver(post_save, sender=WebhookEndpoint)
+@receiver(post_delete, sender=WebhookEndpoint)
+def forget_webhook_endpoints(sender, **kwargs):
+    webhooks.forget_endpoints()
+
+
+@receiver(post_save, sender=Submission)
+def queue_submission_webhooks(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        webhooks.submissions_created([instance])
+    else:
+        previous = getattr(instance, "_loaded_status", None)
+        webhooks.status_changed([instance], {instance.id: previous})
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Submission)
+def count_created_submission(sender, instance, created, raw=False, **kwargs):
+    # Bulk creates (API batches, intake flushes) are counted where they happen
+    if created and not raw:
+        metrics.submissions_created()
+
+
+@receiver(post_save, sender=HrResponse)
+@receiver(post_delete, sender=HrResponse)
+def invalidate_cached_status_on_response(sender, instance, **kwargs):
+    receipt_code = Submission.objects.filter(id=instance.submission_id).values_list("receipt_code", flat=True).first()
+    if receipt_code:
+        status_cache.invalidate_on_commit(receipt_code)
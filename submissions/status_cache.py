@@ -0,0 +1,190 @@
+"""
+Cache of status lookup results, keyed by receipt code.
+
+Employees refresh the status page while they wait for HR, so a compact DTO of
+what ``status_result.html`` shows is kept in the "status" cache and dropped
+whenever the submission's status or HR response changes:
+
+* post_save / post_delete of Submission and HrResponse (see signals.py)
+* bulk ``queryset.update()`` calls skip signals, so they must call
+  ``invalidate_on_commit()`` with the affected receipt codes themselves
+  (see the admin ``mark_as_*`` actions)
+
+The "status" cache alias has to be shared by every worker (the default is a
+file cache on local disk), otherwise an invalidation in one worker would not
+reach the others. ``STATUS_CACHE_TTL`` bounds how long an entry can be stale
+if a change ever bypasses both paths above.
+
+Receipt codes that cannot exist are turned away by ``code_filter`` before
+any query, and codes that were looked up and not found are remembered for
+``CODE_FILTER_NEGATIVE_TTL`` seconds. ``invalidate()`` drops both kinds of
+entry, so callers that create submissions in bulk must call it too.
+
+``stats()`` reports the hit rate of the positive cache.
+"""
+import logging
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+from anonplatform import timing
+
+from . import code_filter
+from .counters import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "status:"
+MISSING_PREFIX = "status-missing:"
+MISSING = "missing"
+
+counters = SharedCounters("status-cache", ("hits", "misses"))
+
+
+def _cache():
+    return caches["status"]
+
+
+def _key(receipt_code: str) -> str:
+    return f"{KEY_PREFIX}{receipt_code}"
+
+
+def _missing_key(receipt_code: str) -> str:
+    return f"{MISSING_PREFIX}{receipt_code}"
+
+
+def to_dto(submission) -> dict:
+    """The fields status_result.html renders."""
+    try:
+        response = submission.hr_response.body
+    except (ObjectDoesNotExist, ValueError):
+        # No response yet, or an unsaved (still staged) submission
+        response = None
+    return {
+        "receipt_code": submission.receipt_code,
+        "type_display": submission.get_type_display(),
+        "status": submission.status,
+        "status_display": submission.get_status_display(),
+        "title": submission.title,
+        "body": submission.body,
+        "response": response,
+    }
+
+
+def _count(hit: bool) -> None:
+    counters.incr("hits" if hit else "misses")
+    timing.cache_result(hits=hit, misses=not hit)
+
+
+async def _acount(hit: bool) -> None:
+    await counters.aincr("hits" if hit else "misses")
+    timing.cache_result(hits=hit, misses=not hit)
+
+
+def _remember_missing(receipt_codes) -> None:
+    if settings.CODE_FILTER_ENABLED and receipt_codes:
+        _cache().set_many({_missing_key(code): MISSING for code in receipt_codes}, settings.CODE_FILTER_NEGATIVE_TTL)
+
+
+def get_status(receipt_code: str) -> Optional[dict]:
+    """Return the status DTO for ``receipt_code``, or None if no saved submission has it."""
+    return get_statuses([receipt_code]).get(receipt_code)
+
+
+def get_statuses(receipt_codes) -> dict:
+    """
+    Status DTOs for many receipt codes, keyed by code, with at most one query
+    for the ones not cached. Codes without a saved submission are left out.
+    """
+    from .models import Submission
+
+    codes = [code for code in dict.fromkeys(receipt_codes) if code_filter.receipt_may_exist(code)]
+    if not codes:
+        return {}
+
+    found = {}
+    missing = set()
+    if settings.STATUS_CACHE_ENABLED or settings.CODE_FILTER_ENABLED:
+        cached = _cache().get_many([_key(code) for code in codes] + [_missing_key(code) for code in codes])
+        for code in codes:
+            dto = cached.get(_key(code))
+            if settings.STATUS_CACHE_ENABLED:
+                _count(dto is not None)
+            if dto is not None:
+                found[code] = dto
+            elif _missing_key(code) in cached:
+                missing.add(code)
+        if missing:
+            code_filter.counters.incr("receipt_negative_cached", len(missing))
+
+    to_fetch = [code for code in codes if code not in found and code not in missing]
+    if to_fetch:
+        code_filter.counters.incr("receipt_db_checked", len(to_fetch))
+        fetched = {
+            s.receipt_code: to_dto(s)
+            for s in Submission.objects.select_related("hr_response").filter(receipt_code__in=to_fetch)
+        }
+        if settings.STATUS_CACHE_ENABLED and fetched:
+            _cache().set_many({_key(code): dto for code, dto in fetched.items()}, settings.STATUS_CACHE_TTL)
+        _remember_missing([code for code in to_fetch if code not in fetched])
+        found.update(fetched)
+    return found
+
+
+async def aget_status(receipt_code: str) -> Optional[dict]:
+    """Async counterpart of get_status for the ASGI views."""
+    from .models import Submission
+
+    # The filter reads the database now and then to stay current
+    if not await sync_to_async(code_filter.receipt_may_exist)(receipt_code):
+        return None
+
+    if settings.STATUS_CACHE_ENABLED or settings.CODE_FILTER_ENABLED:
+        cached = await _cache().aget_many([_key(receipt_code), _missing_key(receipt_code)])
+        dto = cached.get(_key(receipt_code))
+        if settings.STATUS_CACHE_ENABLED:
+            await _acount(dto is not None)
+        if dto is not None:
+            return dto
+        if _missing_key(receipt_code) in cached:
+            await code_filter.counters.aincr("receipt_negative_cached")
+            return None
+
+    await code_filter.counters.aincr("receipt_db_checked")
+    submission = await Submission.objects.select_related("hr_response").filter(receipt_code=receipt_code).afirst()
+    if submission is None:
+        if settings.CODE_FILTER_ENABLED:
+            await _cache().aset(_missing_key(receipt_code), MISSING, settings.CODE_FILTER_NEGATIVE_TTL)
+        return None
+    dto = to_dto(submission)
+    if settings.STATUS_CACHE_ENABLED:
+        await _cache().aset(_key(receipt_code), dto, settings.STATUS_CACHE_TTL)
+    return dto
+
+
+def invalidate(*receipt_codes: str) -> None:
+    if receipt_codes and (settings.STATUS_CACHE_ENABLED or settings.CODE_FILTER_ENABLED):
+        _cache().delete_many([_key(code) for code in receipt_codes] + [_missing_key(code) for code in receipt_codes])
+
+
+def invalidate_on_commit(*receipt_codes: str) -> None:
+    """Drop cached and not-found entries once the current transaction commits."""
+    if receipt_codes and (settings.STATUS_CACHE_ENABLED or settings.CODE_FILTER_ENABLED):
+        transaction.on_commit(lambda: invalidate(*receipt_codes))
+
+
+def stats() -> dict:
+    """Hit/miss counts across all workers."""
+    totals = counters.snapshot()
+    lookups = totals["hits"] + totals["misses"]
+    return {
+        "enabled": settings.STATUS_CACHE_ENABLED,
+        "hits": totals["hits"],
+        "misses": totals["misses"],
+        "lookups": lookups,
+        "hit_rate": totals["hits"] / lookups if lookups else 0.0,
+    }
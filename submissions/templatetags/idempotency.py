@@ -0,0 +1,12 @@
+from django import template
+from django.utils.html import format_html
+
+from submissions.idempotency import FIELD_NAME, new_key
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_field():
+    """Hidden input with a fresh idempotency key; put it inside POST forms next to csrf_token."""
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD_NAME, new_key())
@@ -1,3 +1,1184 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from anonplatform import metrics
+from anonplatform.log import JsonFormatter, QueueLogHandler, RequestContextFilter, request_id_var
+from anonplatform.email_backends import (
+    ApiEmailBackend, CircuitBreaker, EmailProviderError, FailoverEmailBackend, MailgunEmailBackend, ResendEmailBackend,
+)
+from anonplatform.mock_email_provider import MockEmailProvider
+
+from . import access_index, code_filter, idempotency, intake, notifications, outbox, provisioning, status_cache, webhooks
+from .middleware import AdmissionState, ServerTimingMiddleware, _queue_wait
+from .allocators import AccessCodeAllocator, BlockAllocator, FeistelPermutation, ReceiptCodeAllocator, receipt_allocator
+from .counters import SharedCounters
+from .models import (
+    AllocatorCounter, HrAccessCode, IdempotencyKey, IntakeApiToken, IntakeEntry, OutboxMessage, ProvisioningJob,
+    ReleasedAccessCode, ReminderLog, Submission, WebhookDelivery, WebhookEndpoint,
+)
+from .ratelimit import DatabaseStore, LocalStore, RateLimiter, compile_policies, forget_limiter
+
+# Keeps tests away from the file-based status cache in the temp directory
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "status": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "status-tests"},
+    "counters": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "counters-tests"},
+}
+
+
+def make_hr_code(username="hr", email="hr@example.com", **fields):
+    user = User.objects.create(username=username, email=email, is_staff=True)
+    hr_code = HrAccessCode.get_or_create_for_user(user)
+    hr_code = HrAccessCode.objects.get(pk=hr_code.pk)
+    hr_code.is_active = True
+    for name, value in fields.items():
+        setattr(hr_code, name, value)
+    hr_code.save()
+    return hr_code
+
+
+def submission_fields(hr_code, title="Broken badge reader"):
+    return {
+        "type": Submission.SubmissionType.ISSUE,
+        "title": title,
+        "body": "The badge reader at the side entrance has not worked for a week.",
+        "hr_access_code": hr_code,
+    }
+
+
+class IntakeTests(TestCase):
+    def setUp(self):
+        self.hr_code = make_hr_code()
+
+    def test_enqueue_stages_row_and_find_pending_resolves_it(self):
+        s = intake.enqueue(site_url="https://example.com/", notify=["hr@example.com"], **submission_fields(self.hr_code))
+        self.assertIsNone(s.pk)
+        self.assertEqual(intake.pending_count(), 1)
+        self.assertFalse(Submission.objects.exists())
+        pending = intake.find_pending(s.receipt_code)
+        self.assertEqual(pending.title, "Broken badge reader")
+        self.assertEqual(pending.hr_access_code_id, self.hr_code.pk)
+        self.assertIsNone(intake.find_pending("00000000"))
+
+    def test_flush_creates_submissions_notifies_and_clears_staging(self):
+        codes = [
+            intake.enqueue(site_url="https://example.com/", notify=["hr@example.com"],
+                           **submission_fields(self.hr_code, f"Thing number {i}")).receipt_code
+            for i in range(5)
+        ]
+        result = intake.flush(batch_size=2)
+        self.assertEqual(result.rows, 5)
+        self.assertEqual(result.batches, [2, 2, 1])
+        self.assertEqual(set(Submission.objects.values_list("receipt_code", flat=True)), set(codes))
+        self.assertEqual(OutboxMessage.objects.count(), 5)
+        self.assertEqual(intake.pending_count(), 0)
+        self.assertEqual(intake.flush().rows, 0)
+
+    def test_flush_recodes_entries_whose_receipt_code_already_exists(self):
+        s = intake.enqueue(site_url="https://example.com/", notify=["hr@example.com"], **submission_fields(self.hr_code))
+        Submission.objects.create(receipt_code=s.receipt_code, **submission_fields(self.hr_code, "Legacy row"))
+        with self.assertLogs("submissions.intake", "ERROR"):
+            self.assertEqual(intake.flush().rows, 1)
+        self.assertEqual(Submission.objects.get(receipt_code=s.receipt_code).title, "Legacy row")
+        recoded = Submission.objects.exclude(receipt_code=s.receipt_code).get()
+        self.assertEqual(recoded.title, "Broken badge reader")
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertFalse(IntakeEntry.objects.exists())
+
+
+class AllocatorTests(TestCase):
+    def test_feistel_permutation_is_a_bijection(self):
+        permutation = FeistelPermutation(b"test", half=32)
+        encrypted = [permutation.encrypt(v) for v in range(permutation.size)]
+        self.assertEqual(sorted(encrypted), list(range(permutation.size)))
+        self.assertEqual([permutation.decrypt(v) for v in encrypted], list(range(permutation.size)))
+        with self.assertRaises(ValueError):
+            permutation.encrypt(permutation.size)
+
+    @override_settings(RECEIPT_CODE_BLOCK_SIZE=3)
+    def test_receipt_codes_are_distinct_across_blocks_and_allocators(self):
+        first, second = ReceiptCodeAllocator(), ReceiptCodeAllocator()
+        codes = first.codes(5) + second.codes(4) + [first.next_code()]
+        self.assertEqual(len(set(codes)), 10)
+        self.assertTrue(all(len(c) == 11 and c[5] == "-" for c in codes))
+
+    def test_block_straddling_the_code_space_is_used_up_then_reservations_stop(self):
+        AllocatorCounter.objects.create(name="tiny", value=13)
+        allocator = BlockAllocator("tiny", FeistelPermutation(b"test", half=4), block_size=5)
+        self.assertEqual(sorted(allocator.values(5)), sorted(allocator.permutation.encrypt(v) for v in (13, 14, 15)))
+        advanced = AllocatorCounter.objects.get(name="tiny").value
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                allocator.next_value()
+        self.assertEqual(AllocatorCounter.objects.get(name="tiny").value, advanced)
+
+    def test_collision_retry_keeps_the_counter_advanced(self):
+        hr_code = make_hr_code()
+        start = AllocatorCounter.objects.get(name="receipt_code").value
+        allocator = receipt_allocator()
+        upcoming = [allocator.format(allocator.permutation.encrypt(v)) for v in (start, start + 1)]
+        # As if issued randomly before the allocator existed
+        Submission.objects.create(receipt_code=upcoming[0], **submission_fields(hr_code, "Legacy row"))
+        created = Submission.create_with_unique_receipt(**submission_fields(hr_code))
+        self.assertEqual(created.receipt_code, upcoming[1])
+        self.assertEqual(AllocatorCounter.objects.get(name="receipt_code").value, start + 2)
+
+    @override_settings(ACCESS_CODE_BLOCK_SIZE=20)
+    def test_access_codes_come_from_checked_blocks(self):
+        allocator = AccessCodeAllocator()
+        first = allocator.allocate()
+        # The rest of the block was checked with the first code
+        with self.assertNumQueries(0):
+            more = allocator.allocate_many(5)
+        self.assertEqual(len({first, *more}), 6)
+
+    @override_settings(ACCESS_CODE_BLOCK_SIZE=20)
+    def test_access_codes_skip_legacy_and_released_codes(self):
+        hr_code = make_hr_code()
+        start = AllocatorCounter.objects.get(name="access_code").value
+        allocator = AccessCodeAllocator()
+        upcoming = [f"{allocator.permutation.encrypt(v):06d}" for v in range(start, start + 4)]
+        # As if issued randomly before the allocator existed
+        HrAccessCode.objects.filter(pk=hr_code.pk).update(access_code=upcoming[0])
+        ReleasedAccessCode.objects.create(code=upcoming[1])
+        self.assertEqual(allocator.allocate_many(2), upcoming[2:])
+
+
+class ProvisioningTests(TestCase):
+    def test_existing_users_are_matched_case_insensitively(self):
+        user = User.objects.create(username="alice", email="Alice@Example.com")
+        result = provisioning.provision([{"email": "alice@example.com", "company_name": "Acme"}])
+        self.assertEqual(result.users_created, 0)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(HrAccessCode.objects.get().user, user)
+
+    def test_queued_job_provisions_from_uploaded_text(self):
+        job = provisioning.create_provision_job(
+            "tenants.csv", "email,company_name\r\na@x.com,A Corp\r\nb@x.com,B Corp\r\nnot-an-email,C\r\n"
+        )
+        claimed = provisioning.claim_job()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(provisioning.claim_job())
+        provisioning.run_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProvisioningJob.Status.FINISHED)
+        self.assertEqual((job.result["users_created"], job.result["skipped"]), (2, 1))
+        self.assertEqual(
+            set(HrAccessCode.objects.values_list("company_name", flat=True)), {"A Corp", "B Corp"}
+        )
+
+    def test_rotation_job_with_expired_lease_resumes_from_its_position(self):
+        hr_codes = [make_hr_code(f"hr{i}", f"hr{i}@example.com") for i in range(3)]
+        before = {c.pk: c.access_code for c in hr_codes}
+        job = provisioning.create_rotation_job([c.pk for c in hr_codes])
+        # As left behind by a worker that was killed after the first two codes
+        ProvisioningJob.objects.filter(pk=job.pk).update(
+            status=ProvisioningJob.Status.RUNNING, position=2, result={"rows": 2, "codes_rotated": 2},
+            lease_expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        result = provisioning.run_job(provisioning.claim_job())
+        self.assertEqual(result.codes_rotated, 3)
+        after = dict(HrAccessCode.objects.values_list("pk", "access_code"))
+        self.assertEqual(after[hr_codes[0].pk], before[hr_codes[0].pk])
+        self.assertNotEqual(after[hr_codes[2].pk], before[hr_codes[2].pk])
+
+    def test_running_job_with_live_lease_is_not_claimed(self):
+        job = provisioning.create_rotation_job([])
+        ProvisioningJob.objects.filter(pk=job.pk).update(
+            status=ProvisioningJob.Status.RUNNING, lease_expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertIsNone(provisioning.claim_job())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CODE_FILTER_ENABLED=True)
+class AsyncLookupTests(TestCase):
+    async def test_invalid_access_codes_are_remembered_through_the_async_cache(self):
+        self.assertFalse(await code_filter.aaccess_code_known_invalid("123456"))
+        await code_filter.aremember_invalid_access_code("123456")
+        self.assertTrue(await code_filter.aaccess_code_known_invalid("123456"))
+        # Shared with the sync views
+        self.assertTrue(code_filter.access_code_known_invalid("123456"))
+
+    async def test_async_counter_increments_reach_the_shared_cache(self):
+        counters = SharedCounters("async-test", ("seen",), flush_every=2)
+        await counters.aincr("seen")
+        await counters.aincr("seen")
+        await counters.aincr("seen")
+        self.assertEqual(counters.snapshot(), {"seen": 3})
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    RATE_LIMIT_POLICIES=[{"name": "status", "paths": ["/status/"], "key": "ip", "limit": 1, "period": 60}],
+)
+class RateLimitSwitchTests(TestCase):
+    def setUp(self):
+        forget_limiter()
+
+    def lookup_statuses(self):
+        return [self.client.post("/status/", {"receipt_code": "00000-00000"}).status_code for _ in range(2)]
+
+    def test_policies_apply_by_default(self):
+        self.assertEqual(self.lookup_statuses()[1], 429)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled_rate_limits_let_every_request_through(self):
+        self.assertNotIn(429, self.lookup_statuses())
+
+
+class RateLimiterTests(TestCase):
+    def check_gcra(self, store):
+        limiter = RateLimiter(store)
+        # 10 per 100s: a burst of 10, then one every 10s
+        results = [limiter.hit("k", 10, 100, now=1000.0) for _ in range(11)]
+        self.assertTrue(all(r.allowed for r in results[:10]))
+        self.assertEqual(results[9].remaining, 0)
+        self.assertFalse(results[10].allowed)
+        self.assertAlmostEqual(results[10].retry_after, 10.0)
+        self.assertTrue(limiter.hit("k", 10, 100, now=1010.0).allowed)
+        self.assertFalse(limiter.hit("k", 10, 100, now=1010.0).allowed)
+
+    def check_cost(self, store):
+        limiter = RateLimiter(store)
+        self.assertEqual(limiter.hit("c", 10, 100, now=1000.0, cost=8).remaining, 2)
+        rejected = limiter.hit("c", 10, 100, now=1000.0, cost=3)
+        self.assertFalse(rejected.allowed)
+        self.assertAlmostEqual(rejected.retry_after, 10.0)
+        # A rejected hit is not charged
+        self.assertTrue(limiter.hit("c", 10, 100, now=1000.0, cost=2).allowed)
+
+    def test_local_store(self):
+        self.check_gcra(LocalStore())
+        self.check_cost(LocalStore())
+
+    def test_remaining_and_retry_after_follow_the_refill(self):
+        limiter = RateLimiter(LocalStore())
+        # 4 per 60s: one request back every 15s
+        self.assertEqual([limiter.hit("r", 4, 60, now=0.0).remaining for _ in range(4)], [3, 2, 1, 0])
+        self.assertAlmostEqual(limiter.hit("r", 4, 60, now=0.0).retry_after, 15.0)
+        self.assertAlmostEqual(limiter.hit("r", 4, 60, now=7.5).retry_after, 7.5)
+        allowed = limiter.hit("r", 4, 60, now=15.0)
+        self.assertEqual((allowed.allowed, allowed.remaining, allowed.retry_after), (True, 0, 0.0))
+        # A full period idle restores the whole burst, no more
+        self.assertEqual(limiter.hit("r", 4, 60, now=1000.0).remaining, 3)
+
+    def test_concurrent_hits_are_each_counted_once(self):
+        limiter = RateLimiter(LocalStore())
+        allowed = []
+
+        def hammer():
+            allowed.extend(limiter.hit("t", 20, 60, now=0.0).allowed for _ in range(10))
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 20)
+
+    def test_database_store(self):
+        self.check_gcra(DatabaseStore())
+        self.check_cost(DatabaseStore())
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    RATE_LIMIT_POLICIES=[{
+        "name": "status_prefix", "paths": ["/status/"], "key": "ip_receipt_prefix", "limit": 1, "period": 600,
+    }],
+)
+class ReceiptPrefixRateLimitTests(TestCase):
+    def setUp(self):
+        forget_limiter()
+
+    def lookup(self, ip, receipt_code="12345-00001"):
+        return self.client.post("/status/", {"receipt_code": receipt_code}, REMOTE_ADDR=ip)
+
+    def test_prefix_budget_is_per_client(self):
+        self.assertNotEqual(self.lookup("10.0.0.1").status_code, 429)
+        with mock.patch("time.sleep") as sleep:
+            rejected = self.lookup("10.0.0.1", "12345-00002")
+        self.assertEqual(rejected.status_code, 429)
+        self.assertGreater(int(rejected["Retry-After"]), 0)
+        sleep.assert_not_called()
+        # Another client checking a receipt with the same prefix is unaffected
+        self.assertNotEqual(self.lookup("10.0.0.2").status_code, 429)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    RATE_LIMIT_POLICIES=[{
+        "name": "status_prefix", "paths": ["/status/"], "key": "ip_receipt_prefix", "limit": 2, "period": 60,
+        "action": "delay", "max_delay": 30,
+    }],
+)
+class DelayRateLimitTests(TestCase):
+    def setUp(self):
+        forget_limiter()
+
+    def lookup(self):
+        return self.client.post("/status/", {"receipt_code": "12345-00001"})
+
+    def test_slightly_early_clients_are_told_how_long_to_wait(self):
+        self.lookup()
+        self.lookup()
+        with mock.patch("time.sleep") as sleep:
+            delayed = self.lookup()
+        sleep.assert_not_called()
+        self.assertEqual(delayed.status_code, 429)
+        self.assertEqual(delayed["Retry-After"], "30")
+        self.assertIn(b"wait 30 seconds", delayed.content)
+
+    @override_settings(RATE_LIMIT_POLICIES=[{
+        "name": "status_prefix", "paths": ["/status/"], "key": "ip_receipt_prefix", "limit": 2, "period": 60,
+        "action": "delay", "max_delay": 10,
+    }])
+    def test_longer_waits_are_rejected(self):
+        responses = [self.lookup() for _ in range(3)]
+        self.assertEqual(responses[2].status_code, 429)
+        self.assertIn(b"try again later", responses[2].content)
+
+    def test_delay_needs_a_max_delay(self):
+        with self.assertRaises(ImproperlyConfigured):
+            compile_policies([{"name": "p", "paths": ["/status/"], "key": "ip", "limit": 1, "period": 1, "action": "delay"}])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, STATUS_API_MAX_CODES=5,
+    RATE_LIMIT_POLICIES=[{
+        "name": "status_api", "paths": ["/api/v1/status/"], "key": "ip", "cost": "receipt_codes",
+        "limit": 8, "period": 3600,
+    }],
+)
+class StatusApiRateLimitTests(TestCase):
+    def setUp(self):
+        forget_limiter()
+
+    def lookup(self, count):
+        codes = [f"{i:05d}-00000" for i in range(count)]
+        return self.client.post("/api/v1/status/", {"receipt_codes": codes}, content_type="application/json")
+
+    def test_every_receipt_code_in_a_batch_is_charged(self):
+        self.assertEqual(self.lookup(5).status_code, 200)
+        self.assertEqual(self.lookup(3).status_code, 200)
+        self.assertEqual(self.lookup(1).status_code, 429)
+
+    def test_oversized_batches_are_charged_the_maximum(self):
+        self.assertEqual(self.lookup(50).status_code, 413)
+        self.assertEqual(self.lookup(4).status_code, 429)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATE_LIMIT_ENABLED=False, CODE_FILTER_ENABLED=False, SUBMISSION_API_MAX_BATCH=3)
+class ApiTests(TestCase):
+    def setUp(self):
+        self.hr_code = make_hr_code()
+        _, self.token = IntakeApiToken.issue(self.hr_code, "kiosk")
+
+    def submit(self, submissions, access_code=None, token=None):
+        payload = {"access_code": access_code or self.hr_code.access_code, "submissions": submissions}
+        return self.client.post(
+            "/api/v1/submissions/batch/", payload, content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token or self.token}",
+        )
+
+    def item(self, title="Broken badge reader"):
+        return {"type": "issue", "title": title, "body": "The badge reader at the side entrance is broken."}
+
+    def test_batch_creates_valid_items_and_reports_the_rest(self):
+        response = self.submit([self.item(), {"type": "issue", "title": "x", "body": "short"}, "not an object"])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["created"], data["failed"]), (1, 2))
+        created = Submission.objects.get()
+        self.assertEqual(data["results"][0], {"index": 0, "receipt_code": created.receipt_code})
+        self.assertEqual(created.hr_access_code, self.hr_code)
+        self.assertEqual([r["index"] for r in data["results"][1:]], [1, 2])
+        self.assertTrue(all(r["errors"] for r in data["results"][1:]))
+        self.assertIsNotNone(IntakeApiToken.objects.get().last_used_at)
+
+    def test_requests_without_a_matching_token_are_refused(self):
+        self.assertEqual(self.submit([self.item()], token="kx_unknown").status_code, 401)
+        other = make_hr_code("hr2", "hr2@example.com")
+        self.assertEqual(self.submit([self.item()], access_code=other.access_code).status_code, 403)
+        self.assertEqual(self.submit([self.item()] * 4).status_code, 413)
+        self.assertFalse(Submission.objects.exists())
+
+    def test_status_batch_reports_each_code(self):
+        Submission.objects.create(receipt_code="13579-24680", **submission_fields(self.hr_code))
+        response = self.client.post(
+            "/api/v1/status/", {"receipt_codes": ["13579-24680", "11111-22222", "nope"]},
+            content_type="application/json",
+        )
+        results = response.json()["results"]
+        self.assertEqual(results[0]["status"], Submission.Status.NEW)
+        self.assertEqual(results[0]["title"], "Broken badge reader")
+        self.assertEqual(results[1], {"receipt_code": "11111-22222", "found": False})
+        self.assertIn("error", results[2])
+
+
+class ScriptedEmailBackend(BaseEmailBackend):
+    """Records what each send saw and fails the recipients listed in ``errors``."""
+
+    errors = {}
+    on_send = None
+    sent = []
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if ScriptedEmailBackend.on_send:
+                ScriptedEmailBackend.on_send(message)
+            error = ScriptedEmailBackend.errors.get(message.to[0])
+            if error:
+                raise error
+            ScriptedEmailBackend.sent.append(message.to[0])
+        return len(email_messages)
+
+
+@override_settings(EMAIL_BACKEND="submissions.tests.ScriptedEmailBackend", OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def setUp(self):
+        ScriptedEmailBackend.errors, ScriptedEmailBackend.on_send, ScriptedEmailBackend.sent = {}, None, []
+
+    def queue(self, *recipients):
+        return [
+            outbox.enqueue(kind="test", subject="Hello", body="Body", recipients=[r], redact_after_send=True)
+            for r in recipients
+        ]
+
+    def test_drain_sends_and_records_each_outcome(self):
+        ScriptedEmailBackend.errors = {
+            "down@example.com": EmailProviderError("test", "unavailable", status=503),
+            "bad@example.com": EmailProviderError("test", "invalid recipient", status=422),
+        }
+        ok, down, bad = self.queue("ok@example.com", "down@example.com", "bad@example.com")
+        result = outbox.drain()
+        self.assertEqual((result.claimed, result.sent, result.retried, result.failed), (3, 1, 1, 1))
+        ok.refresh_from_db(), down.refresh_from_db(), bad.refresh_from_db()
+        self.assertEqual((ok.status, ok.body), (OutboxMessage.Status.SENT, ""))
+        self.assertEqual((down.status, down.attempts), (OutboxMessage.Status.PENDING, 1))
+        self.assertGreater(down.available_at, timezone.now())
+        self.assertEqual(bad.status, OutboxMessage.Status.FAILED)
+        # The retry is not due yet
+        self.assertEqual(outbox.drain().claimed, 0)
+
+    def test_claim_is_committed_before_sending(self):
+        leases = []
+        ScriptedEmailBackend.on_send = lambda m: leases.append(
+            OutboxMessage.objects.get(recipients=m.to).available_at
+        )
+        self.queue("ok@example.com")
+        outbox.drain()
+        self.assertGreater(leases[0], timezone.now())
+
+    def test_results_are_not_recorded_for_messages_another_worker_reclaimed(self):
+        (message,) = self.queue("slow@example.com")
+        # As if the lease ran out mid-send and another worker claimed the message
+        ScriptedEmailBackend.on_send = lambda m: OutboxMessage.objects.filter(pk=message.pk).update(
+            available_at=timezone.now() + timedelta(hours=1)
+        )
+        outbox.drain()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.Status.PENDING, 0))
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_a_backend_that_cannot_send_at_all_uses_up_attempts(self):
+        (message,) = self.queue("ok@example.com")
+        with mock.patch.object(outbox, "get_connection", side_effect=ValueError("no API key")):
+            with self.assertLogs("submissions.outbox", "ERROR"):
+                self.assertEqual(outbox.drain().retried, 1)
+            OutboxMessage.objects.update(available_at=timezone.now())
+            with self.assertLogs("submissions.outbox", "ERROR"):
+                self.assertEqual(outbox.drain().failed, 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.Status.FAILED, 2))
+        self.assertIn("no API key", message.last_error)
+
+
+class InlineExecutor:
+    """ThreadPoolExecutor stand-in that runs on the test's own database connection."""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, items):
+        return [fn(item) for item in items]
+
+
+@mock.patch.object(webhooks, "ThreadPoolExecutor", InlineExecutor)
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.hr_code = make_hr_code()
+        self.endpoint = WebhookEndpoint.objects.create(hr_access_code=self.hr_code, url="https://hooks.example.com/a")
+        self.other = WebhookEndpoint.objects.create(hr_access_code=self.hr_code, url="https://hooks.example.com/b")
+        # Each queues a submission.created event per endpoint
+        for i in range(2):
+            Submission.objects.create(receipt_code=f"1234{i}-67890", **submission_fields(self.hr_code))
+
+    def test_signature_round_trip(self):
+        body = b'{"events":[]}'
+        header = webhooks.sign("secret", int(time.time()), body)
+        self.assertTrue(webhooks.verify_signature("secret", header, body))
+        self.assertFalse(webhooks.verify_signature("secret", header, body + b" "))
+        self.assertFalse(webhooks.verify_signature("other", header, body))
+        self.assertFalse(webhooks.verify_signature("secret", webhooks.sign("secret", int(time.time()) - 600, body), body))
+        self.assertFalse(webhooks.verify_signature("secret", "garbage", body))
+
+    @override_settings(WEBHOOK_MAX_WORKERS=4, WEBHOOK_TIMEOUT=10)
+    def test_lease_covers_the_slowest_batch(self):
+        self.assertEqual(webhooks._lease(1), timedelta(seconds=20 + webhooks.LEASE_MARGIN_SECONDS))
+        self.assertEqual(webhooks._lease(9), timedelta(seconds=3 * 20 + webhooks.LEASE_MARGIN_SECONDS))
+
+    def test_saving_a_submission_of_an_account_without_endpoints_only_inserts(self):
+        other = make_hr_code("hr2", "hr2@example.com")
+        webhooks._hr_codes_with_endpoints()
+        with self.assertNumQueries(1):
+            Submission.objects.create(receipt_code="99999-00000", **submission_fields(other))
+        # A new endpoint is picked up at once in this process
+        WebhookEndpoint.objects.create(hr_access_code=other, url="https://hooks.example.com/c")
+        Submission.objects.create(receipt_code="99999-00001", **submission_fields(other))
+        self.assertEqual(WebhookDelivery.objects.filter(endpoint__hr_access_code=other).count(), 1)
+
+    def test_deliver_posts_once_per_endpoint_and_records_outcomes(self):
+        def post(endpoint, deliveries):
+            # The claim is committed before anything is posted
+            self.assertTrue(all(
+                d.available_at > timezone.now() for d in WebhookDelivery.objects.filter(endpoint=endpoint)
+            ))
+            return (None, None) if endpoint == self.endpoint else ("HTTP 503: down", 120)
+
+        with mock.patch.object(webhooks, "_post", side_effect=post) as posted:
+            result = webhooks.deliver()
+        self.assertEqual(posted.call_count, 2)
+        self.assertEqual((result.claimed, result.requests, result.sent, result.retried), (4, 2, 2, 2))
+        self.assertEqual(
+            set(WebhookDelivery.objects.filter(endpoint=self.endpoint).values_list("status", flat=True)),
+            {WebhookDelivery.Status.SENT},
+        )
+        retrying = WebhookDelivery.objects.filter(endpoint=self.other)
+        self.assertTrue(all(d.attempts == 1 and d.available_at > timezone.now() for d in retrying))
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.consecutive_failures, 1)
+        self.assertIsNotNone(self.other.last_failure_at)
+
+    def test_results_are_not_recorded_for_events_another_worker_reclaimed(self):
+        def post(endpoint, deliveries):
+            # As if the lease ran out mid-post and another worker claimed the events
+            WebhookDelivery.objects.filter(endpoint=endpoint).update(available_at=timezone.now() + timedelta(hours=1))
+            return None, None
+
+        with mock.patch.object(webhooks, "_post", side_effect=post):
+            result = webhooks.deliver()
+        self.assertEqual((result.claimed, result.sent), (4, 0))
+        self.assertFalse(WebhookDelivery.objects.exclude(status=WebhookDelivery.Status.PENDING).exists())
+
+
+class DigestTests(TestCase):
+    def setUp(self):
+        self.hr_code = make_hr_code(
+            notification_mode=HrAccessCode.NotificationMode.BATCHED, last_digest_at=timezone.now(),
+        )
+        for i in range(3):
+            s = Submission.objects.create(receipt_code=f"5555{i}-00000", **submission_fields(self.hr_code))
+            notifications.notify_new_submission(s, ["hr@example.com"], admin_url="https://example.com/")
+
+    def digests(self):
+        return OutboxMessage.objects.filter(kind="digest")
+
+    def test_batched_submissions_wait_for_the_interval(self):
+        # Not due: decided from the account alone, no submission is locked or loaded
+        with self.assertNumQueries(1):
+            self.assertEqual(notifications.send_due_digests().tenants, 0)
+        later = timezone.now() + timedelta(minutes=self.hr_code.digest_interval_minutes)
+        self.assertEqual(notifications.send_due_digests(now=later).submissions, 3)
+        self.assertEqual(self.digests().get().subject, "3 new anonymous submissions")
+        self.assertFalse(Submission.objects.filter(notified_at__isnull=True).exists())
+
+    def test_submissions_left_waiting_after_a_switch_to_immediate_are_still_sent(self):
+        HrAccessCode.objects.filter(pk=self.hr_code.pk).update(notification_mode=HrAccessCode.NotificationMode.IMMEDIATE)
+        self.assertEqual(notifications.send_due_digests().submissions, 3)
+        self.assertEqual(self.digests().count(), 1)
+
+    def test_immediate_notification_is_recorded_by_the_insert(self):
+        hr_code = make_hr_code("hr2", "hr2@example.com")
+        s = Submission.create_with_unique_receipt(
+            notified_at=notifications.initial_notified_at(hr_code), **submission_fields(hr_code)
+        )
+        self.assertIsNotNone(s.notified_at)
+        # Only the outbox INSERT
+        with self.assertNumQueries(1):
+            notifications.notify_new_submission(s, ["hr2@example.com"], admin_url="https://example.com/")
+
+    def test_flush_on_mode_change_sends_what_was_waiting(self):
+        self.assertEqual(notifications.flush_pending_digest(self.hr_code), 3)
+        self.assertEqual(self.digests().get().recipients, ["hr@example.com"])
+        self.assertEqual(notifications.flush_pending_digest(self.hr_code), 0)
+        self.assertEqual(notifications.send_due_digests(now=timezone.now() + timedelta(days=1)).tenants, 0)
+
+
+@override_settings(
+    SUBMISSION_REMINDER_NEW_HOURS=48, SUBMISSION_REMINDER_IN_REVIEW_HOURS=168, SUBMISSION_REMINDER_INTERVAL_HOURS=24,
+)
+class ReminderTests(TestCase):
+    def setUp(self):
+        self.hr_code = make_hr_code()
+        self.other = make_hr_code("hr2", "hr2@example.com")
+        self.add(self.hr_code, Submission.Status.NEW, hours=72)
+        self.add(self.hr_code, Submission.Status.NEW, hours=60)
+        self.add(self.hr_code, Submission.Status.NEW, hours=1)
+        self.add(self.hr_code, Submission.Status.IN_REVIEW, hours=72)
+        self.add(self.other, Submission.Status.IN_REVIEW, hours=200)
+        self.add(self.other, Submission.Status.CLOSED, hours=500)
+
+    def add(self, hr_code, status, hours):
+        s = Submission.create_with_unique_receipt(**submission_fields(hr_code))
+        Submission.objects.filter(pk=s.pk).update(status=status, updated_at=timezone.now() - timedelta(hours=hours))
+        return s
+
+    def reminders(self):
+        return OutboxMessage.objects.filter(kind="reminder")
+
+    def test_one_reminder_per_account_counts_only_overdue_submissions(self):
+        result = notifications.send_due_reminders()
+        self.assertEqual((result.tenants, result.submissions), (2, 3))
+        log = ReminderLog.objects.get(hr_access_code=self.hr_code)
+        self.assertEqual((log.new_count, log.in_review_count), (2, 0))
+        # Oldest first
+        self.assertEqual(
+            log.submission_ids,
+            list(Submission.objects.filter(hr_access_code=self.hr_code, status=Submission.Status.NEW)
+                 .order_by("updated_at").values_list("id", flat=True)[:2]),
+        )
+        other_log = ReminderLog.objects.get(hr_access_code=self.other)
+        self.assertEqual((other_log.new_count, other_log.in_review_count), (0, 1))
+        self.assertEqual(
+            sorted(self.reminders().values_list("subject", flat=True)),
+            ["1 anonymous submission waiting for a response", "2 anonymous submissions waiting for a response"],
+        )
+
+    def test_accounts_are_reminded_once_per_interval(self):
+        notifications.send_due_reminders()
+        self.assertEqual(notifications.send_due_reminders(now=timezone.now() + timedelta(hours=1)).tenants, 0)
+        self.assertEqual(notifications.send_due_reminders(now=timezone.now() + timedelta(hours=25)).tenants, 2)
+        self.assertEqual(self.reminders().count(), 4)
+
+
+class FakeBatchBackend(ApiEmailBackend):
+    """Batches everything; the provider rejects a request containing a bad address."""
+
+    provider = "Fake"
+    batch_limit = 10
+
+    def __init__(self, batch_error, **kwargs):
+        super().__init__(max_workers=1, **kwargs)
+        self.batch_error = batch_error
+        self.requests_made = []
+
+    def is_configured(self):
+        return True
+
+    def batch_key(self, message):
+        return "batch"
+
+    def send_one(self, message):
+        self.requests_made.append(message.to)
+        if "bad" in message.to[0]:
+            raise self.batch_error
+        return f"id-{message.to[0]}"
+
+    def send_batch(self, messages):
+        self.requests_made.append([m.to[0] for m in messages])
+        if any("bad" in m.to[0] for m in messages):
+            raise self.batch_error
+        return [f"id-{m.to[0]}" for m in messages]
+
+
+class EmailBatchTests(TestCase):
+    def messages(self):
+        return [EmailMessage("Hi", "Body", "from@example.com", [to]) for to in ("a@x.com", "bad@x.com", "c@x.com")]
+
+    def test_rejected_batch_is_resent_one_by_one(self):
+        backend = FakeBatchBackend(EmailProviderError("Fake", "invalid address", status=422))
+        errors = backend.send_each(self.messages())
+        self.assertEqual([e is None for e in errors], [True, False, True])
+        self.assertEqual(len(backend.requests_made), 4)
+
+    def test_retryable_batch_error_fails_the_batch_without_splitting(self):
+        backend = FakeBatchBackend(EmailProviderError("Fake", "unavailable", status=503))
+        errors = backend.send_each(self.messages())
+        self.assertTrue(all(e is not None and e.retryable for e in errors))
+        self.assertEqual(len(backend.requests_made), 1)
+
+
+class PooledSessionTests(TestCase):
+    def setUp(self):
+        self.server = MockEmailProvider(latency=0).start()
+        self.addCleanup(self.server.stop)
+
+    def message(self, to):
+        return EmailMessage("Hi", "Body", "from@example.com", [to])
+
+    def test_open_connection_reuses_one_keep_alive_socket(self):
+        with self.settings(RESEND_API_KEY="re_test", RESEND_API_URL=self.server.url):
+            backend = ResendEmailBackend(max_workers=1)
+            with backend:
+                session = backend.session
+                for to in ("a@x.com", "b@x.com", "c@x.com"):
+                    self.assertEqual(backend.send_messages([self.message(to)]), 1)
+                    self.assertIs(backend.session, session)
+            self.assertIsNone(backend.session)
+        stats = self.server.stats()
+        self.assertEqual((stats["requests"], stats["connections"]), (3, 1))
+
+
+class BatchSplittingTests(TestCase):
+    def setUp(self):
+        self.server = MockEmailProvider(latency=0).start()
+        self.addCleanup(self.server.stop)
+
+    def messages(self, *recipients):
+        return [EmailMessage("Hi", "Body", "from@example.com", [to]) for to in recipients]
+
+    @override_settings(RESEND_API_KEY="re_test")
+    def test_batches_are_chunked_to_the_provider_limit(self):
+        messages = self.messages(*[f"user{i}@x.com" for i in range(150)])
+        with_attachment = self.messages("files@x.com")[0]
+        with_attachment.attach("report.txt", "contents", "text/plain")
+        with self.settings(RESEND_API_URL=self.server.url):
+            errors = ResendEmailBackend(max_workers=2).send_each(messages + [with_attachment])
+        self.assertEqual(errors, [None] * 151)
+        stats = self.server.stats()
+        # 100 + 50 in batches; the attachment cannot be batched
+        self.assertEqual(stats["by_path"], {"/emails/batch": 2, "/emails": 1})
+        self.assertEqual(stats["emails_accepted"], 151)
+        self.assertTrue(all(m.provider_message_id for m in messages))
+
+    @override_settings(MAILGUN_API_KEY="key-test", MAILGUN_DOMAIN="mg.example.com")
+    def test_repeated_addresses_go_to_separate_batches(self):
+        messages = self.messages("a@x.com", "b@x.com", "A@x.com")
+        with self.settings(MAILGUN_API_URL=self.server.url):
+            errors = MailgunEmailBackend(max_workers=1).send_each(messages)
+        self.assertEqual(errors, [None] * 3)
+        self.assertEqual(self.server.stats()["by_path"], {"/v3/<domain>/messages": 2})
+
+
+class QueueLoggingTests(TestCase):
+    def handler(self, maxsize=100):
+        stream = io.StringIO()
+        handler = QueueLogHandler(stream, maxsize=maxsize)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestContextFilter())
+        self.addCleanup(handler.close)
+        log = logging.getLogger(f"submissions.tests.queue.{id(handler)}")
+        log.propagate = False
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+        return handler, log, stream
+
+    def test_close_writes_out_every_queued_record(self):
+        handler, log, stream = self.handler()
+        token = request_id_var.set("req-123")
+        try:
+            log.warning("Submission %s stored", "abc", extra={"kind": "submit"})
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                log.exception("Could not notify")
+        finally:
+            request_id_var.reset(token)
+        handler.close()
+        self.assertIsNone(handler.listener)
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            (first["message"], first["request_id"], first["kind"]), ("Submission abc stored", "req-123", "submit"),
+        )
+        self.assertIn("ValueError: boom", second["exc"])
+
+    def test_full_queue_drops_records_instead_of_blocking(self):
+        handler, log, stream = self.handler(maxsize=1)
+        # Nothing drains the queue once the listener is gone
+        handler.listener.stop()
+        handler.listener = None
+        for i in range(3):
+            log.warning("record %d", i)
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queue.get_nowait().msg, "record 0")
+
+    def test_request_id_from_the_proxy_is_echoed(self):
+        self.assertEqual(self.client.get("/", HTTP_X_REQUEST_ID="proxy-1")["X-Request-ID"], "proxy-1")
+        generated = self.client.get("/", HTTP_X_REQUEST_ID="not valid!")["X-Request-ID"]
+        self.assertRegex(generated, r"^[0-9a-f]{32}$")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FailoverTests(TestCase):
+    def setUp(self):
+        ScriptedEmailBackend.errors, ScriptedEmailBackend.on_send, ScriptedEmailBackend.sent = {}, None, []
+
+    def breaker_gauge(self, name):
+        return metrics.registry.get_sample_value("email_circuit_breaker_state", {"provider": name})
+
+    def test_breaker_opens_lets_one_trial_through_and_closes(self):
+        breaker = CircuitBreaker("breaker-test", failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(self.breaker_gauge("breaker-test"), 2)
+
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one trial at a time
+        self.assertFalse(breaker.allow())
+        self.assertEqual(self.breaker_gauge("breaker-test"), 1)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker_gauge("breaker-test"), 0)
+
+    def test_failed_trial_reopens_the_breaker(self):
+        breaker = CircuitBreaker("breaker-trial", failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    @override_settings(EMAIL_SEND_BUDGET_SECONDS=0.15, EMAIL_RETRY_ATTEMPTS=1)
+    def test_budget_and_latency_are_per_message(self):
+        ScriptedEmailBackend.on_send = lambda message: time.sleep(0.1)
+        backend = FailoverEmailBackend(backends=["submissions.tests.ScriptedEmailBackend"])
+        messages = [EmailMessage("Hi", "Body", "from@example.com", [to]) for to in ("a@x.com", "b@x.com", "c@x.com")]
+        # A budget for the whole call would have given up on the third message
+        self.assertEqual(backend.send_each(messages), [None, None, None])
+        self.assertTrue(all(0.1 <= m.send_latency < 0.15 for m in messages))
+
+
+@override_settings(
+    ADMISSION_TRUST_REQUEST_START=True, ADMISSION_MAX_IN_FLIGHT=4, ADMISSION_RESERVED_SLOTS=1,
+    ADMISSION_LOW_PRIORITY_MAX_QUEUE_WAIT=0.5,
+)
+class AdmissionTests(TestCase):
+    def queue_wait(self, header):
+        return _queue_wait(RequestFactory().get("/", HTTP_X_REQUEST_START=header))
+
+    def test_queue_wait_accepts_seconds_milliseconds_and_microseconds(self):
+        started = time.time() - 2
+        for header in (f"t={started}", str(int(started * 1000)), f"t={int(started * 1_000_000)}"):
+            self.assertAlmostEqual(self.queue_wait(header), 2, delta=0.5)
+
+    def test_queue_wait_ignores_implausible_headers(self):
+        for header in ("inf", "t=-inf", "nan", "t=0", "t=1", "1e300", "garbage", ""):
+            self.assertIsNone(self.queue_wait(header), header)
+        self.assertEqual(self.queue_wait(f"t={time.time() - 600}"), 60.0)
+
+    @override_settings(ADMISSION_TRUST_REQUEST_START=False)
+    def test_queue_wait_is_ignored_unless_trusted(self):
+        self.assertIsNone(self.queue_wait(f"t={time.time() - 2}"))
+
+    def test_reserved_slots_are_kept_for_critical_routes(self):
+        state = AdmissionState()
+        self.assertTrue(all(state.enter("normal", None) for _ in range(3)))
+        self.assertFalse(state.enter("normal", None))
+        self.assertTrue(state.enter("critical", None))
+        self.assertEqual(state.shed["normal"], 1)
+
+    def test_slow_queue_sheds_low_priority_until_it_decays(self):
+        state = AdmissionState()
+        for _ in range(10):
+            state.enter("critical", 5.0, now=100.0)
+            state.leave()
+        self.assertFalse(state.enter("low", None, now=100.0))
+        self.assertTrue(state.enter("low", None, now=200.0))
+
+
+@override_settings(SERVER_TIMING_STAFF=True, SERVER_TIMING_SAMPLE_RATE=0.0)
+class ServerTimingTests(TestCase):
+    def run_middleware(self, user, cookies=()):
+        loaded = []
+
+        def load_user():
+            loaded.append(True)
+            return user
+
+        request = RequestFactory().get("/")
+        request.COOKIES.update({name: "x" for name in cookies})
+        request.user = SimpleLazyObject(load_user)
+        response = ServerTimingMiddleware(lambda r: HttpResponse())(request)
+        return response, bool(loaded)
+
+    def test_requests_without_a_session_never_load_the_user(self):
+        staff = User(username="staff", is_staff=True)
+        response, loaded = self.run_middleware(staff)
+        self.assertFalse(loaded)
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_staff_with_a_session_get_the_header(self):
+        response, loaded = self.run_middleware(User(username="staff", is_staff=True), cookies=["sessionid"])
+        self.assertTrue(loaded)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, IDEMPOTENCY_WAIT_SECONDS=0)
+class IdempotencyTests(TestCase):
+    def test_claim_complete_and_replay(self):
+        key = idempotency.new_key()
+        self.assertEqual(idempotency.claim("submit", key), (True, None))
+        # Still in flight
+        self.assertEqual(idempotency.claim("submit", key), (False, None))
+        idempotency.complete("submit", key, {"receipt_code": "12345-67890"})
+        self.assertEqual(idempotency.claim("submit", key), (False, {"receipt_code": "12345-67890"}))
+        # Scopes do not share keys
+        self.assertEqual(idempotency.claim("hr_register", key), (True, None))
+
+    def test_released_keys_can_be_claimed_again(self):
+        key = idempotency.new_key()
+        idempotency.claim("submit", key)
+        idempotency.release("submit", key)
+        self.assertEqual(idempotency.claim("submit", key), (True, None))
+
+    def test_claims_of_requests_that_died_are_taken_over(self):
+        key = idempotency.new_key()
+        idempotency.claim("submit", key)
+        IdempotencyKey.objects.update(claimed_at=timezone.now() - timedelta(seconds=120))
+        self.assertEqual(idempotency.claim("submit", key), (True, None))
+        self.assertEqual(idempotency.claim("submit", key), (False, None))
+        self.assertEqual(idempotency.purge_expired(), 0)
+
+    def test_missing_or_malformed_keys_are_not_protected(self):
+        for key in (None, "", "not-a-key"):
+            self.assertEqual(idempotency.claim("submit", key), (True, None))
+            self.assertEqual(idempotency.claim("submit", key), (True, None))
+
+    # The shared index file is rebuilt on commit, which TestCase never reaches
+    @override_settings(ACCESS_CODE_INDEX_ENABLED=False)
+    def test_repeated_submit_post_creates_one_submission(self):
+        hr_code = make_hr_code()
+        form = {
+            "access_code": hr_code.access_code, "type": Submission.SubmissionType.ISSUE,
+            "title": "Broken badge reader", "body": "The badge reader at the side entrance has not worked for a week.",
+            idempotency.FIELD_NAME: idempotency.new_key(),
+        }
+        first = self.client.post("/submit/", form)
+        receipt = self.client.session["last_receipt_code"]
+        second = self.client.post("/submit/", form)
+        self.assertEqual((first.status_code, second.status_code), (302, 302))
+        self.assertEqual(Submission.objects.get().receipt_code, receipt)
+        self.assertEqual(self.client.session["last_receipt_code"], receipt)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, STATUS_CACHE_ENABLED=True, CODE_FILTER_ENABLED=False)
+class StatusCacheTests(TestCase):
+    def setUp(self):
+        self.submission = Submission.objects.create(receipt_code="24680-13579", **submission_fields(make_hr_code()))
+
+    def test_lookups_are_served_from_the_cache_until_the_submission_changes(self):
+        self.assertEqual(status_cache.get_status("24680-13579")["status"], Submission.Status.NEW)
+        with self.assertNumQueries(0):
+            self.assertEqual(status_cache.get_status("24680-13579")["status"], Submission.Status.NEW)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submission.status = Submission.Status.IN_REVIEW
+            self.submission.save()
+        self.assertEqual(status_cache.get_status("24680-13579")["status"], Submission.Status.IN_REVIEW)
+
+    def test_batch_lookup_fetches_uncached_codes_in_one_query(self):
+        status_cache.get_status("24680-13579")
+        with self.assertNumQueries(1):
+            found = status_cache.get_statuses(["24680-13579", "11111-22222", "33333-44444"])
+        self.assertEqual(list(found), ["24680-13579"])
+
+    @override_settings(CACHES={
+        **LOCMEM_CACHES,
+        "status": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "status-culled",
+                   "OPTIONS": {"MAX_ENTRIES": 3, "CULL_FREQUENCY": 1}},
+    })
+    def test_counters_survive_a_full_status_cache(self):
+        counters = SharedCounters("cull-test", ("seen",), flush_every=1)
+        counters.incr("seen")
+        for i in range(10):
+            caches["status"].set(f"filler-{i}", i)
+        counters.incr("seen")
+        self.assertEqual(counters.snapshot(), {"seen": 2})
+
+
+class CodeFilterTests(TestCase):
+    def receipt(self, counter):
+        digits = f"{receipt_allocator().permutation.encrypt(counter):010d}"
+        return f"{digits[:5]}-{digits[5:]}"
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = code_filter.BloomFilter(capacity=1000)
+        for i in range(1000):
+            bloom.add(f"code-{i}")
+        self.assertTrue(all(f"code-{i}" in bloom for i in range(1000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "receipts.bloom")
+
+    def test_receipt_filter_rejects_codes_the_allocator_cannot_have_issued(self):
+        legacy = Submission.objects.create(receipt_code="98765-43210", **submission_fields(make_hr_code()))
+        issued = Submission.create_with_unique_receipt(**submission_fields(make_hr_code("hr2", "hr2@example.com")))
+        self.assertEqual(code_filter.build(self.path), 1)
+        receipt_filter = code_filter.ReceiptCodeFilter(self.path)
+        # One read of the counter, no scan of the submissions
+        with self.assertNumQueries(1):
+            self.assertTrue(receipt_filter.may_exist(legacy.receipt_code))
+            self.assertTrue(receipt_filter.may_exist(issued.receipt_code))
+            # Issued since the filter was built: within reach of the counter
+            self.assertTrue(receipt_filter.may_exist(self.receipt(1)))
+        self.assertFalse(receipt_filter.may_exist(self.receipt(code_filter.HIGH_WATER_SLACK * 50)))
+
+    def test_without_the_file_codes_beyond_the_counter_reach_the_database(self):
+        receipt_filter = code_filter.ReceiptCodeFilter(self.path)
+        with self.assertLogs("submissions.code_filter", "WARNING"):
+            self.assertTrue(receipt_filter.may_exist(self.receipt(code_filter.HIGH_WATER_SLACK * 50)))
+
+
+class AccessIndexTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "access-codes.idx")
+        with self.settings(ACCESS_CODE_INDEX_ENABLED=False):
+            self.hr_code = make_hr_code(notification_email="alerts@example.com")
+        self.index = access_index.AccessCodeIndex(self.path)
+        self.index.rebuild()
+
+    def worker(self):
+        """Another process on the host, mapping the same file."""
+        return access_index.AccessCodeIndex(self.path)
+
+    def test_active_codes_are_answered_without_queries(self):
+        with self.assertNumQueries(0):
+            entry = self.worker().lookup(self.hr_code.access_code)
+        self.assertEqual(entry.id, self.hr_code.id)
+        self.assertEqual(entry.notification_email, "alerts@example.com")
+        self.assertEqual(entry.to_model().user_id, self.hr_code.user_id)
+
+    def test_unknown_codes_miss_and_malformed_codes_go_to_the_database(self):
+        unknown = "000000" if self.hr_code.access_code != "000000" else "000001"
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.worker().lookup(unknown))
+        with self.assertRaises(access_index.IndexUnavailable):
+            self.worker().lookup("12345")
+
+    def test_workers_remap_after_an_invalidation_and_never_rebuild(self):
+        worker = self.worker()
+        worker.lookup(self.hr_code.access_code)
+        self.index.invalidate()
+        with mock.patch.object(worker, "_rebuild_in_background") as background, \
+                mock.patch.object(worker, "_rebuild_locked") as rebuild:
+            with self.assertRaises(access_index.IndexUnavailable):
+                worker.lookup(self.hr_code.access_code)
+            HrAccessCode.objects.filter(pk=self.hr_code.pk).update(is_active=False)
+            self.index.rebuild()
+            with self.assertNumQueries(0):
+                self.assertIsNone(worker.lookup(self.hr_code.access_code))
+        background.assert_called_once()
+        rebuild.assert_not_called()
+
+    def test_expired_index_keeps_answering_while_it_is_rebuilt(self):
+        worker = access_index.AccessCodeIndex(self.path, max_age=0)
+        with mock.patch.object(worker, "_rebuild_in_background") as background:
+            self.assertIsNotNone(worker.lookup(self.hr_code.access_code))
+        background.assert_called_once()
+
+    def test_changes_rebuild_the_index_once_on_commit(self):
+        worker = self.worker()
+        rebuild = mock.patch.object(
+            access_index.AccessCodeIndex, "_rebuild_locked", autospec=True,
+            side_effect=access_index.AccessCodeIndex._rebuild_locked,
+        )
+        with self.settings(ACCESS_CODE_INDEX_PATH=self.path), mock.patch.object(access_index, "_index", None), \
+                rebuild as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.hr_code.notification_email = "new@example.com"
+                self.hr_code.save()
+                other = make_hr_code("hr2", "hr2@example.com")
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertEqual(worker.lookup(self.hr_code.access_code).notification_email, "new@example.com")
+        self.assertEqual(worker.lookup(other.access_code).id, other.id)
+
+    def test_saves_of_fields_outside_the_index_keep_it(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.hr_code.save(update_fields=["company_name"])
+        self.assertEqual(callbacks, [])
+
+
+# Run in a fresh interpreter: prometheus_client picks file-backed values on import
+WORKER_SCRIPT = """
+import os
+from anonplatform import metrics
+metrics.receipt_collision()
+metrics.email_breaker_changed("Fake", os.environ["BREAKER_STATE"])
+print(os.getpid())
+"""
+
+
+class MultiprocessMetricsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def worker(self, breaker_state):
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": self.directory, "BREAKER_STATE": breaker_state}
+        output = subprocess.run(
+            [sys.executable, "-c", WORKER_SCRIPT], env=env, check=True, capture_output=True, text=True,
+            cwd=settings.BASE_DIR,
+        )
+        return int(output.stdout.split()[-1])
+
+    def test_scrape_adds_up_every_worker(self):
+        from prometheus_client import multiprocess
+
+        open_pid = self.worker("open")
+        self.worker("closed")
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": self.directory}):
+            registry = metrics._build_registry(queues=False)
+            self.assertEqual(registry.get_sample_value("submission_receipt_collisions_total"), 2)
+            self.assertEqual(registry.get_sample_value("email_circuit_breaker_state", {"provider": "Fake"}), 2)
+            # gunicorn's child_exit hook: a dead worker's breaker state no longer counts
+            multiprocess.mark_process_dead(open_pid, self.directory)
+            self.assertEqual(registry.get_sample_value("email_circuit_breaker_state", {"provider": "Fake"}), 0)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"submission_receipt_collisions_total", response.content)
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
 
-# Create your tests here.
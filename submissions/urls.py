@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
+
+# Employee intake pages: native async views when served over ASGI
+intake_views = async_views if settings.SUBMISSION_ASYNC_VIEWS else views
 
 app_name = "submissions"
 
@@ -10,11 +14,13 @@ urlpatterns = [
     path("how-it-works/", views.how_it_works, name="how_it_works"),
     path("pricing/", views.pricing, name="pricing"),
     path("contact/", views.contact, name="contact"),
-    path("submit/", views.submit, name="submit"),
-    path("submitted/", views.submitted, name="submitted"),
-    path("status/", views.status_lookup, name="status_lookup"),
+    path("submit/", intake_views.submit, name="submit"),
+    path("submitted/", intake_views.submitted, name="submitted"),
+    path("status/", intake_views.status_lookup, name="status_lookup"),
     path("privacy/", views.privacy_policy, name="privacy"),
     path("terms/", views.terms_of_service, name="terms"),
     path("security/", views.security_transparency, name="security"),
+    path("api/v1/submissions/batch/", api.submit_batch, name="api_submit_batch"),
+    path("api/v1/status/", api.status_batch, name="api_status_batch"),
 ]
 
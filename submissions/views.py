@@ -1,15 +1,20 @@
 import html
+import logging
 import os
 import re
 
 from django.conf import settings
-from django.core.mail import send_mail
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
 from django.views.decorators.http import require_http_methods
 from django.core.cache import cache
+from django.db import transaction
 
+from . import access_index, code_filter, idempotency, intake, outbox, status_cache
 from .models import Submission
+from .notifications import initial_notified_at, notify_new_submission
+
+logger = logging.getLogger(__name__)
 
 
 def sanitize_input(text: str, max_length: int = None) -> str:
@@ -38,20 +43,35 @@ def validate_receipt_code(code: str) -> bool:
     return bool(re.match(r"^\d{10}$", cleaned))
 
 
-@require_http_methods(["GET", "POST"])
-def home(request: HttpRequest) -> HttpResponse:
-    return render(request, "submissions/home.html")
+def validate_submission(submission_type, title, body):
+    """
+    Sanitize and validate submission fields.
 
+    Returns (submission_type, title, body, errors); title and body are HTML-escaped.
+    """
+    submission_type = (submission_type or "").strip()
+    title = sanitize_input(title or "", max_length=255)
+    body = sanitize_input(body or "", max_length=5000)
 
-@require_http_methods(["GET", "POST"])
-def submit(request: HttpRequest) -> HttpResponse:
-    if request.method == "GET":
-        return render(request, "submissions/submit.html")
+    errors = []
 
-    # Validate access code - check against HR access codes
-    access_code = (request.POST.get("access_code") or "").strip()
-    
-    # Check if code matches any HR access code
+    if submission_type not in Submission.SubmissionType.values:
+        errors.append("Please select a valid submission type.")
+
+    if not title or len(title) < 3:
+        errors.append("Title must be at least 3 characters long.")
+
+    if not body or len(body) < 10:
+        errors.append("Description must be at least 10 characters long.")
+
+    if len(body) > 5000:
+        errors.append("Description is too long (maximum 5000 characters).")
+
+    return submission_type, title, body, errors
+
+
+def _find_active_hr_code(access_code: str):
+    """Look up an active HR access code directly in the database."""
     from .models import HrAccessCode
     from django.db import OperationalError, ProgrammingError, connection
     
@@ -60,13 +80,13 @@ def submit(request: HttpRequest) -> HttpResponse:
         # Use raw SQL to query HR access codes (works even if company_name column doesn't exist)
         with connection.cursor() as cursor:
             cursor.execute(
-                "SELECT id, access_code, notification_email, is_active, user_id FROM submissions_hraccesscode WHERE access_code = %s AND is_active = %s LIMIT 1",
+                "SELECT id, access_code, notification_email, is_active, user_id, notification_mode FROM submissions_hraccesscode WHERE access_code = %s AND is_active = %s LIMIT 1",
                 [access_code, True]
             )
             row = cursor.fetchone()
             if row:
                 # Reconstruct object
-                hr_code = HrAccessCode(id=row[0], access_code=row[1], is_active=row[3])
+                hr_code = HrAccessCode(id=row[0], access_code=row[1], is_active=row[3], user_id=row[4], notification_mode=row[5])
                 hr_code.notification_email = row[2] if row[2] else ""
                 hr_code._state.adding = False
                 hr_code._state.db = 'default'
@@ -82,6 +102,36 @@ def submit(request: HttpRequest) -> HttpResponse:
             hr_code = HrAccessCode.objects.get(access_code=access_code, is_active=True)
         except (HrAccessCode.DoesNotExist, Exception):
             hr_code = None
+    return hr_code
+
+
+@require_http_methods(["GET", "POST"])
+def home(request: HttpRequest) -> HttpResponse:
+    return render(request, "submissions/home.html")
+
+
+@require_http_methods(["GET", "POST"])
+def submit(request: HttpRequest) -> HttpResponse:
+    if request.method == "GET":
+        return render(request, "submissions/submit.html")
+
+    # Validate access code - check against HR access codes
+    access_code = (request.POST.get("access_code") or "").strip()
+    
+    # Check if code matches any HR access code (shared index first, DB as fallback)
+    try:
+        entry = access_index.lookup(access_code)
+        hr_code = entry.to_model() if entry else None
+        if hr_code is None:
+            code_filter.counters.incr("access_filtered")
+    except access_index.IndexUnavailable:
+        if code_filter.access_code_known_invalid(access_code):
+            hr_code = None
+        else:
+            code_filter.counters.incr("access_db_checked")
+            hr_code = _find_active_hr_code(access_code)
+            if hr_code is None:
+                code_filter.remember_invalid_access_code(access_code)
     
     # Require a valid HR access code (no global fallback)
     if not hr_code:
@@ -96,23 +146,9 @@ def submit(request: HttpRequest) -> HttpResponse:
         )
 
     # Validate and sanitize inputs
-    submission_type = (request.POST.get("type") or "").strip()
-    title = sanitize_input(request.POST.get("title") or "", max_length=255)
-    body = sanitize_input(request.POST.get("body") or "", max_length=5000)
-
-    errors = []
-
-    if submission_type not in Submission.SubmissionType.values:
-        errors.append("Please select a valid submission type.")
-
-    if not title or len(title) < 3:
-        errors.append("Title must be at least 3 characters long.")
-
-    if not body or len(body) < 10:
-        errors.append("Description must be at least 10 characters long.")
-
-    if len(body) > 5000:
-        errors.append("Description is too long (maximum 5000 characters).")
+    submission_type, title, body, errors = validate_submission(
+        request.POST.get("type"), request.POST.get("title"), request.POST.get("body")
+    )
 
     if errors:
         return render(
@@ -128,6 +164,20 @@ def submit(request: HttpRequest) -> HttpResponse:
             status=400,
         )
 
+    # A repeated POST of the same form (double-click, retry) gets the first receipt
+    idempotency_key = request.POST.get(idempotency.FIELD_NAME)
+    claimed, previous = idempotency.claim("submit", idempotency_key)
+    if previous is not None:
+        request.session["last_receipt_code"] = previous["receipt_code"]
+        return redirect("submissions:submitted")
+    if not claimed:
+        return render(
+            request,
+            "submissions/submit.html",
+            {"error": "Your submission is still being processed. Please wait a moment and check again."},
+            status=409,
+        )
+
     # Create submission
     try:
         # Only include hr_access_code if it exists
@@ -139,25 +189,33 @@ def submit(request: HttpRequest) -> HttpResponse:
         if hr_code:
             submission_kwargs["hr_access_code"] = hr_code
         
-        s = Submission.create_with_unique_receipt(**submission_kwargs)
+        # Notify HR - only the HR tied to the code (no global fallback notifications)
+        hr_email = hr_code.get_notification_email()
+        recipient_emails = [hr_email] if hr_email else []
+
+        if intake.is_enabled():
+            # Persisted and notified by `manage.py flush_intake`
+            s = intake.enqueue(
+                site_url=request.build_absolute_uri("/"),
+                notify=recipient_emails,
+                **submission_kwargs,
+            )
+        else:
+            # The outbox message commits together with the submission
+            with transaction.atomic():
+                s = Submission.create_with_unique_receipt(
+                    notified_at=initial_notified_at(hr_code), **submission_kwargs
+                )
+                notify_new_submission(
+                    s,
+                    recipient_emails,
+                    admin_url=request.build_absolute_uri(f'/admin/submissions/submission/{s.id}/change/'),
+                )
     except Exception as e:
-        # Log the actual error for debugging - print to stdout so Railway captures it
-        import logging
-        import traceback
-        import sys
-        
-        logger = logging.getLogger(__name__)
+        idempotency.release("submit", idempotency_key)
         error_msg = f"Error creating submission: {type(e).__name__}: {e}"
-        traceback_str = traceback.format_exc()
-        
-        # Log to logger
-        logger.error(error_msg)
-        logger.error(traceback_str)
-        
-        # Also print to stdout/stderr so Railway captures it
-        print(f"ERROR: {error_msg}", file=sys.stderr, flush=True)
-        print(traceback_str, file=sys.stderr, flush=True)
-        
+        logger.exception("Error creating submission", extra={"hr_access_code_id": hr_code.id})
+
         # If DEBUG is on, show more details
         if settings.DEBUG:
             return render(
@@ -180,35 +238,7 @@ def submit(request: HttpRequest) -> HttpResponse:
             status=500,
         )
 
-    # Notify HR - send to specific HR if code was used, otherwise use default
-    recipient_emails = []
-    
-    if hr_code:
-        # Send to the specific HR whose code was used
-        hr_email = hr_code.get_notification_email()
-        if hr_email:
-            recipient_emails = [hr_email]
-    # No global fallback notifications; only notify the HR tied to the code
-    
-    if recipient_emails:
-        try:
-            send_mail(
-                subject=f"New anonymous submission: {s.get_type_display()}",
-                message=(
-                    f"Type: {s.get_type_display()}\n"
-                    f"Title: {s.title}\n"
-                    f"Receipt: {s.receipt_code}\n"
-                    f"Submitted: {s.created_at.strftime('%Y-%m-%d %H:%M:%S UTC')}\n\n"
-                    f"View in admin: {request.build_absolute_uri(f'/admin/submissions/submission/{s.id}/change/')}\n"
-                ),
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=recipient_emails,
-                fail_silently=True,
-            )
-        except Exception:
-            # Don't fail submission if email fails
-            pass
-
+    idempotency.complete("submit", idempotency_key, {"receipt_code": s.receipt_code})
     request.session["last_receipt_code"] = s.receipt_code
     return redirect("submissions:submitted")
 
@@ -237,9 +267,12 @@ def status_lookup(request: HttpRequest) -> HttpResponse:
             status=400,
         )
 
-    try:
-        submission = Submission.objects.select_related("hr_response").get(receipt_code=receipt_code)
-    except Submission.DoesNotExist:
+    submission = status_cache.get_status(receipt_code)
+    if submission is None and intake.is_enabled():
+        # Accepted but not flushed yet in queued intake mode
+        pending = intake.find_pending(receipt_code)
+        submission = status_cache.to_dto(pending) if pending else None
+    if submission is None:
         return render(
             request,
             "submissions/status_lookup.html",
@@ -308,116 +341,29 @@ def contact(request: HttpRequest) -> HttpResponse:
             status=400,
         )
 
-    # Send contact form email to sales@kyrex.co (non-blocking to prevent worker timeout)
+    # Send contact form email to sales@kyrex.co (queued in the outbox)
     contact_email = os.environ.get("CONTACT_EMAIL", "sales@kyrex.co")
-    import logging
-    import traceback
-    import sys
-    import threading
-    from datetime import datetime
-    
-    logger = logging.getLogger(__name__)
-    
-    # Print immediately when form is submitted - use multiple methods to ensure visibility
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Force output to stdout/stderr with flush to ensure Railway captures it
-    try:
-        print("\n" + "=" * 80, file=sys.stdout, flush=True)
-        print(f"[{timestamp}] *** CONTACT FORM SUBMITTED ***", file=sys.stdout, flush=True)
-        print(f"Company: {html.unescape(company_name)}", file=sys.stdout, flush=True)
-        print(f"Email: {html.unescape(email)}", file=sys.stdout, flush=True)
-        print(f"Message length: {len(message)} characters", file=sys.stdout, flush=True)
-        print("=" * 80 + "\n", file=sys.stdout, flush=True)
-        
-        # Also print to stderr as backup
-        print(f"[{timestamp}] CONTACT FORM: Form submitted - {html.unescape(company_name)}", file=sys.stderr, flush=True)
-        
-        # Also log to logger
-        logger.info(f"CONTACT FORM SUBMITTED: Company={html.unescape(company_name)}, Email={html.unescape(email)}")
-    except Exception as log_error:
-        # Even if logging fails, don't break the form
-        print(f"Error in logging: {log_error}", file=sys.stderr, flush=True)
-    
-    def send_email_async():
-        """Send email in background thread to prevent blocking."""
-        try:
-            # Print to stdout/stderr for immediate visibility in Railway logs
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print("\n" + "=" * 80, file=sys.stdout, flush=True)
-            print(f"[{timestamp}] *** CONTACT FORM: Starting email send process ***", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Recipient: {contact_email}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email backend: {settings.EMAIL_BACKEND}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email host: {getattr(settings, 'EMAIL_HOST', 'Not set')}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email port: {getattr(settings, 'EMAIL_PORT', 'Not set')}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email use TLS: {getattr(settings, 'EMAIL_USE_TLS', 'Not set')}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email user: {getattr(settings, 'EMAIL_HOST_USER', 'Not set')}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: Email password set: {'Yes' if getattr(settings, 'EMAIL_HOST_PASSWORD', '') else 'No'}", file=sys.stdout, flush=True)
-            print(f"CONTACT FORM: From email: {settings.DEFAULT_FROM_EMAIL}", file=sys.stdout, flush=True)
-            print("=" * 80 + "\n", file=sys.stdout, flush=True)
-            
-            # Also log to logger
-            logger.info(f"Attempting to send contact form email to {contact_email}")
-            logger.info(f"Email backend: {settings.EMAIL_BACKEND}")
-            logger.info(f"Email host: {getattr(settings, 'EMAIL_HOST', 'Not set')}")
-            logger.info(f"From email: {settings.DEFAULT_FROM_EMAIL}")
-            
-            # Try to send email and catch any exceptions
-            try:
-                result = send_mail(
-                    subject=f"Contact Form Submission from {html.unescape(company_name)}",
-                    message=(
-                        f"New contact form submission:\n\n"
-                        f"Company name: {html.unescape(company_name)}\n"
-                        f"Email: {html.unescape(email)}\n\n"
-                        f"Message:\n{html.unescape(message)}\n\n"
-                        f"---\n"
-                        f"This message was sent from the contact form on {request.build_absolute_uri('/contact/')}"
-                    ),
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[contact_email],
-                    fail_silently=False,  # Set to False to catch errors
-                )
-                
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print("\n" + "=" * 80, file=sys.stdout, flush=True)
-                print(f"[{timestamp}] *** CONTACT FORM: Email send result: {result} ***", file=sys.stdout, flush=True)
-                print(f"CONTACT FORM: From: {settings.DEFAULT_FROM_EMAIL}", file=sys.stdout, flush=True)
-                print(f"CONTACT FORM: To: {contact_email}", file=sys.stdout, flush=True)
-                print("=" * 80 + "\n", file=sys.stdout, flush=True)
-                logger.info(f"Contact form email sent successfully to {contact_email}, result: {result}")
-            except Exception as send_error:
-                # Catch SMTP errors that fail_silently=False would raise
-                error_msg = f"SMTP Error sending email: {type(send_error).__name__}: {send_error}"
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print("\n" + "=" * 80, file=sys.stderr, flush=True)
-                print(f"[{timestamp}] *** CONTACT FORM: SMTP ERROR ***", file=sys.stderr, flush=True)
-                print(error_msg, file=sys.stderr, flush=True)
-                print(traceback.format_exc(), file=sys.stderr, flush=True)
-                print("=" * 80 + "\n", file=sys.stderr, flush=True)
-                logger.error(error_msg)
-                logger.error(traceback.format_exc())
-                raise  # Re-raise to be caught by outer exception handler
-        except Exception as e:
-            # Log email sending errors but don't fail the form submission
-            error_msg = f"Error sending contact form email to {contact_email}: {type(e).__name__}: {e}"
-            traceback_str = traceback.format_exc()
-            
-            # Print to stderr for immediate visibility in Railway logs
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print("\n" + "=" * 80, file=sys.stderr, flush=True)
-            print(f"[{timestamp}] *** CONTACT FORM ERROR ***", file=sys.stderr, flush=True)
-            print(f"CONTACT FORM ERROR: {error_msg}", file=sys.stderr, flush=True)
-            print(traceback_str, file=sys.stderr, flush=True)
-            print("=" * 80 + "\n", file=sys.stderr, flush=True)
-            
-            # Also log to logger
-            logger.error(error_msg)
-            logger.error(traceback_str)
-    
-    # Send email in background thread to prevent worker timeout
-    email_thread = threading.Thread(target=send_email_async, daemon=True)
-    email_thread.start()
+    logger.info(
+        "Contact form submitted",
+        extra={"company": html.unescape(company_name), "message_length": len(message)},
+    )
+    logger.debug("Contact form sender", extra={"email": html.unescape(email)})
+
+    # Delivered by `manage.py run_outbox`, so the request never waits on the provider
+    outbox.enqueue(
+        kind="contact",
+        subject=f"Contact Form Submission from {html.unescape(company_name)}",
+        body=(
+            f"New contact form submission:\n\n"
+            f"Company name: {html.unescape(company_name)}\n"
+            f"Email: {html.unescape(email)}\n\n"
+            f"Message:\n{html.unescape(message)}\n\n"
+            f"---\n"
+            f"This message was sent from the contact form on {request.build_absolute_uri('/contact/')}"
+        ),
+        recipients=[contact_email],
+    )
+    logger.info("Contact form email queued", extra={"recipient": contact_email})
 
     return render(request, "submissions/contact.html", {"success": True})
 
@@ -434,9 +380,6 @@ def hr_register(request: HttpRequest) -> HttpResponse:
         return render(request, "submissions/hr_register.html")
 
     # Wrap entire POST processing in try-except to catch any unhandled errors
-    import sys
-    import traceback
-    
     try:
         company_name = sanitize_input(request.POST.get("company_name") or "", max_length=150)
         email = sanitize_input(request.POST.get("email") or "", max_length=254)
@@ -465,6 +408,19 @@ def hr_register(request: HttpRequest) -> HttpResponse:
                 status=400,
             )
 
+        # A repeated POST of the same form must not reset the password or resend the email
+        idempotency_key = request.POST.get(idempotency.FIELD_NAME)
+        claimed, previous = idempotency.claim("hr_register", idempotency_key)
+        if previous is not None:
+            return render(request, "submissions/hr_register.html", {"success": True, **previous})
+        if not claimed:
+            return render(
+                request,
+                "submissions/hr_register.html",
+                {"error": "Your registration is still being processed. Please wait a moment and check your inbox."},
+                status=409,
+            )
+
         # Create staff user + HrAccessCode
         from django.contrib.auth.models import User
         from .models import HrAccessCode
@@ -482,165 +438,125 @@ def hr_register(request: HttpRequest) -> HttpResponse:
         else:
             username = f"hr_{secrets.token_hex(4)}"
 
-        # If user already exists, re-use it; otherwise create a new one
-        user, created = User.objects.get_or_create(
-            email=html.unescape(email),
-            defaults={"username": username},
-        )
+        # User, access code and the outbox email commit together
+        with transaction.atomic():
+            # If user already exists, re-use it; otherwise create a new one
+            user, created = User.objects.get_or_create(
+                email=html.unescape(email),
+                defaults={"username": username},
+            )
 
-        # Make sure it's staff so it can have an access code
-        if not user.is_staff:
-            user.is_staff = True
-        if not user.is_active:
-            user.is_active = True
-        if not user.username:
-            user.username = username
-        # Always generate a new password for HR and store it
-        temp_password = secrets.token_urlsafe(10)
-        user.set_password(temp_password)
-        user.save()
-
-        # Try to get or create HR access code
-        try:
-            hr_access = HrAccessCode.get_or_create_for_user(user)
-        except Exception as db_error:
-            # Log the error for debugging
-            error_str = str(db_error)
-            print(f"\n[HR REGISTRATION ERROR] {type(db_error).__name__}: {error_str}\n{traceback.format_exc()}\n", file=sys.stderr, flush=True)
+            # Make sure it's staff so it can have an access code
+            if not user.is_staff:
+                user.is_staff = True
+            if not user.is_active:
+                user.is_active = True
+            if not user.username:
+                user.username = username
+            # Always generate a new password for HR and store it
+            temp_password = secrets.token_urlsafe(10)
+            user.set_password(temp_password)
+            user.save()
+
+            # Try to get or create HR access code
+            try:
+                hr_access = HrAccessCode.get_or_create_for_user(user)
+            except Exception as db_error:
+                error_str = str(db_error)
+                logger.exception("HR registration: could not create access code", extra={"user_id": user.id})
             
-            # Check if it's a missing column error (migration hasn't run)
-            if "company_name" in error_str or "does not exist" in error_str:
-                return render(
-                    request,
-                    "submissions/hr_register.html",
-                    {
-                        "error": "Database migration required. Please contact support or wait a few minutes for the system to update.",
-                        "company_name": html.unescape(company_name),
-                        "email": html.unescape(email),
-                        "website": html.unescape(website),
-                    },
-                    status=503,
-                )
-            # Re-raise other errors
-            raise
-        
-        hr_access.notification_email = html.unescape(email)
-        hr_access.is_active = True
-        
-        # Try to set company fields if they exist (migration has run)
-        # Then save, handling case where columns don't exist yet
-        try:
-            hr_access.company_name = html.unescape(company_name)
-            hr_access.company_website = html.unescape(website)
-        except AttributeError:
-            # Fields don't exist on model yet - migration hasn't run
-            pass
-        
-        # Save, handling case where database columns don't exist
-        try:
-            hr_access.save()
-        except Exception as save_error:
-            error_str = str(save_error)
-            if "company_name" in error_str or "company_website" in error_str or "does not exist" in error_str:
-                # Migration hasn't run - save without company fields using raw SQL
-                from django.db import connection
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        """
-                        UPDATE submissions_hraccesscode 
-                        SET notification_email = %s, is_active = %s, updated_at = NOW()
-                        WHERE id = %s
-                        """,
-                        [html.unescape(email), True, hr_access.id]
+                # Check if it's a missing column error (migration hasn't run)
+                if "company_name" in error_str or "does not exist" in error_str:
+                    idempotency.release("hr_register", idempotency_key)
+                    return render(
+                        request,
+                        "submissions/hr_register.html",
+                        {
+                            "error": "Database migration required. Please contact support or wait a few minutes for the system to update.",
+                            "company_name": html.unescape(company_name),
+                            "email": html.unescape(email),
+                            "website": html.unescape(website),
+                        },
+                        status=503,
                     )
-            else:
-                # Different error - re-raise it
+                # Re-raise other errors
                 raise
-
-        # Email the access code (async to prevent timeout)
-        import logging
-        import threading
-        from datetime import datetime
         
-        logger = logging.getLogger(__name__)
+            hr_access.notification_email = html.unescape(email)
+            hr_access.is_active = True
         
-        # Get company name for email (handle case where field doesn't exist yet)
-        company_display = getattr(hr_access, 'company_name', None) or company_name or "there"
+            # Try to set company fields if they exist (migration has run)
+            # Then save, handling case where columns don't exist yet
+            try:
+                hr_access.company_name = html.unescape(company_name)
+                hr_access.company_website = html.unescape(website)
+            except AttributeError:
+                # Fields don't exist on model yet - migration hasn't run
+                pass
         
-        # Store access code for display on success page (backup if email fails)
-        # Ensure we can access the access_code attribute
-        try:
-            access_code_to_display = hr_access.access_code
-        except AttributeError:
-            # If access_code doesn't exist, try to get it from the database directly
-            from django.db import connection
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SELECT access_code FROM submissions_hraccesscode WHERE id = %s",
-                    [hr_access.id]
-                )
-                row = cursor.fetchone()
-                access_code_to_display = row[0] if row else "ERROR_NO_CODE"
-            print(f"[HR REGISTRATION] Had to fetch access_code from DB: {access_code_to_display}", file=sys.stdout, flush=True)
+            # Save, handling case where database columns don't exist
+            try:
+                # Savepoint, so the raw SQL fallback below can still run on failure
+                with transaction.atomic():
+                    hr_access.save()
+            except Exception as save_error:
+                error_str = str(save_error)
+                if "company_name" in error_str or "company_website" in error_str or "does not exist" in error_str:
+                    # Migration hasn't run - save without company fields using raw SQL
+                    from django.db import connection
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            """
+                            UPDATE submissions_hraccesscode 
+                            SET notification_email = %s, is_active = %s, updated_at = NOW()
+                            WHERE id = %s
+                            """,
+                            [html.unescape(email), True, hr_access.id]
+                        )
+                    access_index.invalidate_on_commit()
+                else:
+                    # Different error - re-raise it
+                    raise
+
+            # Email the access code (through the outbox)
+            # Get company name for email (handle case where field doesn't exist yet)
+            company_display = getattr(hr_access, 'company_name', None) or company_name or "there"
         
-        def send_email_async():
-            """Send email in background thread to prevent blocking."""
+            # Store access code for display on success page (backup if email fails)
+            # Ensure we can access the access_code attribute
             try:
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print("\n" + "=" * 80, file=sys.stdout, flush=True)
-                print(f"[{timestamp}] *** HR REGISTRATION: Starting email send ***", file=sys.stdout, flush=True)
-                print(f"HR REGISTRATION: Recipient: {html.unescape(email)}", file=sys.stdout, flush=True)
-                print(f"HR REGISTRATION: Access code: {access_code_to_display}", file=sys.stdout, flush=True)
-                print(f"HR REGISTRATION: Email backend: {settings.EMAIL_BACKEND}", file=sys.stdout, flush=True)
-                print(f"HR REGISTRATION: From email: {settings.DEFAULT_FROM_EMAIL}", file=sys.stdout, flush=True)
-                print("=" * 80 + "\n", file=sys.stdout, flush=True)
-                
-                logger.info(f"Attempting to send HR registration email to {html.unescape(email)}")
-                logger.info(f"Access code: {access_code_to_display}")
-                
-                try:
-                    result = send_mail(
-                        subject="Your KYREX HR access code",
-                        message=(
-                            f"Hi {company_display},\n\n"
-                            f"Company name: {company_display}\n"
-                            f"HR login username: {user.username}\n"
-                            f"Temporary password: {temp_password}\n\n"
-                            f"Password changes are disabled for this account.\n\n"
-                            f"Your HR access code is: {access_code_to_display}\n\n"
-                            f"Employees can submit feedback using this code at:\n"
-                            f"{request.build_absolute_uri('/submit/')}\n\n"
-                            f"If you did not request this, you can ignore this email.\n"
-                        ),
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[html.unescape(email)],
-                        fail_silently=True,  # Don't fail registration if email fails
+                access_code_to_display = hr_access.access_code
+            except AttributeError:
+                # If access_code doesn't exist, try to get it from the database directly
+                from django.db import connection
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT access_code FROM submissions_hraccesscode WHERE id = %s",
+                        [hr_access.id]
                     )
-                    
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print("\n" + "=" * 80, file=sys.stdout, flush=True)
-                    print(f"[{timestamp}] *** HR REGISTRATION: Email sent successfully ***", file=sys.stdout, flush=True)
-                    print(f"HR REGISTRATION: Result: {result}", file=sys.stdout, flush=True)
-                    print("=" * 80 + "\n", file=sys.stdout, flush=True)
-                    logger.info(f"HR registration email sent successfully to {html.unescape(email)}, result: {result}")
-                except Exception as send_error:
-                    error_msg = f"Error sending HR registration email: {type(send_error).__name__}: {send_error}"
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print("\n" + "=" * 80, file=sys.stderr, flush=True)
-                    print(f"[{timestamp}] *** HR REGISTRATION: EMAIL ERROR ***", file=sys.stderr, flush=True)
-                    print(error_msg, file=sys.stderr, flush=True)
-                    print(traceback.format_exc(), file=sys.stderr, flush=True)
-                    print("=" * 80 + "\n", file=sys.stderr, flush=True)
-                    logger.error(error_msg)
-                    logger.error(traceback.format_exc())
-            except Exception as e:
-                error_msg = f"Error in HR registration email thread: {type(e).__name__}: {e}"
-                logger.error(error_msg, exc_info=True)
-                print(f"HR REGISTRATION EMAIL THREAD ERROR: {error_msg}", file=sys.stderr, flush=True)
+                    row = cursor.fetchone()
+                    access_code_to_display = row[0] if row else "ERROR_NO_CODE"
+                logger.warning("HR registration: access code read back from the database", extra={"hr_access_code_id": hr_access.id})
         
-        # Send email in background thread
-        email_thread = threading.Thread(target=send_email_async, daemon=True)
-        email_thread.start()
+            # Queued in the same transaction as the registration. The body carries the
+            # temporary password, so it is blanked once delivered.
+            outbox.enqueue(
+                kind="hr_registration",
+                subject="Your KYREX HR access code",
+                body=(
+                    f"Hi {company_display},\n\n"
+                    f"Company name: {company_display}\n"
+                    f"HR login username: {user.username}\n"
+                    f"Temporary password: {temp_password}\n\n"
+                    f"Password changes are disabled for this account.\n\n"
+                    f"Your HR access code is: {access_code_to_display}\n\n"
+                    f"Employees can submit feedback using this code at:\n"
+                    f"{request.build_absolute_uri('/submit/')}\n\n"
+                    f"If you did not request this, you can ignore this email.\n"
+                ),
+                recipients=[html.unescape(email)],
+                redact_after_send=True,
+            )
 
         # Ensure we have the access code (should always be set, but double-check)
         if not access_code_to_display or access_code_to_display == "ERROR_NO_CODE":
@@ -661,29 +577,27 @@ def hr_register(request: HttpRequest) -> HttpResponse:
                 except Exception:
                     access_code_to_display = "ERROR"
 
-        # Log success for debugging
-        logger.info(f"HR registration successful for {html.unescape(email)}, access code: {access_code_to_display}")
-        print(f"\n{'='*80}", file=sys.stdout, flush=True)
-        print(f"[HR REGISTRATION] SUCCESS! Rendering success page", file=sys.stdout, flush=True)
-        print(f"[HR REGISTRATION] Access code: {access_code_to_display}", file=sys.stdout, flush=True)
-        print(f"[HR REGISTRATION] Email: {html.unescape(email)}", file=sys.stdout, flush=True)
-        print(f"{'='*80}\n", file=sys.stdout, flush=True)
+        logger.info(
+            "HR registration successful",
+            extra={"user_id": user.id, "hr_access_code_id": hr_access.id, "new_user": created},
+        )
+        logger.debug(
+            "HR registration details",
+            extra={"email": html.unescape(email), "access_code": access_code_to_display},
+        )
 
         # Always render success page - access code is only sent via email, not shown on page
+        result = {
+            "company_name": getattr(hr_access, 'company_name', None) or company_name,
+            "email": hr_access.notification_email or html.unescape(email),
+            "website": getattr(hr_access, 'company_website', None) or website,
+        }
+        idempotency.complete("hr_register", idempotency_key, result)
         try:
-            return render(
-                request,
-                "submissions/hr_register.html",
-                {
-                    "success": True,
-                    "company_name": getattr(hr_access, 'company_name', None) or company_name,
-                    "email": hr_access.notification_email or html.unescape(email),
-                    "website": getattr(hr_access, 'company_website', None) or website,
-                },
-            )
-        except Exception as render_error:
+            return render(request, "submissions/hr_register.html", {"success": True, **result})
+        except Exception:
             # If rendering fails, return a simple success message (no access code shown)
-            print(f"[HR REGISTRATION] Render error: {render_error}", file=sys.stderr, flush=True)
+            logger.exception("HR registration: success page failed to render")
             return HttpResponse(
                 f"""
                 <html><body style="font-family: sans-serif; padding: 2rem;">
@@ -698,13 +612,8 @@ def hr_register(request: HttpRequest) -> HttpResponse:
     except Exception as e:
         # Catch any unhandled exception and show error message
         error_msg = f"An error occurred: {type(e).__name__}: {str(e)}"
-        error_traceback = traceback.format_exc()
-        
-        print(f"\n{'='*80}", file=sys.stderr, flush=True)
-        print(f"[HR REGISTRATION] UNHANDLED EXCEPTION", file=sys.stderr, flush=True)
-        print(error_msg, file=sys.stderr, flush=True)
-        print(error_traceback, file=sys.stderr, flush=True)
-        print(f"{'='*80}\n", file=sys.stderr, flush=True)
+        logger.exception("HR registration failed")
+        idempotency.release("hr_register", request.POST.get(idempotency.FIELD_NAME))
         
         # Try to get form values for error display
         try:
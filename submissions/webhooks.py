@@ -0,0 +1,327 @@
+"""
+Outbound webhooks for submission events.
+
+Each HR access code can register WebhookEndpoints. Creating a submission or
+changing its status queues one WebhookDelivery per active endpoint, in the
+same transaction as the change (like the email outbox), and
+``manage.py run_webhooks`` delivers them. Like the outbox, a worker claims
+due events under a lease in one short transaction, POSTs them with no
+transaction open, and records the outcome in another. The lease covers the
+worst case for the batch it claims: one request per endpoint, run
+``WEBHOOK_MAX_WORKERS`` at a time, each allowed ``WEBHOOK_TIMEOUT`` to connect
+and again to respond.
+
+Most HR accounts have no endpoints, so each process keeps the set of accounts
+that do, reloaded every ``WEBHOOK_ENDPOINTS_REFRESH_SECONDS``, and saving a
+submission of any other account queues nothing without a query. Endpoint
+changes made in this process apply at once; an endpoint added elsewhere starts
+receiving events within that interval.
+
+Events due for the same endpoint are POSTed together as one JSON document::
+
+    {"events": [{"id": "<uuid>", "type": "submission.created",
+                 "created_at": "...", "data": {...}}, ...]}
+
+signed with the endpoint secret::
+
+    X-Webhook-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">
+
+Receivers should check the signature with ``verify_signature()`` (or the
+equivalent in their language), reject old timestamps and de-duplicate on the
+event id: an event is retried, with exponential backoff, until the endpoint
+answers 2xx or ``WEBHOOK_MAX_ATTEMPTS`` is reached. Receipt codes are never
+included, so a receiver cannot look up or act as the submitter.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import groupby
+from typing import Iterable, Optional
+
+import requests
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_CREATED = "submission.created"
+SUBMISSION_STATUS_CHANGED = "submission.status_changed"
+SIGNATURE_HEADER = "X-Webhook-Signature"
+
+# Time to record a batch's outcome after its last request returns
+LEASE_MARGIN_SECONDS = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+# HR code ids with an active endpoint, and when they were loaded
+_endpoint_owners = None
+_endpoint_owners_loaded_at = 0.0
+_endpoint_owners_lock = threading.Lock()
+
+
+@dataclass
+class DeliverResult:
+    claimed: int = 0
+    requests: int = 0
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("ascii") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_signature(secret: str, header: str, body: bytes, tolerance: int = 300) -> bool:
+    """Check an X-Webhook-Signature header, rejecting timestamps more than ``tolerance`` seconds off."""
+    try:
+        parts = dict(item.split("=", 1) for item in header.split(","))
+        timestamp = int(parts["t"])
+        signature = parts["v1"]
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    expected = sign(secret, timestamp, body).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, signature)
+
+
+def _submission_data(submission) -> dict:
+    # No receipt code: it is the submitter's only credential
+    return {
+        "id": submission.id,
+        "type": submission.type,
+        "title": submission.title,
+        "body": submission.body,
+        "status": submission.status,
+        "created_at": submission.created_at,
+    }
+
+
+def _hr_codes_with_endpoints() -> frozenset:
+    global _endpoint_owners, _endpoint_owners_loaded_at
+    from .models import WebhookEndpoint
+
+    owners = _endpoint_owners
+    if owners is not None and time.monotonic() - _endpoint_owners_loaded_at < settings.WEBHOOK_ENDPOINTS_REFRESH_SECONDS:
+        return owners
+    with _endpoint_owners_lock:
+        owners = frozenset(
+            WebhookEndpoint.objects.filter(is_active=True).values_list("hr_access_code_id", flat=True).distinct()
+        )
+        _endpoint_owners, _endpoint_owners_loaded_at = owners, time.monotonic()
+    return owners
+
+
+def forget_endpoints() -> None:
+    """Reload the set of HR codes with endpoints on the next event (an endpoint changed)."""
+    global _endpoint_owners
+    _endpoint_owners = None
+
+
+def _enqueue(events) -> int:
+    """Queue (hr_access_code_id, event, data) tuples for every active endpoint of their HR code."""
+    from .models import WebhookDelivery, WebhookEndpoint
+
+    events = list(events)
+    if not events:
+        return 0
+    owners = _hr_codes_with_endpoints()
+    events = [e for e in events if e[0] in owners]
+    if not events:
+        return 0
+    endpoints = {}
+    for endpoint_id, hr_code_id in WebhookEndpoint.objects.filter(
+        hr_access_code_id__in={e[0] for e in events}, is_active=True
+    ).values_list("id", "hr_access_code_id"):
+        endpoints.setdefault(hr_code_id, []).append(endpoint_id)
+    if not endpoints:
+        return 0
+    deliveries = [
+        # Round-trip through JSON so dates are stored as the strings receivers get
+        WebhookDelivery(endpoint_id=endpoint_id, event=event, payload=json.loads(json.dumps(data, cls=DjangoJSONEncoder)))
+        for hr_code_id, event, data in events
+        for endpoint_id in endpoints.get(hr_code_id, ())
+    ]
+    WebhookDelivery.objects.bulk_create(deliveries, batch_size=500)
+    return len(deliveries)
+
+
+def submissions_created(submissions: Iterable) -> int:
+    """Queue submission.created events. Call inside the transaction that creates them."""
+    return _enqueue((s.hr_access_code_id, SUBMISSION_CREATED, _submission_data(s)) for s in submissions)
+
+
+def status_changed(submissions: Iterable, previous: dict) -> int:
+    """
+    Queue submission.status_changed events. ``previous`` maps submission id to
+    the old status; submissions whose status did not change are skipped.
+    """
+    return _enqueue(
+        (s.hr_access_code_id, SUBMISSION_STATUS_CHANGED, {**_submission_data(s), "previous_status": previous[s.id]})
+        for s in submissions
+        if previous.get(s.id) and previous[s.id] != s.status
+    )
+
+
+def _get_session() -> requests.Session:
+    # One keep-alive pool per process, shared by the delivery threads
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=max(settings.WEBHOOK_MAX_WORKERS, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "anonplatform-webhooks/1"
+            _session = session
+        return _session
+
+
+def _post(endpoint, deliveries):
+    """POST one batch. Returns (error or None, retry_after seconds or None)."""
+    body = json.dumps(
+        {
+            "events": [
+                {"id": str(d.event_id), "type": d.event, "created_at": d.created_at.isoformat(), "data": d.payload}
+                for d in deliveries
+            ]
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        SIGNATURE_HEADER: sign(endpoint.secret, int(time.time()), body),
+    }
+    try:
+        response = _get_session().post(endpoint.url, data=body, headers=headers, timeout=settings.WEBHOOK_TIMEOUT)
+    except requests.RequestException as exc:
+        return f"{type(exc).__name__}: {exc}", None
+    if 200 <= response.status_code < 300:
+        return None, None
+    retry_after = response.headers.get("Retry-After", "")
+    return f"HTTP {response.status_code}: {response.text[:200]}", int(retry_after) if retry_after.isdigit() else None
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), 6 * 3600))
+
+
+def _lease(requests: int) -> timedelta:
+    """How long ``requests`` POSTs can take: rounds of WEBHOOK_MAX_WORKERS, each up to a connect and a read timeout."""
+    rounds = math.ceil(requests / max(settings.WEBHOOK_MAX_WORKERS, 1))
+    return timedelta(seconds=rounds * 2 * settings.WEBHOOK_TIMEOUT + LEASE_MARGIN_SECONDS)
+
+
+def deliver(batch_size: Optional[int] = None) -> DeliverResult:
+    """Claim up to ``batch_size`` due events, POST them (one request per endpoint) and record the outcome."""
+    from .models import WebhookDelivery, WebhookEndpoint
+
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    result = DeliverResult()
+    with transaction.atomic():
+        deliveries = list(
+            WebhookDelivery.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(status=WebhookDelivery.Status.PENDING, available_at__lte=timezone.now(), endpoint__is_active=True)
+            .select_related("endpoint")
+            .order_by("available_at", "id")[:batch_size]
+        )
+        if not deliveries:
+            return result
+        lease_until = timezone.now() + _lease(len({d.endpoint_id for d in deliveries}))
+        WebhookDelivery.objects.filter(id__in=[d.id for d in deliveries]).update(available_at=lease_until)
+    result.claimed = len(deliveries)
+    # Claimed oldest first across endpoints so a busy one cannot starve the rest;
+    # grouped per endpoint here so each gets one request
+    deliveries.sort(key=lambda d: d.endpoint_id)
+
+    batches = [list(group) for _, group in groupby(deliveries, key=lambda d: d.endpoint_id)]
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.WEBHOOK_MAX_WORKERS, len(batches)))) as executor:
+        outcomes = list(executor.map(lambda batch: _post(batch[0].endpoint, batch), batches))
+    result.requests = len(batches)
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Skip events whose lease ran out and that another worker claimed since
+        held = set(
+            WebhookDelivery.objects.select_for_update()
+            .filter(id__in=[d.id for d in deliveries], status=WebhookDelivery.Status.PENDING, available_at=lease_until)
+            .values_list("id", flat=True)
+        )
+        if len(held) < len(deliveries):
+            logger.warning("Webhook lease expired for %d event(s) before their results were recorded", len(deliveries) - len(held))
+        recorded = []
+        succeeded, failed = [], []
+        for batch, (error, retry_after) in zip(batches, outcomes):
+            endpoint = batch[0].endpoint
+            (succeeded if error is None else failed).append(endpoint.id)
+            for delivery in batch:
+                if delivery.id not in held:
+                    continue
+                recorded.append(delivery)
+                delivery.attempts += 1
+                if error is None:
+                    delivery.status = WebhookDelivery.Status.SENT
+                    delivery.sent_at = now
+                    delivery.last_error = ""
+                    result.sent += 1
+                elif delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                    delivery.status = WebhookDelivery.Status.FAILED
+                    delivery.last_error = error[:2000]
+                    result.failed += 1
+                else:
+                    delay = _backoff(delivery.attempts)
+                    if retry_after:
+                        delay = max(delay, timedelta(seconds=retry_after))
+                    delivery.available_at = now + delay
+                    delivery.last_error = error[:2000]
+                    result.retried += 1
+            if error is not None:
+                logger.warning("Webhook delivery to endpoint %s (%d events) failed: %s", endpoint.id, len(batch), error)
+
+        WebhookDelivery.objects.bulk_update(recorded, ["attempts", "status", "sent_at", "available_at", "last_error"])
+        # F() so concurrent workers posting to the same endpoint both count
+        WebhookEndpoint.objects.filter(id__in=succeeded).update(last_success_at=now, consecutive_failures=0)
+        WebhookEndpoint.objects.filter(id__in=failed).update(
+            last_failure_at=now, consecutive_failures=F("consecutive_failures") + 1
+        )
+    return result
+
+
+def purge_sent(older_than_days: Optional[int] = None) -> int:
+    from .models import WebhookDelivery
+
+    days = settings.WEBHOOK_KEEP_SENT_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = WebhookDelivery.objects.filter(status=WebhookDelivery.Status.SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def stats() -> dict:
+    """Queue depth and age of the oldest event still waiting to be delivered."""
+    from .models import WebhookDelivery
+
+    Status = WebhookDelivery.Status
+    totals = WebhookDelivery.objects.aggregate(
+        pending=Count("id", filter=Q(status=Status.PENDING)),
+        retrying=Count("id", filter=Q(status=Status.PENDING, attempts__gt=0)),
+        failed=Count("id", filter=Q(status=Status.FAILED)),
+        sent_last_hour=Count("id", filter=Q(status=Status.SENT, sent_at__gte=timezone.now() - timedelta(hours=1))),
+        oldest_pending=Min("created_at", filter=Q(status=Status.PENDING)),
+    )
+    oldest = totals.pop("oldest_pending")
+    totals["oldest_pending_age"] = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return totals